@@ -8,21 +8,28 @@ if project_root not in sys.path:
 import json
 import re
 import tempfile
-from typing import Tuple, List
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from PIL import Image, ImageFilter, ImageEnhance
 import docx
-import base64
 
-# 导入PaddleOCR并初始化全局实例
-from paddleocr import PaddleOCR
-# PaddleOCR-Version=3.2.0, 参数做以下调整
-ocr = PaddleOCR(
-    lang="ch",          # 语言：中文
-    device='cpu',       # 运行设备：CPU（若有GPU可改为 'gpu'）
-    use_angle_cls=True           # 开启文本方向分类（解决倾斜文本识别问题，原需求）
-)
 from agents.state import LoanApplicationState
+from utils.document_store import DocumentReader, parse_data_url
+
+# ======================
+#  OCR实例
+# ======================
+@lru_cache(maxsize=1)
+def get_ocr():
+    """PaddleOCR全局实例（加载模型较慢，第一次解析附件时才导入和初始化）"""
+    from paddleocr import PaddleOCR
+    # PaddleOCR-Version=3.2.0, 参数做以下调整
+    return PaddleOCR(
+        lang="ch",          # 语言：中文
+        device='cpu',       # 运行设备：CPU（若有GPU可改为 'gpu'）
+        use_angle_cls=True           # 开启文本方向分类（解决倾斜文本识别问题，原需求）
+    )
 
 # ======================
 #  临时文件处理
@@ -152,7 +159,7 @@ def parse_identity_card(identity_card_bin: bytes) -> Tuple[str, str]:
         # --------------------------
         try:
             print(":::开始OCR识别:::")
-            result = ocr.predict([processed_temp_path])
+            result = get_ocr().predict([processed_temp_path])
             print(f":::OCR识别完成::: 返回结果类型: {type(result)}, 长度: {len(result) if isinstance(result, list) else 'N/A'}")
             ocr_lines = []
 
@@ -379,7 +386,7 @@ def parse_salary_flow(salary_flow_bin: bytes) -> float:
         # --------------------------
         try:
             print(":::开始OCR识别:::")
-            result = ocr.predict([processed_temp_path])
+            result = get_ocr().predict([processed_temp_path])
             print(f":::OCR识别完成::: 返回结果类型: {type(result)}, 长度: {len(result) if isinstance(result, list) else 'N/A'}")
             ocr_lines = []
 
@@ -624,8 +631,17 @@ def parse_incumbency(incumbency_bin: bytes) -> Tuple[str, datetime, str, float]:
 # ======================
 class DataCollectAgent:
     """数据收集代理类"""
-    @staticmethod
-    def process(state: LoanApplicationState) -> LoanApplicationState:
+    def __init__(self, document_reader: Optional[DocumentReader] = None):
+        # 附件保存在GridFS，State中只有文件引用，解析前才读取二进制
+        # 没有document_reader时只支持附件直接保存为data-URL的旧数据
+        self.document_reader = document_reader
+
+    def _read_document(self, document: Dict) -> bytes:
+        if self.document_reader:
+            return self.document_reader.read(document)
+        return parse_data_url(document["url"])[1]
+
+    def process(self, state: LoanApplicationState) -> LoanApplicationState:
         """从State读附件→解析→返回更新后的State"""
         try:
             # 检查State.raw_data必要字段
@@ -640,33 +656,18 @@ class DataCollectAgent:
             # salary_flow_bin = state["raw_data"]["salary_slip"]["binary_data"]
             # incumbency_bin = state["raw_data"]["employment_proof"]["binary_data"]
             
-            identity_card = state["raw_data"]["documents"]["idCard"]["url"]
-            credit_info = state["raw_data"]["documents"]["creditReport"]["url"]
-            salary_flow = state["raw_data"]["documents"]["salarySlip"]["url"]
-            incumbency = state["raw_data"]["documents"]["employmentProof"]["url"]
-            
-            def extract_base64_to_bytes(url: str) -> bytes:
-                # 找到逗号后面的base64内容
-                if url.startswith("data:image/jpeg;base64,") or \
-                   url.startswith("data:application/pdf;base64,") or \
-                   url.startswith("data:application/vnd.openxmlformats-officedocument.wordprocessingml.document;base64,"):
-                    b64_data = url.split(",", 1)[1]
-                    binary_data = base64.b64decode(b64_data)
-                    return binary_data
-                else:
-                    raise ValueError("URL为空")
-            
-            identity_card_bin = extract_base64_to_bytes(identity_card)
-            credit_info_bin = extract_base64_to_bytes(credit_info)
-            salary_flow_bin = extract_base64_to_bytes(salary_flow)
-            incumbency_bin = extract_base64_to_bytes(incumbency)
+            documents = state["raw_data"]["documents"]
             
+            identity_card_bin = self._read_document(documents["idCard"])
             fullName, idNumber = parse_identity_card(identity_card_bin)
             print(f"姓名：{fullName}, 身份证号：{idNumber}")
+            salary_flow_bin = self._read_document(documents["salarySlip"])
             salary = parse_salary_flow(salary_flow_bin)
             print(f"工资：{salary}")
+            incumbency_bin = self._read_document(documents["employmentProof"])
             companyName, onboardDate, position, monthlyIncome = parse_incumbency(incumbency_bin)
             print(f"公司：{companyName}, 入职日期：{onboardDate}, 职位：{position}, 月薪：{monthlyIncome}")
+            credit_info_bin = self._read_document(documents["creditReport"])
 
             # 更新State
             updated_state: LoanApplicationState = {
@@ -3,13 +3,16 @@
 # ------------------------------
 import os
 import json
-from typing import List, Dict, Optional, Any
+import hashlib
+from typing import List, Dict, Optional, Any, Literal
 from pydantic import BaseModel, Field
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
 from langchain_redis.vectorstores import RedisVectorStore
 from langchain_community.embeddings import DashScopeEmbeddings
+from redis import Redis
+from redis.exceptions import ResponseError
 # from langchain.document_loaders import TextLoader
 # from langchain.text_splitter import CharacterTextSplitter
 # from langchain.embeddings.base import Embeddings
@@ -28,9 +31,10 @@ from config.load_key import load_key
 # ------------------------------
 import math
 import num2words
+from functools import lru_cache
 import re
 from datetime import datetime
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, TemplateSyntaxError
 from xhtml2pdf import pisa
 from typing import List, Dict
 from bs4 import BeautifulSoup  # pip install beautifulsoup4
@@ -40,11 +44,13 @@ from bson import Binary
 # 3. 合同合规检查使用 
 # ------------------------------
 from langchain_core.language_models import BaseChatModel
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # ------------------------------
 # 4. 合同模板修改使用
 # ------------------------------
-import shutil
+from collections import Counter
 from datetime import datetime
 from langchain.schema import AIMessage  # 引入AIMessage类型
 
@@ -52,12 +58,14 @@ from langchain.schema import AIMessage  # 引入AIMessage类型
 # 1. 合同所需数据准备时使用
 # ------------------------------
 import numpy as np
+from dataclasses import dataclass, asdict
 from datetime import timedelta
 
 # ------------------------------
 # 引入项目文件
 # ------------------------------
 from agents.state import LoanApplicationState
+from utils.template_store import ContractTemplateStore
 
 # ------------------------------
 # 全局变量 各机能共用
@@ -112,12 +120,22 @@ contract_template_path = os.path.join(
     "loan_template", 
     contract_template_name
 )
-# 合同模板备份的目录。
-contract_template_backup_dir = os.path.join(
+# 合同模板版本存储的目录。按申请保存修改后的模板版本，不再覆盖共用的基础模板
+# 根目录/init_data/loan_template_store
+contract_template_store_dir = os.path.join(
     os.path.dirname(current_dir),  # 上级目录
     "init_data", 
-    "loan_template_backup"
+    "loan_template_store"
 )
+contract_template_store = ContractTemplateStore(contract_template_path, contract_template_store_dir)
+
+# 各嵌入模型的向量维度（创建向量索引时使用，避免调用嵌入API探测维度）
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-v1": 1536,
+    "text-embedding-v2": 1536,
+    "text-embedding-v3": 1024,
+    "text-embedding-v4": 1024,
+}
 
 # 生成的合同文件PDF的目录。
 # 根目录/init_data/loan_contract
@@ -159,12 +177,17 @@ class ContractCheckResult(BaseModel):
     check_process_english: str = Field(description="English description of the check process")
     english_revision: Optional[str] = Field(None, description="Precise English revision suggestions; None if compliant")
     location: Optional[str] = Field(None, description="Description of the location of the issue in the contract")
+    relevant_sections: Optional[List[str]] = Field(None, description="Heading labels of the contract sections this check relies on, taken before the colon of the heading (e.g., ARTICLE 9a, APPENDIX 2); None if the whole contract is relevant")
 
 class ContractComplianceCheckResponse(BaseModel):
     """Overall result of the contract compliance check"""
     overall_compliant: bool = Field(description="Whether the contract is overall compliant (True/False)")
     results: List[ContractCheckResult] = Field(description="List of results for all check items")
     summary: str = Field(description="English summary of the check results")
+
+class ContractClauseGroupCheckResponse(BaseModel):
+    """Result of the compliance check for one clause group (clause-parallel mode)"""
+    results: List[ContractCheckResult] = Field(description="List of results, exactly one for each check item in LEGAL REQUIREMENTS")
 #-------------
 class ContractBusinessContext(BaseModel):
     """合同检查用。定义外部业务信息的数据模型，为判断合同是否为特殊场景服务。True的话触发特殊场景"""
@@ -209,6 +232,19 @@ class ContractModifyResponse(BaseModel):
     modified_template_content: str = Field(description="Full content of the modified contract template. MUST preserve original HTML structure, CSS, and Jinja2 variables; no content omission.")
     modify_logs: List[ModifyLogItem] = Field(description="List of all modifications. Each item MUST correspond to one requirement in REVISION REQUIREMENTS (one-to-one match).")
 
+# 4.合同模板按条款局部修改时使用
+class TemplateEditOperation(BaseModel):
+    """Single anchored edit on the contract template"""
+    check_id: str = Field(description="ID of the revision requirement this edit addresses, e.g., BASIC-03")
+    operation: Literal["replace", "insert_before", "insert_after"] = Field(description="replace: replace the anchor text with content; insert_before/insert_after: insert content before/after the anchor text")
+    anchor: str = Field(description="Text copied VERBATIM from ORIGINAL TEMPLATE (including HTML tags and whitespace) that locates the edit. It MUST occur exactly once in the template; keep it as short as possible while unique (usually one sentence or one line)")
+    content: str = Field(description="For replace: the full replacement text for the anchor. For insert_before/insert_after: the text to insert. MUST be valid HTML/Jinja2")
+
+class ContractTemplatePatchResponse(BaseModel):
+    """Targeted edits that fix the contract template"""
+    edits: List[TemplateEditOperation] = Field(description="All edits needed to address every requirement in REVISION REQUIREMENTS, applied in order")
+    summary: str = Field(description="English summary of all modifications (1-2 concise sentences)")
+
 class ContractModifierResponse(BaseModel):
     """定义合同模板修改的最终返回结果"""
     contract_check_status: str = Field(description="是否所有修改都完成 (Done/UnDone)")
@@ -220,153 +256,101 @@ class ContractModifierResponse(BaseModel):
 # 方法类定义
 # ------------------------------
 # 1 合同所需数据准备用
-class ContractData:
-    """合同数据类，支持分步构建和数据验证"""
-    
-    def __init__(self):
-        # 初始化所有字段为None或空结构，确保结构完整性
-        self.contract_number: Optional[str] = None
-        self.signing_date: Optional[str] = None
-        self.currency: Optional[str] = None
-        
-        # 嵌套结构初始化为空字典
-        self.lender: Dict[str, Optional[str]] = {
-            "name": None,
-            "reg_number": None,
-            "address": None,
-            "phone": None,
-            "email": None,
-            "authorized_rep": None,
-            "rep_sign_date": None
-        }
-        
-        self.borrower: Dict[str, Optional[str]] = {
-            "full_name": None,
-            "id_number": None,
-            "address": None,
-            "phone": None,
-            "iban": None,
-            "sign_date": None
-        }
-        
-        self.loan_amount: Optional[float] = None
-        self.annual_interest_rate: Optional[float] = None
-        self.apr: Optional[float] = None
-        self.loan_term_months: Optional[int] = None
-        self.disbursement_date: Optional[str] = None
-        
-        self.german_resident_personal_use: Optional[bool] = None
-        
-        self.vehicle: Dict[str, Optional[str]] = {
-            "make": None,
-            "model": None,
-            "chassis_number": None
-        }
-        
-        self.dealer: Dict[str, Optional[str]] = {
-            "name": None,
-            "iban": None
-        }
-    
-    def set_basic_info(self, contract_number: str, signing_date: str, currency: str = "EUR"):
-        """设置基本合同信息"""
-        self.contract_number = contract_number
-        self.signing_date = signing_date
-        self.currency = currency
-        return self  # 支持链式调用
-    
-    def set_lender_info(self, **kwargs):
-        """设置贷款方信息，支持部分字段更新"""
-        for key, value in kwargs.items():
-            if key in self.lender:
-                self.lender[key] = value
-        return self
-    
-    def set_borrower_info(self,** kwargs):
-        """设置借款方信息，支持部分字段更新"""
-        for key, value in kwargs.items():
-            if key in self.borrower:
-                self.borrower[key] = value
-        return self
-    
-    def set_loan_terms(self, loan_amount: float, annual_interest_rate: float, 
-                       loan_term_months: int, disbursement_date: str, apr: Optional[float] = None):
-        """设置贷款核心条款"""
-        self.loan_amount = loan_amount
-        self.annual_interest_rate = annual_interest_rate
-        self.loan_term_months = loan_term_months
-        self.disbursement_date = disbursement_date
-        if apr:
-            self.apr = apr
-        return self
-    
-    def set_vehicle_info(self, **kwargs):
-        """设置车辆信息"""
-        for key, value in kwargs.items():
-            if key in self.vehicle:
-                self.vehicle[key] = value
-        return self
-    
-    def set_dealer_info(self,** kwargs):
-        """设置经销商信息"""
-        for key, value in kwargs.items():
-            if key in self.dealer:
-                self.dealer[key] = value
-        return self
-    
-    def set_residency_status(self, status: bool):
-        """设置德国居民及个人使用状态"""
-        self.german_resident_personal_use = status
-        return self
-    
-    def validate(self) -> bool:
+# 合同数据记录均为不可变对象，每次结构化处理生成新的记录，多个工作流可并发处理
+@dataclass(frozen=True, slots=True)
+class LenderInfo:
+    """贷款方信息"""
+    name: Optional[str] = None
+    reg_number: Optional[str] = None
+    address: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    authorized_rep: Optional[str] = None
+    rep_sign_date: Optional[str] = None
+
+@dataclass(frozen=True, slots=True)
+class BorrowerInfo:
+    """借款方信息"""
+    full_name: Optional[str] = None
+    id_number: Optional[str] = None
+    address: Optional[str] = None
+    phone: Optional[str] = None
+    iban: Optional[str] = None
+    sign_date: Optional[str] = None
+
+@dataclass(frozen=True, slots=True)
+class VehicleInfo:
+    """车辆信息"""
+    make: Optional[str] = None
+    model: Optional[str] = None
+    chassis_number: Optional[str] = None
+
+@dataclass(frozen=True, slots=True)
+class DealerInfo:
+    """经销商信息"""
+    name: Optional[str] = None
+    iban: Optional[str] = None
+
+@dataclass(frozen=True, slots=True)
+class ContractRecord:
+    """合同数据记录（不可变），创建时一次性验证所有必填字段"""
+    contract_number: Optional[str]
+    signing_date: Optional[str]
+    currency: Optional[str]
+    lender: LenderInfo
+    borrower: BorrowerInfo
+    loan_amount: Optional[float]
+    annual_interest_rate: Optional[float]
+    apr: Optional[float]
+    loan_term_months: Optional[int]
+    disbursement_date: Optional[str]
+    german_resident_personal_use: Optional[bool]
+    vehicle: VehicleInfo
+    dealer: DealerInfo
+
+    # 必填字段（嵌套字段用"."连接）
+    REQUIRED_FIELDS = (
+        "contract_number", "signing_date", "currency",
+        "lender.name", "lender.address",
+        "borrower.full_name", "borrower.iban",
+        "loan_amount", "annual_interest_rate",
+        "loan_term_months", "disbursement_date",
+        "vehicle.make", "vehicle.chassis_number"
+    )
+
+    def __post_init__(self):
         """验证是否所有必填字段都已填写"""
-        required_fields = [
-            self.contract_number, self.signing_date, self.currency,
-            self.lender["name"], self.lender["address"],
-            self.borrower["full_name"], self.borrower["iban"],
-            self.loan_amount, self.annual_interest_rate,
-            self.loan_term_months, self.disbursement_date,
-            self.vehicle["make"], self.vehicle["chassis_number"]
-        ]
-        
-        # 检查是否有必填字段为空
-        has_empty = any(field is None for field in required_fields)
-        if has_empty:
-            missing = [name for name, field in zip([
-                "contract_number", "signing_date", "currency",
-                "lender.name", "lender.address",
-                "borrower.full_name", "borrower.iban",
-                "loan_amount", "annual_interest_rate",
-                "loan_term_months", "disbursement_date",
-                "vehicle.make", "vehicle.chassis_number"
-            ], required_fields) if field is None]
-            print(f"验证失败：缺少必填字段 - {', '.join(missing)}")
-            return False
-        return True
-    
+        missing = []
+        for field_path in self.REQUIRED_FIELDS:
+            value = self
+            for name in field_path.split("."):
+                value = getattr(value, name)
+            if value is None:
+                missing.append(field_path)
+        if missing:
+            raise ValueError(f"验证失败：缺少必填字段 - {', '.join(missing)}")
+
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式，用于后续操作或存储"""
-        return {
-            "contract_number": self.contract_number,
-            "signing_date": self.signing_date,
-            "currency": self.currency,
-            "lender": self.lender.copy(),
-            "borrower": self.borrower.copy(),
-            "loan_amount": self.loan_amount,
-            "annual_interest_rate": self.annual_interest_rate,
-            "apr": self.apr,
-            "loan_term_months": self.loan_term_months,
-            "disbursement_date": self.disbursement_date,
-            "german_resident_personal_use": self.german_resident_personal_use,
-            "vehicle": self.vehicle.copy(),
-            "dealer": self.dealer.copy()
-        }
+        return asdict(self)
 
 # 2 生成合同用
 # NumberConverter是生成合同用的。
 class NumberConverter:
+    # 预先计算的英文数字表：0-120覆盖常见的贷款期限（月）和利率整数部分，0-9同时用于利率的小数部分
+    _SMALL_NUMBER_WORDS = {n: num2words.num2words(n, lang='en').lower() for n in range(0, 121)}
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _cardinal_words(number: int) -> str:
+        """整数的英文表述（小写），优先查表，其余结果LRU缓存"""
+        words = NumberConverter._SMALL_NUMBER_WORDS.get(number)
+        if words is None:
+            words = num2words.num2words(number, lang='en').lower()
+        return words
+
     @staticmethod
+    @lru_cache(maxsize=256)
     def convert_currency(amount: float, currency: str = "EUR") -> str:
         """将金额转换为英文文字表述（带货币单位）"""
         currency_map = {
@@ -404,12 +388,12 @@ class NumberConverter:
         decimal_part = int(round((amount_rounded - integer_part) * 100))
         
         # 转换整数部分
-        integer_words = num2words.num2words(integer_part, to='cardinal', lang='en')
+        integer_words = NumberConverter._cardinal_words(integer_part)
         integer_words = integer_words.title().replace(' And ', ' and ')
         
         # 处理小数部分
         if decimal_part > 0:
-            decimal_words = num2words.num2words(decimal_part, to='cardinal', lang='en').title()
+            decimal_words = NumberConverter._cardinal_words(decimal_part).title()
             full_words = f"{integer_words} {currency_plural} and {decimal_words} {currency_decimal_plural} only"
         else:
             full_words = f"{integer_words} {currency_plural} only"
@@ -417,24 +401,25 @@ class NumberConverter:
         return full_words
     
     @staticmethod
+    @lru_cache(maxsize=256)
     def convert_percentage(percentage: float) -> str:
         """将百分比转换为英文文字表述"""
         percentage_str = f"{percentage:.10f}".rstrip('0').rstrip('.') if '.' in f"{percentage}" else f"{percentage}"
         
         if "." in percentage_str:
             integer_part, decimal_part = percentage_str.split(".", 1)
-            integer_words = num2words.num2words(int(integer_part), lang='en').lower()
-            decimal_words = " ".join([num2words.num2words(int(digit), lang='en').lower() for digit in decimal_part])
+            integer_words = NumberConverter._cardinal_words(int(integer_part))
+            decimal_words = " ".join([NumberConverter._SMALL_NUMBER_WORDS[int(digit)] for digit in decimal_part])
             return f"{integer_words} point {decimal_words} percent"
         
-        return num2words.num2words(int(percentage_str), lang='en').lower() + " percent"
+        return NumberConverter._cardinal_words(int(percentage_str)) + " percent"
     
     @staticmethod
     def convert_number(number: int) -> str:
         """将整数转换为英文文字表述"""
         if not isinstance(number, int):
             raise TypeError("Input must be an integer")
-        return num2words.num2words(number, lang='en').lower()
+        return NumberConverter._cardinal_words(number)
     
     # 2 生成合同用End
 
@@ -446,21 +431,18 @@ class NumberConverter:
 # 1. 合同所需数据准备，结构化 核心逻辑
 # ------------------------------
 class LoanStructuringAgent:
-    """合同所需数据准备，结构化Agent"""
+    """合同所需数据准备，结构化Agent（不持有可变状态，可在多个线程中并发执行）"""
 
     def __init__(self, llm: BaseChatModel):
         self.llm = llm
-
-        # 合同数据类
-        self.contract_data = ContractData()
     
     def process(self, state: LoanApplicationState) -> Dict[str, Any]:
         """处理贷款申请，生成合同数据 外部调用入口"""
         try:
-            # 生成合同数据 self.contract_data
-            self._set_contract_data(state)
+            # 每次调用生成新的合同数据记录
+            contract_record = self.build_contract_record(state)
 
-            contract_structed_data = self.contract_data.to_dict()
+            contract_structed_data = contract_record.to_dict()
 
             return {
                 "loan_structuring_data":contract_structed_data,
@@ -477,17 +459,21 @@ class LoanStructuringAgent:
                 "status": str(e)
             }
 
-    
-    def _set_contract_data(self, state: LoanApplicationState):
-        """生成合同数据"""
+    @staticmethod
+    def build_contract_record(state: LoanApplicationState) -> ContractRecord:
+        """根据申请数据生成合同数据记录（纯函数，不修改任何共享对象）"""
         # 取得基本数据
         # 取得今天的日期，DD/MM/YYYY 15/09/2025 string
-        today_ddmmyyyy = self._get_today_ddmmyyyy()
+        today_ddmmyyyy = LoanStructuringAgent._get_today_ddmmyyyy()
+        raw_data = state.get("raw_data", {})
+        personal_info = raw_data.get("personal_info", {})
+        loan_details = raw_data.get("loan_details", {})
+        car_selection = raw_data.get("car_selection", {})
 
         #-------------------------------------
 
-        # 1. 设置基本信息（从表单数据提取）    
-        application_id = state.get("raw_data", {}).get("application_id","APPL_00000000")
+        # 1. 基本信息（从表单数据提取）    
+        application_id = raw_data.get("application_id","APPL_00000000")
         # 确保申请ID是字符串类型
         if not isinstance(application_id, str):
             application_id = str(application_id)
@@ -498,50 +484,37 @@ class LoanStructuringAgent:
         else:
             id_suffix = application_id
 
-        self.contract_data.set_basic_info(
-            contract_number = f"APX-FIN-2025-{id_suffix}",
-            signing_date = today_ddmmyyyy,
-            currency = "EUR"
-        )
-        
-        # 2. 设置借款方信息（从表单数据提取）
-        self.contract_data.set_borrower_info(
-            full_name = state.get("raw_data", {}).get("personal_info", {}).get("fullName", "Max Schmidt"),
+        # 2. 借款方信息（从表单数据提取）
+        borrower = BorrowerInfo(
+            full_name = personal_info.get("fullName", "Max Schmidt"),
             id_number = state.get("idNumber", "DE1234567890"),
-            address = state.get("raw_data", {}).get("personal_info", {}).get("address","Musterstraße 15, 76137 Karlsruhe, Germany"),
-            phone = state.get("raw_data", {}).get("personal_info", {}).get("phoneNumber", "+49 176 5432 1098"),
-            iban = state.get("raw_data", {}).get("personal_info", {}).get("accountNumber", "DE89 3704 0044 0532 0130 00"),
+            address = personal_info.get("address","Musterstraße 15, 76137 Karlsruhe, Germany"),
+            phone = personal_info.get("phoneNumber", "+49 176 5432 1098"),
+            iban = personal_info.get("accountNumber", "DE89 3704 0044 0532 0130 00"),
         )
         
-        # 3. 设置贷款条款（从系统数据提取）
-        loan_amount_cyn = state.get("raw_data", {}).get("loan_details", {}).get("loanAmount", 35000.00)
-        loan_amount = self._cny_to_eur(loan_amount_cyn)
-        annual_interest_rate = state.get("raw_data", {}).get("loan_details", {}).get("interestRate", 4.25)
-        loan_term_months = state.get("raw_data", {}).get("loan_details", {}).get("loanTerm", 60)
+        # 3. 贷款条款（从系统数据提取）
+        loan_amount_cyn = loan_details.get("loanAmount", 35000.00)
+        loan_amount = LoanStructuringAgent._cny_to_eur(loan_amount_cyn)
+        annual_interest_rate = loan_details.get("interestRate", 4.25)
+        loan_term_months = loan_details.get("loanTerm", 60)
         # 有效年利率（Annual Percentage Rate)
-        apr = self._calculate_apr_from_interest(
+        apr = LoanStructuringAgent._calculate_apr_from_interest(
             loan_amount = loan_amount,
             annual_interest_rate = annual_interest_rate,
             loan_term_months = loan_term_months,
             fees = 0
         )
-        self.contract_data.set_loan_terms(
-            loan_amount = loan_amount,
-            annual_interest_rate = annual_interest_rate,
-            loan_term_months = loan_term_months,
-            disbursement_date = today_ddmmyyyy,
-            apr = apr
-        )
         
-        # 4. 设置车辆信息（从系统数据提取）
-        self.contract_data.set_vehicle_info(
-            make = state.get("raw_data", {}).get("car_selection", {}).get("carBrand", "Apex"),
-            model = state.get("raw_data", {}).get("car_selection", {}).get("carModel", "Nova X"),
+        # 4. 车辆信息（从系统数据提取）
+        vehicle = VehicleInfo(
+            make = car_selection.get("carBrand", "Apex"),
+            model = car_selection.get("carModel", "Nova X"),
             chassis_number = "WBA123456789012345",
         )
         
-        # 5. 设置贷款方信息（从邮件提取）
-        self.contract_data.set_lender_info(
+        # 5. 贷款方信息（从邮件提取）
+        lender = LenderInfo(
             name = "Apex Auto Finance GmbH",
             reg_number = "HRB 123456 Karlsruhe",
             address = "Industriestraße 38, 76135 Karlsruhe, Germany",
@@ -551,14 +524,31 @@ class LoanStructuringAgent:
             rep_sign_date = today_ddmmyyyy
         )
         
-        # 6. 设置其他信息
-        self.contract_data.set_residency_status(False)
-        self.contract_data.set_dealer_info(
+        # 6. 其他信息
+        dealer = DealerInfo(
             name="AutoVision GmbH",
             iban="DE78 3705 0055 0643 0240 00"
         )
+
+        # 一次性生成并验证合同数据记录
+        return ContractRecord(
+            contract_number = f"APX-FIN-2025-{id_suffix}",
+            signing_date = today_ddmmyyyy,
+            currency = "EUR",
+            lender = lender,
+            borrower = borrower,
+            loan_amount = loan_amount,
+            annual_interest_rate = annual_interest_rate,
+            apr = apr or None,
+            loan_term_months = loan_term_months,
+            disbursement_date = today_ddmmyyyy,
+            german_resident_personal_use = False,
+            vehicle = vehicle,
+            dealer = dealer
+        )
         
-    def _calculate_apr_from_interest(self, loan_amount, annual_interest_rate, loan_term_months,
+    @staticmethod
+    def _calculate_apr_from_interest(loan_amount, annual_interest_rate, loan_term_months,
         fees=0, start_date=None):
         """
         根据贷款本金、年化利率和手续费计算APR
@@ -648,7 +638,8 @@ class LoanStructuringAgent:
         apr = find_apr()
         return round(apr, 2)
 
-    def _cny_to_eur(self, cny_amount, exchange_rate=8.00):
+    @staticmethod
+    def _cny_to_eur(cny_amount, exchange_rate=8.00):
         """
         将人民币转换为欧元
         
@@ -667,7 +658,8 @@ class LoanStructuringAgent:
         eur_amount = cny_amount / exchange_rate
         return round(eur_amount, 2)
 
-    def _unify_interest_rate(self, interest_rate):
+    @staticmethod
+    def _unify_interest_rate(interest_rate):
         """
         统一利率格式，将可能的小数形式（如0.0425）转换为百分比数值形式（如4.25）
         
@@ -696,7 +688,8 @@ class LoanStructuringAgent:
         
         return unified
 
-    def _get_today_ddmmyyyy(self):
+    @staticmethod
+    def _get_today_ddmmyyyy():
         """
         获取今天的日期，并格式化为DD/MM/YYYY的字符串格式
         
@@ -741,11 +734,15 @@ class LoanContractGenerater:
                 contract_filename_txt
             )
 
-            contract_text = self.generate_loan_contract(state.get("loan_structuring_data"), contract_pdf_path, contract_txt_path)
+            # 使用该申请自己的模板版本（未修改过时为基础模板）
+            application_id = state.get("raw_data", {}).get("application_id", "APPL_00000000")
+            template_version = contract_template_store.get_version(str(application_id))
+            contract_text = self.generate_loan_contract(state.get("loan_structuring_data"), contract_pdf_path, contract_txt_path, template_version)
             contract_pdf_metadata = self.get_file_metadata(contract_pdf_path)
             contract_pdf_binary_data = self.read_file_as_binary(contract_pdf_path)
             return {
                 "contract_draft": contract_text,
+                "contract_template_version": template_version,
                 "contract_file_path": contract_pdf_path,
                 "contract_file_metadata": {
                     "binary_data": contract_pdf_binary_data,
@@ -849,23 +846,20 @@ class LoanContractGenerater:
 
 
     # 生成合同的二级入口
-    def generate_loan_contract(self, contract_data: Dict, output_pdf_path: str, contract_txt_path:str) -> str:
-        """生成汽车贷款合同（PDF和纯文本）"""
+    def generate_loan_contract(self, contract_data: Dict, output_pdf_path: str, contract_txt_path:str,
+                               template_version: Optional[str] = None) -> str:
+        """生成汽车贷款合同（PDF和纯文本）。template_version为None时使用基础模板"""
         # 验证模板文件
-        # template_dir = os.path.dirname(os.path.abspath(__file__))
-        # template_filename = "loan_contract_template.jinja2"
-        # template_path = os.path.join(template_dir, template_filename)
-        # 合同模板文件的目录（不带文件名）
-        template_dir = contract_template_dir
-        template_path = contract_template_path
-        template_filename = contract_template_name
-        
-        if not os.path.exists(template_path):
-            raise FileNotFoundError(f"合同模板未找到: {template_path}")
+        if not os.path.exists(contract_template_path):
+            raise FileNotFoundError(f"合同模板未找到: {contract_template_path}")
         
-        # 加载Jinja2模板
-        env = Environment(loader=FileSystemLoader(template_dir), autoescape=True)
-        template = env.get_template(template_filename)
+        # 复制一份再补充派生字段，不修改调用方（工作流状态）中的合同数据
+        contract_data = dict(contract_data)
+
+        # 加载Jinja2模板（按版本缓存编译结果）
+        if template_version is None:
+            template_version = contract_template_store.base_version()
+        template = contract_template_store.get_compiled(template_version)
         
         # 处理数字转换
         converter = NumberConverter
@@ -1078,11 +1072,37 @@ class LoanContractGenerater:
 # 3. 合同合规检查 核心逻辑（使用官方RedisVectorStore）
 # ------------------------------
 class LoanComplianceChecker:
-    def __init__(self, llm: BaseChatModel):
-        # 初始化DashScope嵌入模型
+    # 定义场景与核心查询词的映射（明确每个场景的合规需求）
+    SCENARIO_QUERIES = {
+        "used_vehicle": "Legal clauses for used vehicle loan scenarios, including vehicle valuation and accident history disclosure requirements",
+        "foreign_borrower": "Regulations related to identity verification and cross-border credit checks for foreign borrower loans",
+        "early_repayment": "Legal provisions on penalty restrictions and application procedures for early loan repayment",
+        "cross_border": "Legal requirements for registration and insurance in cross-border vehicle loans"
+    }
+
+    # 合同纯文本中的章节标题，如 "1. PARTY A (LENDER)"、"ARTICLE 9a: RIGHT OF WITHDRAWAL"、"APPENDIX 1: ..."
+    SECTION_HEADING_PATTERN = re.compile(r"^(\d+\.\s*PARTY\s+\w+|ARTICLE\s+\w+|APPENDIX\s+\w+)\b", re.IGNORECASE | re.MULTILINE)
+
+    def __init__(self, llm: BaseChatModel, parallel_check: bool = True, clause_group_size: int = 2,
+                 max_workers: int = 4, clause_max_retries: int = 2):
+        """
+        参数:
+        parallel_check: True时按条款分组并发检查（每组一次小的结构化输出调用），False时沿用整份提示词一次检查
+        clause_group_size: 并发模式下每组包含的条款数
+        max_workers: 并发模式下同时进行的LLM调用数上限
+        clause_max_retries: 并发模式下每组失败后的重试次数
+        """
+        # 检查模式配置
+        self.parallel_check = parallel_check
+        self.clause_group_size = max(1, clause_group_size)
+        self.max_workers = max(1, max_workers)
+        self.clause_max_retries = max(0, clause_max_retries)
+
+        # 初始化DashScope嵌入模型（只创建客户端，不调用嵌入API）
         DASHSCOPE_API_KEY = load_key("DASHSCOPE_API_KEY")
+        self.embedding_model = "text-embedding-v1"
         self.embeddings = DashScopeEmbeddings(
-            model="text-embedding-v1",
+            model=self.embedding_model,
             dashscope_api_key=DASHSCOPE_API_KEY
         )
         
@@ -1092,9 +1112,20 @@ class LoanComplianceChecker:
         
         # 加载基础条款
         self.basic_clauses = self._load_basic_clauses()
-        
-        # 初始化官方RedisVectorStore并加载特殊场景条款
-        self.vector_store = self._initialize_vector_store()
+
+        # 官方RedisVectorStore在首次检索时才连接（见vector_store属性），构造时不访问Redis
+        self._vector_store: Optional[RedisVectorStore] = None
+        self._vector_store_lock = threading.Lock()
+
+        # 特殊场景检索缓存：索引版本为特殊场景条款文件内容（及嵌入模型）的哈希
+        # 每次检索前检查文件的 (mtime, size)，文件变化后缓存失效，向量索引在下次检索时重新导入（不需要重启）
+        self._scenario_cache_lock = threading.Lock()
+        self._scenario_query_vectors: Dict[str, List[float]] = {}  # {场景: 查询向量}
+        self._scenario_query_vectors_version: Optional[str] = None
+        self._scenario_clause_cache: Dict[tuple, List[Dict]] = {}  # {(场景, 索引版本): 条款列表}
+        self._advanced_scenarios_stat: Optional[tuple] = None  # 特殊场景条款文件的 (mtime, size)
+        self.index_version: Optional[str] = None
+        self._refresh_index_version()
         
         # 初始化大模型
         self.llm = llm
@@ -1102,6 +1133,12 @@ class LoanComplianceChecker:
         # 初始化解析器
         self.parser = PydanticOutputParser(pydantic_object=ContractComplianceCheckResponse)
 
+        # 条款分组检查用的结构化输出模型
+        self.group_check_llm = self.llm.with_structured_output(
+            ContractClauseGroupCheckResponse,
+            method="function_calling"
+        )
+
     def process(self, state: LoanApplicationState) -> Dict[str, Any]:
         """执行合同合规检查 外部调用入口"""
         try:
@@ -1111,9 +1148,12 @@ class LoanComplianceChecker:
                 is_vehicle_old=False, 
                 is_vehicle_registration_cross_border=False
             )
+            contract_content = state.get("contract_draft","")
             result = self.check_compliance(
-                state.get("contract_draft",""), 
-                business_context
+                contract_content, 
+                business_context,
+                # 合同修改后再次检查时，复用上一轮的条款级结果
+                previous_clause_results=state.get("contract_review_clause_results")
                 )
         
             # 新增：转换为FinalResult
@@ -1128,6 +1168,7 @@ class LoanComplianceChecker:
                 "contract_review_status": final_result_dict.get("overall_result"), # Approved/Rejected
                 "contract_review_result": "Contract review completed.",
                 "contract_review_result_details": final_result_dict,
+                "contract_review_clause_results": self._build_clause_result_cache(result, contract_content),
                 "status": final_result_dict.get("overall_result") # Approved/Rejected
             }
         except Exception as e:
@@ -1138,85 +1179,198 @@ class LoanComplianceChecker:
                 "contract_review_result_details": {},
                 "status": str(e)
             }
-    def check_compliance(self, contract_content: str, business_context: ContractBusinessContext) -> ContractComplianceCheckResponse:
-        """执行合同合规检查（基础条款 + 官方RAG增强）"""
-        # 1. 创建基础条款检查提示词
-        all_clauses_text = ""
-        basic_clauses_text = "\n".join([
-            f"- Check ID: {clause['id']}"
-            f" | Check Title: {clause['title']}"
-            f" | Check Requirement: {clause['content']}"
-            f" | Check Points: {', '.join(clause['check_points'])}"
+    def check_compliance(self, contract_content: str, business_context: ContractBusinessContext,
+                         previous_clause_results: Optional[Dict[str, Dict]] = None) -> ContractComplianceCheckResponse:
+        """
+        执行合同合规检查（基础条款 + 官方RAG增强）
+
+        previous_clause_results: 上一轮检查的条款级结果（_build_clause_result_cache的返回值）。
+        相关章节未变化且已通过的条款直接复用结果，只重新检查章节有变化或未通过的条款。
+        """
+        # 1. 基础条款
+        basic_clauses = [
+            {
+                "id": clause["id"],
+                "title": clause["title"],
+                "content": clause["content"],
+                "check_points": clause["check_points"]
+            }
             for clause in self.basic_clauses
-        ])
-        # 2. 识别特殊场景，并将特殊场景的检查规范加到提示词里
+        ]
+        # 2. 识别特殊场景，并检索特殊场景的检查规范
         scenarios = self._identify_scenarios(contract_content,business_context)
+        # 特殊场景RAG增强检查（查询向量预先计算，检索结果按场景和索引版本缓存）
+        formatted_clauses = self._retrieve_scenario_clauses(scenarios) if scenarios else []
+
+        # 3. 复用上一轮结果：相关章节未变化且已通过的条款无需重新检查
+        all_clauses = basic_clauses + formatted_clauses
+        contract_sections = self._split_contract_sections(contract_content)
+        reused_results = {}
+        clauses_to_check = []
+        for clause in all_clauses:
+            cached = (previous_clause_results or {}).get(clause["id"])
+            if cached and cached["result"].get("compliant") and cached["section_hash"] == self._hash_relevant_sections(
+                contract_sections, contract_content, cached["result"].get("relevant_sections")
+            ):
+                reused_results[clause["id"]] = ContractCheckResult(**cached["result"])
+            else:
+                clauses_to_check.append(clause)
+        if reused_results:
+            print(f"复用上一轮检查结果 {len(reused_results)} 项，重新检查 {len(clauses_to_check)} 项")
+
+        # 4. 执行条款检查
+        if not clauses_to_check:
+            checked_results = []
+        elif self.parallel_check:
+            # 按条款分组并发检查，耗时取决于最慢的一组
+            checked_results = self._check_clauses_parallel(clauses_to_check, contract_content)
+        else:
+            # 所有条款放在一个提示词里一次检查
+            checked_results = self._check_clauses_single(clauses_to_check, contract_content)
+
+        # 按条款原顺序合并复用结果和本轮检查结果
+        checked_by_id = {item.check_id: item for item in checked_results}
+        all_results = []
+        for clause in all_clauses:
+            if clause["id"] in reused_results:
+                all_results.append(reused_results[clause["id"]])
+            elif clause["id"] in checked_by_id:
+                all_results.append(checked_by_id.pop(clause["id"]))
+        # 单次检查模式下ID与条款不一致的结果也保留
+        all_results.extend(checked_by_id.values())
+       
+        # 5. 生成最终结果
+        overall_compliant = all(c.compliant for c in all_results)
+        return ContractComplianceCheckResponse(
+            overall_compliant=overall_compliant,
+            results=all_results,
+            summary=f"Checked {len(all_results)} items. {len([c for c in all_results if not c.compliant])} non-compliant issues found."
+        )
+
+    def _retrieve_scenario_clauses(self, scenarios: List[str]) -> List[Dict]:
+        """检索特殊场景条款：命中缓存直接返回，未命中的场景用预先计算的查询向量并发检索"""
+        index_version = self._refresh_index_version()
+        cached_clauses = {}
+        missing_scenarios = []
+        with self._scenario_cache_lock:
+            for scenario in scenarios:
+                key = (scenario, index_version)
+                if key in self._scenario_clause_cache:
+                    cached_clauses[scenario] = self._scenario_clause_cache[key]
+                else:
+                    missing_scenarios.append(scenario)
+
+        if missing_scenarios:
+            query_vectors = self._get_scenario_query_vectors(missing_scenarios)
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing_scenarios))) as executor:
+                futures = {
+                    scenario: executor.submit(self._search_scenario_clauses, scenario, query_vectors[scenario])
+                    for scenario in missing_scenarios
+                }
+            with self._scenario_cache_lock:
+                for scenario, future in futures.items():
+                    cached_clauses[scenario] = future.result()
+                    self._scenario_clause_cache[(scenario, index_version)] = cached_clauses[scenario]
+
+        # 按场景顺序合并结果
         formatted_clauses = []
-        if not scenarios:
-            # 无特殊场景
-            all_clauses_text = basic_clauses_text
+        for scenario in scenarios:
+            formatted_clauses.extend(cached_clauses[scenario])
+        return formatted_clauses
+
+    def _get_scenario_query_vectors(self, scenarios: List[str]) -> Dict[str, List[float]]:
+        """取得场景查询向量。每个索引版本只计算一次，之后检索不再调用嵌入模型"""
+        with self._scenario_cache_lock:
+            if self._scenario_query_vectors_version != self.index_version:
+                # 索引版本变化（或首次使用）时，预先计算所有已知场景的查询向量
+                self._scenario_query_vectors = {
+                    scenario: self.embeddings.embed_query(query)
+                    for scenario, query in self.SCENARIO_QUERIES.items()
+                }
+                self._scenario_query_vectors_version = self.index_version
+            for scenario in scenarios:
+                if scenario not in self._scenario_query_vectors:
+                    # 未定义查询词的场景默认用场景名称
+                    self._scenario_query_vectors[scenario] = self.embeddings.embed_query(scenario)
+            return {scenario: self._scenario_query_vectors[scenario] for scenario in scenarios}
+
+    def _search_scenario_clauses(self, scenario: str, query_vector: List[float]) -> List[Dict]:
+        """用查询向量检索单个场景下的相关法规条款"""
+        # 使用官方方法检索相关条款（支持元数据过滤）
+        filter = f'@scenario:{{{scenario}}}'
+        relevant_clauses = self.vector_store.similarity_search_by_vector(
+            embedding=query_vector,  # 用场景核心需求的向量作为查询
+            k=3,
+            filter=filter # 元数据过滤
+        )
+        # 格式化当前场景的检索结果
+        return [
+            {
+                "id": doc.metadata["id"],
+                "scenario": doc.metadata["scenario"],
+                "title": doc.metadata["title"],
+                "content": doc.page_content,
+                "score": 1.0  # 官方库未直接返回分数，可通过其他方式获取
+            }
+            for doc in relevant_clauses
+        ]
+
+    def _split_contract_sections(self, contract_content: str) -> Dict[str, str]:
+        """按章节标题（PARTY/ARTICLE/APPENDIX）切分合同文本，返回 {标准化标题: 章节文本}"""
+        sections = {}
+        matches = list(self.SECTION_HEADING_PATTERN.finditer(contract_content))
+        if not matches:
+            return sections
+        sections["PREAMBLE"] = contract_content[:matches[0].start()]
+        for idx, match in enumerate(matches):
+            end = matches[idx + 1].start() if idx + 1 < len(matches) else len(contract_content)
+            sections[self._normalize_section_label(match.group(1))] = contract_content[match.start():end]
+        return sections
+
+    def _normalize_section_label(self, label: str) -> str:
+        """标准化章节标题，如 "Article 9a.2: ..." -> "ARTICLE 9A" """
+        match = self.SECTION_HEADING_PATTERN.match(label.strip())
+        if match:
+            label = match.group(1)
+        return re.sub(r"\s+", " ", label.strip()).upper()
+
+    def _hash_relevant_sections(self, contract_sections: Dict[str, str], contract_content: str,
+                                relevant_sections: Optional[List[str]]) -> str:
+        """计算条款相关章节的哈希；相关章节未知或找不到时按整份合同计算"""
+        keys = sorted({self._normalize_section_label(label) for label in relevant_sections or []})
+        if keys and all(key in contract_sections for key in keys):
+            text = "\n".join(contract_sections[key] for key in keys)
         else:
-            # 有特殊场景
-            # 特殊场景RAG增强检查（使用官方向量存储的检索功能）
-            # 定义场景与核心查询词的映射（明确每个场景的合规需求）
-            scenario_queries = {
-                "used_vehicle": "Legal clauses for used vehicle loan scenarios, including vehicle valuation and accident history disclosure requirements",
-                "foreign_borrower": "Regulations related to identity verification and cross-border credit checks for foreign borrower loans",
-                "early_repayment": "Legal provisions on penalty restrictions and application procedures for early loan repayment",
-                "cross_border": "Legal requirements for registration and insurance in cross-border vehicle loans"
+            text = contract_content
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _build_clause_result_cache(self, check_response: ContractComplianceCheckResponse, contract_content: str) -> Dict[str, Dict]:
+        """生成条款级结果缓存 {check_id: {"section_hash", "result"}}，供合同修改后的再次检查复用"""
+        contract_sections = self._split_contract_sections(contract_content)
+        return {
+            item.check_id: {
+                "section_hash": self._hash_relevant_sections(contract_sections, contract_content, item.relevant_sections),
+                "result": item.model_dump()
             }
+            for item in check_response.results
+        }
 
-            # 特殊场景RAG增强检查
-            for scenario in scenarios:
-                
-                # 1. 获取该场景的精准查询词（而非用合同全文）
-                query = scenario_queries.get(scenario, scenario)  # 默认用场景名称
-                
-                # 2. 检索该场景下的相关法规法规
-                # 使用官方方法检索相关条款（支持元数据过滤）
-                filter = f'@scenario:{{{scenario}}}'
-                relevant_clauses = self.vector_store.similarity_search(
-                    query=query,  # 用场景核心需求作为查询
-                    k=3,
-                    filter=filter # 元数据过滤
-                )
+    def _format_clauses_text(self, clauses: List[Dict]) -> str:
+        """将条款列表格式化为提示词中的LEGAL REQUIREMENTS文本"""
+        return "\n".join([
+            f"- Check ID: {clause['id']}"
+            f" | Check Title: {clause['title']}"
+            f" | Check Requirement: {clause['content']}"
+            # 特殊场景条款无check_points，无需额外拼接，保持格式简洁
+            + (f" | Check Points: {', '.join(clause['check_points'])}" if clause.get("check_points") else "")
+            for clause in clauses
+        ])
 
-                # # 如果元数据过滤不好用，那就注释掉上面的filter=filter，用下面的手动筛选选出 metadata.scenario 等于目标 scenario 的结果
-                # # 把relevant_clauses和all_clauses 变量名调整一下
-                # relevant_clauses = [
-                #     clause for clause in all_clauses 
-                #     if clause.metadata.get('scenario') == scenario
-                # ]
-
-                # 3. 格式化当前场景的检索结果，并追加到总列表中
-                current_scenario_clauses = [
-                    {
-                        "id": doc.metadata["id"],
-                        "scenario": doc.metadata["scenario"],
-                        "title": doc.metadata["title"],
-                        "content": doc.page_content,
-                        "score": 1.0  # 官方库未直接返回分数，可通过其他方式获取
-                    }
-                    for doc in relevant_clauses
-                ]
-                # 关键修改：用extend追加当前场景的结果，而非覆盖
-                formatted_clauses.extend(current_scenario_clauses)
-
-            """创建特殊场景检查提示词"""
-            specific_clauses_text = "\n".join([
-                f"- Check ID: {clause['id']}"
-                f" | Check Title: {clause['title']}"
-                f" | Check Requirement: {clause['content']}"
-                # 特殊场景条款无check_points，无需额外拼接，保持格式简洁
-                for clause in formatted_clauses
-            ])
-            # 用join拼接：列表中的元素会被"\n"连接，自动在两者之间添加换行符
-            all_clauses_text = "\n".join([basic_clauses_text, specific_clauses_text])
-
-        # 3. 执行条款检查
+    def _check_clauses_single(self, clauses: List[Dict], contract_content: str) -> List[ContractCheckResult]:
+        """所有条款放在一个提示词里，一次调用大模型检查"""
         # 生成提示词
         check_prompt = self._create_check_prompt(
-            clauses_text = all_clauses_text,
+            clauses_text = self._format_clauses_text(clauses),
             contract_content=contract_content
         )
         print("提示词：")
@@ -1226,26 +1380,118 @@ class LoanComplianceChecker:
         check_results = self.parser.parse(check_response.content)
         print("合同检查结果 check_results:")
         print(check_results)
-        all_results = check_results.results
-       
-        # 4. 生成最终结果
-        overall_compliant = all(c.compliant for c in all_results)
-        return ContractComplianceCheckResponse(
-            overall_compliant=overall_compliant,
-            results=all_results,
-            summary=f"Checked {len(all_results)} items. {len([c for c in all_results if not c.compliant])} non-compliant issues found."
+        return check_results.results
+
+    def _check_clauses_parallel(self, clauses: List[Dict], contract_content: str) -> List[ContractCheckResult]:
+        """条款分组后并发检查，每组单独重试，结果按条款原顺序合并"""
+        groups = [
+            clauses[i:i + self.clause_group_size]
+            for i in range(0, len(clauses), self.clause_group_size)
+        ]
+        if not groups:
+            return []
+        print(f"条款并发检查：共 {len(clauses)} 项条款，分为 {len(groups)} 组")
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(groups))) as executor:
+            futures = [
+                executor.submit(self._check_clause_group, group, contract_content)
+                for group in groups
+            ]
+
+        all_results = []
+        failed_ids = []
+        for group, future in zip(groups, futures):
+            try:
+                all_results.extend(future.result())
+            except Exception as e:
+                print(f"条款组检查失败 {[clause['id'] for clause in group]}: {str(e)}")
+                failed_ids.extend(clause["id"] for clause in group)
+
+        # 重试后仍失败的条款无法判定合规与否，整体检查失败
+        if failed_ids:
+            raise RuntimeError(f"Compliance check failed for clauses: {', '.join(failed_ids)}")
+        return all_results
+
+    def _check_clause_group(self, group: List[Dict], contract_content: str) -> List[ContractCheckResult]:
+        """检查单个条款组（结构化输出，失败时重试）"""
+        group_ids = [clause["id"] for clause in group]
+        check_prompt = self._create_group_check_prompt(
+            clauses_text=self._format_clauses_text(group),
+            contract_content=contract_content
         )
 
+        last_error = None
+        for attempt in range(self.clause_max_retries + 1):
+            try:
+                response = self.group_check_llm.invoke(check_prompt)
+                results_by_id = {item.check_id: item for item in response.results}
+                missing_ids = [check_id for check_id in group_ids if check_id not in results_by_id]
+                if missing_ids:
+                    raise ValueError(f"missing results for {', '.join(missing_ids)}")
+                # 按条款原顺序返回，丢弃不属于本组的结果
+                return [results_by_id[check_id] for check_id in group_ids]
+            except Exception as e:
+                last_error = e
+                print(f"条款组 {group_ids} 第{attempt + 1}次检查失败: {str(e)}")
+        raise last_error
+
     def _load_basic_clauses(self) -> List[Dict]:
         """加载基础条款（直接读取文档）"""
         with open(basic_clauses_file_path, "r", encoding="utf-8") as f:
             return json.load(f)
 
-    def _initialize_vector_store(self) -> RedisVectorStore:
-        """初始化官方RedisVectorStore，加载特殊场景条款"""
-        # 检查向量存储是否已存在（避免重复创建）
-        try:
-            # 尝试连接现有索引
+    def _refresh_index_version(self) -> str:
+        """
+        特殊场景条款文件的 (mtime, size) 变化时重新计算索引版本并返回
+        版本变化时清空检索缓存，并丢弃已连接的向量存储（下次使用时由setup_vector_index按新指纹重新导入）
+        """
+        stat = os.stat(advanced_clauses_file_path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        with self._scenario_cache_lock:
+            if stat_key == self._advanced_scenarios_stat:
+                return self.index_version
+            version = self._get_advanced_scenarios_fingerprint()
+            if self.index_version is not None and version != self.index_version:
+                print(f"特殊场景条款文件已变化，重新建立检索缓存: {advanced_clauses_file_path}")
+                self._scenario_clause_cache.clear()
+                with self._vector_store_lock:
+                    self._vector_store = None
+            self.index_version = version
+            self._advanced_scenarios_stat = stat_key
+            return version
+
+    def _get_advanced_scenarios_fingerprint(self) -> str:
+        """计算特殊场景条款文件内容和嵌入模型的哈希，作为向量索引的版本"""
+        with open(advanced_clauses_file_path, "rb") as f:
+            content = f.read()
+        return hashlib.sha256(self.embedding_model.encode("utf-8") + b"\n" + content).hexdigest()
+
+    @property
+    def vector_store(self) -> RedisVectorStore:
+        """首次使用时才初始化向量存储（懒加载），服务启动时不访问Redis和嵌入API"""
+        if self._vector_store is None:
+            with self._vector_store_lock:
+                if self._vector_store is None:
+                    self._vector_store = self.setup_vector_index()
+        return self._vector_store
+
+    def setup_vector_index(self, force: bool = False) -> RedisVectorStore:
+        """
+        初始化特殊场景条款的向量索引（幂等）
+
+        索引已存在且Redis中保存的指纹与当前条款文件一致时，直接连接现有索引，不调用嵌入API；
+        否则删除旧索引并重新导入。Redis连接错误等异常直接抛出，不会触发重新导入。
+
+        参数:
+        force: True时无论指纹是否一致都重新导入
+        """
+        redis_client = Redis.from_url(self.redis_url)
+        fingerprint_key = f"index_fingerprint:{self.index_name}"
+        stored_fingerprint = redis_client.get(fingerprint_key)
+        index_exists = self._index_exists(redis_client)
+
+        if not force and index_exists and stored_fingerprint is not None \
+                and stored_fingerprint.decode("utf-8") == self.index_version:
             vector_store = RedisVectorStore.from_existing_index(
                 embedding=self.embeddings,
                 redis_url=self.redis_url,
@@ -1253,10 +1499,26 @@ class LoanComplianceChecker:
             )
             print(f"已加载现有向量存储，索引名称: {self.index_name}")
             return vector_store
-        except:
-            # 不存在则创建新索引并加载文档
-            print(f"创建新向量存储，索引名称: {self.index_name}")
-            return self._load_advanced_scenarios_to_vector_store()
+
+        # 指纹不一致（条款文件或嵌入模型有变化）或索引不存在，重新导入
+        if index_exists:
+            print(f"特殊场景条款已变化，删除旧索引: {self.index_name}")
+            redis_client.ft(self.index_name).dropindex(delete_documents=True)
+        print(f"创建新向量存储，索引名称: {self.index_name}")
+        vector_store = self._load_advanced_scenarios_to_vector_store()
+        redis_client.set(fingerprint_key, self.index_version)
+        return vector_store
+
+    def _index_exists(self, redis_client: Redis) -> bool:
+        """判断向量索引是否存在。只把"索引不存在"视为False，其他错误直接抛出"""
+        try:
+            redis_client.ft(self.index_name).info()
+            return True
+        except ResponseError as e:
+            message = str(e).lower()
+            if "unknown index" in message or "no such index" in message:
+                return False
+            raise
 
     def _load_advanced_scenarios_to_vector_store(self) -> RedisVectorStore:
         """将特殊场景条款加载到官方RedisVectorStore"""
@@ -1285,8 +1547,10 @@ class LoanComplianceChecker:
             {"name": "description", "type": "text"},
         ]
 
-        # 2. 计算嵌入维度（与模型一致）
-        vector_size = len(self.embeddings.embed_query("test"))  # 用测试查询获取维度
+        # 2. 嵌入维度（按模型取已知值，不再用测试查询探测）
+        vector_size = EMBEDDING_DIMENSIONS.get(self.embedding_model)
+        if vector_size is None:
+            raise ValueError(f"未知嵌入模型的向量维度: {self.embedding_model}，请在EMBEDDING_DIMENSIONS中配置")
         print(f"嵌入维度：{vector_size}，准备创建索引...")
         
         # 使用官方方法创建向量存储
@@ -1374,6 +1638,7 @@ For each requirement in "LEGAL REQUIREMENTS", do the followings:
 - 4. Provide English check process explanation for "check_process_english".
 - 5. If non-compliant, give precise English revision suggestions for "english_revision" (None if compliant).
 - 6. Note the location of issues if applicable for the "location" field.
+- 7. List the heading labels of the contract sections the check relies on for "relevant_sections" (e.g., ["ARTICLE 9a"]).
 
 {format_instructions}
         """)
@@ -1383,7 +1648,38 @@ For each requirement in "LEGAL REQUIREMENTS", do the followings:
             clauses_text=clauses_text,
             format_instructions=self.parser.get_format_instructions()
         )
-    
+
+    def _create_group_check_prompt(self, clauses_text:str, contract_content: str) -> ChatPromptTemplate:
+        """创建单个条款组的检查提示词（结构化输出，无需格式说明）"""
+        prompt = ChatPromptTemplate.from_template("""
+You are a legal expert specializing in German loan contracts. Please check the following contract against ONLY the legal requirements listed in the "LEGAL REQUIREMENTS" section below.
+
+CONTRACT CONTENT:
+{contract_content}
+
+LEGAL REQUIREMENTS:
+Each requirement follows this format: "- Check ID: [ID] | Check Title: [Title] | Check Requirement: [Rule]"
+{clauses_text}
+
+CRITICAL NOTE ON SPECIAL SCENARIO REQUIREMENTS:
+If "LEGAL REQUIREMENTS" contains any special scenario requirements (e.g., used vehicles, foreign borrowers, early repayment, cross border), this CONFIRMS that the contract has already been verified (through other channels) to apply to those specific scenarios. They MUST be checked as mandatory items.
+
+INSTRUCTIONS:
+Return exactly one result for each requirement in "LEGAL REQUIREMENTS":
+- 1. Extract content after "Check Title: " as "check_title", content after "Check ID: " as "check_id".
+- 2. Determine if the contract complies with the requirement (set "compliant" to True/False).
+- 3. Provide Chinese check process explanation for "check_process_chinese".
+- 4. Provide English check process explanation for "check_process_english".
+- 5. If non-compliant, give precise English revision suggestions for "english_revision" (None if compliant).
+- 6. Note the location of issues if applicable for the "location" field.
+- 7. List the heading labels of the contract sections the check relies on for "relevant_sections" (e.g., ["ARTICLE 9a"]).
+        """)
+
+        return prompt.format_prompt(
+            contract_content=contract_content,
+            clauses_text=clauses_text
+        )
+
     def _format_final_result(self, check_response: ContractComplianceCheckResponse) -> ContractCheckFinalResult:
         """将合规检查结果转换为ContractCheckFinalResult格式"""
         # 1. 整体结果（Approved/Rejected）
@@ -1469,9 +1765,24 @@ For each requirement in "LEGAL REQUIREMENTS", do the followings:
 #    先改合同模板，再生成合同
 # ------------------------------
 class ContractTempAndContentModifier:
-    def __init__(self, llm: BaseChatModel):
+    # 模板中的Jinja2标签（变量、语句），修改后不允许减少
+    JINJA_TAG_PATTERN = re.compile(r"\{\{.*?\}\}|\{%.*?%\}", re.DOTALL)
+
+    def __init__(self, llm: BaseChatModel, patch_mode: bool = True, patch_max_retries: int = 2):
+        """
+        参数:
+        patch_mode: True时让大模型只返回按锚点定位的局部修改并在本地应用，False时沿用整份模板重写
+        patch_max_retries: 局部修改无法应用或校验失败时的重试次数
+        """
         # 初始化大模型客户端（可根据需要替换为其他模型）
         self.llm = llm
+        self.patch_mode = patch_mode
+        self.patch_max_retries = max(0, patch_max_retries)
+        # 局部修改用的结构化输出模型
+        self.patch_llm = self.llm.with_structured_output(
+            ContractTemplatePatchResponse,
+            method="function_calling"
+        )
     
     def process(self, state: LoanApplicationState) -> Dict[str, Any]:
         """执行合同合规检查 外部调用入口"""
@@ -1492,18 +1803,20 @@ class ContractTempAndContentModifier:
                 contract_filename_txt
             )
 
-            # 修改合同模板
+            # 修改合同模板（保存为该申请自己的模板版本）
+            application_id = state.get("raw_data", {}).get("application_id", "APPL_00000000")
             revisions = state.get("contract_review_result_details",{}).get("revisions",[])
-            self.modify_template(revisions)
+            template_version = self.modify_template(revisions, str(application_id))
             # 再次生成合同
             generater = LoanContractGenerater(self.llm)
-            contract_text = generater.generate_loan_contract(state.get("loan_structuring_data"), contract_pdf_path, contract_txt_path)
+            contract_text = generater.generate_loan_contract(state.get("loan_structuring_data"), contract_pdf_path, contract_txt_path, template_version)
 
             contract_pdf_metadata = generater.get_file_metadata(contract_pdf_path)
             contract_pdf_binary_data = generater.read_file_as_binary(contract_pdf_path)
 
             return {
                 "contract_draft":contract_text,
+                "contract_template_version": template_version,
                 "contract_file_path": contract_pdf_path,
                 "contract_file_metadata": {
                     "binary_data": contract_pdf_binary_data,
@@ -1555,40 +1868,99 @@ Ensure the modified template retains all original functionality and formatting e
             original_template=original_template
         )
 
-    def _backup_original_template(self, template_path: str, backup_dir: str) -> str:
-        """备份原始模板文件"""
-        # 创建备份目录
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        # 生成带时间戳的备份文件名
-        # 生成带毫秒的时间戳（格式：YYYYMMDD_HHMMSSfff，其中fff为毫秒）
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S%f")[:-3]  # %f是微秒，取前3位作为毫秒
-        filename = os.path.basename(template_path)
-        name, ext = os.path.splitext(filename)
-        backup_filename = f"{name}_backup_{timestamp}{ext}"
-        backup_path = os.path.join(backup_dir, backup_filename)
-        
-        # 复制文件进行备份
-        shutil.copy2(template_path, backup_path)
-        print(f"已备份原始模板至: {backup_path}")
-        return backup_path
-
-    def modify_template(self, revisions:List[dict]) :
-        """修改合同模板的主方法"""
+    def _create_patch_prompt(self, original_template: str, revisions_text: str, previous_error: Optional[str] = None) -> ChatPromptTemplate:
+        """生成让大模型返回局部修改（锚点+操作）的提示词"""
+        prompt = ChatPromptTemplate.from_template("""
+You are a senior expert specializing in German loan contract modification, with deep experience in HTML/Jinja2 template editing. 
+Your task is to fix all non-compliant issues in the template based on the provided revision suggestions, by returning targeted edits instead of the whole template.
+
+CRITICAL CONSTRAINTS (MUST OBEY)
+- DO NOT modify any CSS styles (including <style> tags, class attribute values like "contract-clause", style attributes like "color: #333").
+- DO NOT remove or alter existing Jinja2 variables (e.g., {{{{ data.lender.name }}}}, {{{{ font_config }}}}, {{{{ loan_amount }}}}).
+- DO NOT change the overall HTML structure (MUST keep all original tags like <span>, <div>, <p>, <h3>, <table> and their layout).
+- All edits must keep valid HTML and Jinja2 syntax (all tags properly closed and nested).
+
+EDIT RULES
+- Each edit is anchored by "anchor": text copied VERBATIM from ORIGINAL TEMPLATE that occurs exactly once in it.
+- Keep anchors and contents as short as possible: change only the sentences that need to change.
+- Use "replace" to change existing text, "insert_before"/"insert_after" to add new text next to the anchor.
+- Edits are applied in order; a later anchor must still exist after the earlier edits are applied.
+
+REVISION REQUIREMENTS
+Each requirement follows the format: "- Issue: [content] | Problem: [content] | Required changes: [content]"
+{revisions_text}
+
+ORIGINAL TEMPLATE
+{original_template}
+{previous_error}
+        """)
+
+        return prompt.format_prompt(
+            revisions_text=revisions_text,
+            original_template=original_template,
+            previous_error=f"\nYOUR PREVIOUS EDITS WERE REJECTED: {previous_error}\nReturn corrected edits." if previous_error else ""
+        )
+
+    def _apply_template_edits(self, template: str, edits: List[TemplateEditOperation]) -> str:
+        """在本地按顺序应用局部修改，锚点必须唯一"""
+        modified = template
+        for idx, edit in enumerate(edits, start=1):
+            count = modified.count(edit.anchor) if edit.anchor else 0
+            if count != 1:
+                raise ValueError(f"edit {idx} ({edit.check_id}): anchor must occur exactly once, found {count}: {edit.anchor[:80]!r}")
+            if edit.operation == "replace":
+                modified = modified.replace(edit.anchor, edit.content, 1)
+            elif edit.operation == "insert_before":
+                modified = modified.replace(edit.anchor, edit.content + edit.anchor, 1)
+            else:
+                modified = modified.replace(edit.anchor, edit.anchor + edit.content, 1)
+        return modified
+
+    def _validate_template(self, original_template: str, modified_template: str):
+        """校验修改后的模板：能编译为Jinja2模板，且原有的Jinja2标签没有被删除"""
+        try:
+            Environment(autoescape=True).parse(modified_template)
+        except TemplateSyntaxError as e:
+            raise ValueError(f"modified template is not valid Jinja2 (line {e.lineno}): {e.message}") from e
+
+        original_tags = Counter(self.JINJA_TAG_PATTERN.findall(original_template))
+        modified_tags = Counter(self.JINJA_TAG_PATTERN.findall(modified_template))
+        missing_tags = [tag for tag, count in original_tags.items() if modified_tags[tag] < count]
+        if missing_tags:
+            raise ValueError(f"edits removed Jinja2 tags: {', '.join(sorted(missing_tags))}")
+
+    def _patch_template(self, original_template: str, revisions_text: str) -> str:
+        """让大模型返回局部修改并在本地应用，失败时把错误反馈给大模型重试"""
+        previous_error = None
+        for attempt in range(self.patch_max_retries + 1):
+            prompt = self._create_patch_prompt(original_template, revisions_text, previous_error)
+            try:
+                patch = self.patch_llm.invoke(prompt)
+                print(f"模型返回修改 {len(patch.edits)} 处: {patch.summary}")
+                modified_template = self._apply_template_edits(original_template, patch.edits)
+                self._validate_template(original_template, modified_template)
+                return modified_template
+            except Exception as e:
+                previous_error = str(e)
+                print(f"第{attempt + 1}次模板局部修改失败: {previous_error}")
+        raise RuntimeError(f"Template patch failed: {previous_error}")
+
+    def modify_template(self, revisions:List[dict], application_id: str) -> str:
+        """
+        修改合同模板的主方法，返回该申请修改后使用的模板版本
+
+        修改结果按内容哈希保存为新版本，只有该申请引用，不影响其他申请的合同
+        """
         # 1. 获取需要修改的不合规项
+        current_version = contract_template_store.get_version(application_id)
         if not revisions:
-            print("没有需要修改的不合规项，直接返回原始模板")
-            with open(contract_template_path, "r", encoding="utf-8") as f:
-                return f.read()
+            print("没有需要修改的不合规项，直接使用当前模板")
+            return current_version
 
-        # 2. 备份原始模板
-        self._backup_original_template(contract_template_path, contract_template_backup_dir)
+        # 2. 读取该申请当前使用的模板内容（旧版本不可变，无需备份）
+        original_template = contract_template_store.get_source(current_version)
 
-        # 3. 读取原始模板内容
-        with open(contract_template_path, "r", encoding="utf-8") as f:
-            original_template = f.read()
-
-        # 4. 生成提示词
+        # 3. 生成提示词
         revisions_text = "\n".join([
             # 使用enumerate获取索引（start=1表示从1开始计数）
             f"- Issue: {idx} ({item['check_id']}: {item['check_title']})"
@@ -1597,25 +1969,29 @@ Ensure the modified template retains all original functionality and formatting e
             for idx, item in enumerate(revisions, start=1)  # 关键：enumerate获取索引
         ])
 
-        prompt = self._create_prompt(original_template, revisions_text)
-
-        # 5. 调用大模型进行修改
+        # 4. 调用大模型进行修改
         print(f"正在调用大模型修改模板，共需处理 {len(revisions)} 项修改...")
-        check_response = self.llm.invoke(prompt)
-        modified_template = ""
-        # 处理响应：确认类型并提取内容
-        if isinstance(check_response, AIMessage):
-            # 提取大模型返回的文本内容（核心操作）
-            modified_template = check_response.content.strip()
-            print("模型返回内容:", modified_template)
+        if self.patch_mode:
+            # 只让大模型返回局部修改，在本地应用并校验
+            modified_template = self._patch_template(original_template, revisions_text)
         else:
-            raise TypeError(f"预期AIMessage类型，实际得到{type(check_response)}")
+            prompt = self._create_prompt(original_template, revisions_text)
+            check_response = self.llm.invoke(prompt)
+            modified_template = ""
+            # 处理响应：确认类型并提取内容
+            if isinstance(check_response, AIMessage):
+                # 提取大模型返回的文本内容（核心操作）
+                modified_template = check_response.content.strip()
+                print("模型返回内容:", modified_template)
+            else:
+                raise TypeError(f"预期AIMessage类型，实际得到{type(check_response)}")
 
 
-        # 6. 保存修改后的模板
-        with open(contract_template_path, "w", encoding="utf-8") as f:
-            f.write(modified_template)
-        print(f"模板修改完成，已更新文件: {contract_template_path}")
+        # 5. 保存修改后的模板为新版本，并清理不再被引用的旧版本
+        new_version = contract_template_store.commit(application_id, modified_template)
+        removed_count = contract_template_store.collect_garbage()
+        print(f"模板修改完成，申请 {application_id} 使用模板版本: {new_version[:12]}（清理未引用版本 {removed_count} 个）")
+        return new_version
 
 
 
@@ -81,6 +81,7 @@ class LoanApplicationState(TypedDict):
     contract_generation_status: Optional[str] = None # 执行状态 Success/Fail
     contract_generation_result: Optional[str] = None # 执行结果 Contract structuringn completed/aborted
     contract_file_path: Optional[str] = None # 生成的合同文件的绝对路径
+    contract_template_version: Optional[str] = None # 生成合同使用的模板版本（模板内容哈希），合同修改后更新
     contract_file_metadata: Optional[Dict] = None # 合同文件的信息：binary_data，file_name，file_type，file_extension，file_size
     contract_file_name: Optional[str] = None # file_name
     contract_file_type: Optional[str] = None # file_type
@@ -89,6 +90,7 @@ class LoanApplicationState(TypedDict):
     contract_review_status: Optional[str] = None # 合同检查结果是否通过 (Approved/Rejected/Fail，Fail是发生Error)
     contract_review_result: Optional[str] = None # 执行结果 Contract generation completed/aborted
     contract_review_result_details: Optional[Dict] = None # 执行结果详细：overall_result，detail_results，summary，revisions。参考loan_structuring_agents.py的class ContractCheckFinalResult
+    contract_review_clause_results: Optional[Dict] = None # 条款级检查结果缓存 {check_id: {section_hash, result}}，合同修改后再次检查时只重查章节有变化或未通过的条款
     # 合同修改agent 执行结果
     contract_modify_status: Optional[str] = None # 执行状态 Success/Fail
     contract_modify_result: Optional[str] = None # 执行结果 Contract modify completed/aborted
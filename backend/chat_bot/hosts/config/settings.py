@@ -17,8 +17,77 @@ REMOTE_AGENTS = {
     },
 }
 
+# 远程Agent进程的管理参数（auto_start模式）
+# 每类Agent从配置的port开始使用连续端口启动多个副本，REMOTE_AGENTS中可用'replicas'单独指定副本数
+SUPERVISOR_CONFIG = {
+    'replicas': 2,              # 每类Agent的副本数
+    'startup_timeout': 30,      # 等待副本启动完成的时间（秒）
+    'backoff_initial': 1,       # 异常退出后第一次重启前的等待时间（秒），之后每次加倍
+    'backoff_max': 60,          # 重启等待时间的上限（秒）
+    'stable_seconds': 60,       # 运行超过该时间后退出的，重启等待时间重新从最短开始
+}
+
 API_CONFIG = {
     'host': '0.0.0.0',
     'port': 9001,
     'timeout': 30
-}
\ No newline at end of file
+}
+
+# 远程Agent注册的参数
+REGISTRY_CONFIG = {
+    'card_ttl': 300,          # Agent卡片的有效期（秒），超过有效期没有刷新成功的Agent会被移除
+    'health_interval': 30,    # 后台健康检查（重新获取卡片）的间隔（秒）
+    'max_failures': 3,        # 连续失败达到该次数时移除Agent
+}
+
+# 流式输出（SSE）的参数
+STREAM_CONFIG = {
+    'interval': 0.05,             # token合并窗口（秒）
+    'max_chars': 256,             # 合并的最大字符数，达到后立即输出
+    'heartbeat_interval': 15,     # 没有输出时发送心跳的间隔（秒）
+}
+
+# Agent路由规则（键为远程Agent卡片的name）
+# keywords: 正则表达式，命中后直接选择该Agent，不再调用LLM
+# examples: 典型问题，与Agent描述一起用于相似度分类
+AGENT_ROUTING = {
+    'Automobile Recommendation Agent': {
+        'keywords': [
+            r'推荐.{0,6}车', r'买.{0,4}车', r'选.{0,2}车', r'哪[款辆个].{0,4}车', r'什么车',
+            r'SUV', r'轿车', r'新能源', r'油耗', r'续航',
+            r'recommend.{0,20}car', r'which car', r'best car', r'\bsuv\b', r'\bsedan\b',
+        ],
+        'examples': [
+            '帮我推荐一款车', '预算30万买什么车好', '适合家用的SUV有哪些',
+            'Recommend a car for me', 'What is the best car for my budget?',
+        ],
+    },
+    'Loan Scheme Suggestion Agent': {
+        'keywords': [
+            r'贷款方案', r'还款方案', r'金融方案', r'首付', r'月供', r'利率', r'分期', r'还款',
+            r'loan scheme', r'loan suggest', r'down payment', r'monthly payment', r'interest rate',
+        ],
+        'examples': [
+            '有什么贷款方案推荐', '首付20%月供多少', '哪个贷款方案利率最低',
+            'What is the best loan scheme for me?', 'Suggest a loan scheme based on my requirements',
+        ],
+    },
+    'Loan Pre-examination Agent': {
+        'keywords': [
+            r'预审', r'预审批', r'征信', r'信用记录', r'能不能贷', r'能否贷', r'贷款资格', r'审批结果',
+            r'pre-?exam', r'pre-?approv', r'credit (report|score|record)',
+        ],
+        'examples': [
+            '帮我做一下贷款预审', '我的征信能通过审批吗', '我的身份证号是110101199001010000',
+            'What is the loan pre-examination result for me?',
+        ],
+    },
+}
+
+# Agent选择的参数
+ROUTER_CONFIG = {
+    'similarity_threshold': 0.15,   # 相似度分类的最低得分
+    'similarity_margin': 0.04,      # 第一名需要领先第二名的得分
+    'sticky_ttl': 1800,             # 同一会话沿用上次Agent的有效期（秒）
+    'sticky_max_sessions': 10000,   # 保存路由记录的最大会话数
+}
@@ -6,22 +6,21 @@ from contextlib import asynccontextmanager
 import uvicorn
 import httpx
 from typing import Dict, List, Optional
-from config.settings import API_CONFIG,REMOTE_AGENTS
+from config.settings import API_CONFIG,REMOTE_AGENTS,REGISTRY_CONFIG,STREAM_CONFIG
 from services.agent_services import (
     AgentProcessManager,
     AgentRegistry,
     AgentSelector,
-    AgentQueryService
+    AgentQueryService,
+    replica_urls
 )
+from services.stream_protocol import coalesce_deltas, sse_event
 
 from typing import Dict, List, Optional
 import httpx
 from config.settings import REMOTE_AGENTS
-import json
 from typing import Dict, List, Optional
 from fastapi.responses import StreamingResponse
-import json
-from a2a.types import TextPart
 import re
 
 class QueryRequest(BaseModel):
@@ -47,8 +46,12 @@ class QueryResponse(BaseModel):
 async def lifespan(app: FastAPI):
     # 初始化服务
     http_client = httpx.AsyncClient(timeout=API_CONFIG['timeout'])
-    process_manager = AgentProcessManager()
-    registry = AgentRegistry(http_client)
+    process_manager = AgentProcessManager(http_client)
+    registry = AgentRegistry(
+        http_client,
+        urls=[url for agent_type in REMOTE_AGENTS for url in replica_urls(agent_type)],
+        **REGISTRY_CONFIG
+    )
     selector = AgentSelector()
     query_service = AgentQueryService(registry, selector)
     
@@ -60,10 +63,15 @@ async def lifespan(app: FastAPI):
         'query_service': query_service,
         'selector': selector
     }
+
+    # 发现远程Agent（只在启动时执行一次），之后由后台健康检查刷新
+    await registry.refresh()
+    registry.start_health_checks()
     
     yield
     
     # 清理资源
+    await registry.stop_health_checks()
     await process_manager.stop_all()
     await http_client.aclose()
 
@@ -81,35 +89,33 @@ app.add_middleware(
 async def handle_stream_query(request: QueryRequest):
     services = app.state.services
     
-    async def generate():
+    async def events():
         # 1. 自动启动Agent（逻辑复用自原/query接口）
         if request.auto_start and not services['process_manager'].processes:
             if not await services['process_manager'].start_all():
-                yield json.dumps({"type": "error", "message": "Failed to start agents"}, ensure_ascii=False) + "\n"
+                yield {"type": "error", "message": "Failed to start agents"}
                 return
-        elif not request.auto_start:
-            print("🔧 Manual mode: Agents should be started separately")
-            for agent_type, config in REMOTE_AGENTS.items():
-                url = f"http://localhost:{config['port']}"
-                card = await services['registry'].register_agent(url)
-                
+            await services['registry'].refresh()
+        else:
+            # 手动模式：Agent单独启动，使用启动时注册的缓存（还没有可用Agent时才重新发现）
+            await services['registry'].ensure_agents()
+
         # 2. 直接调用AgentQueryService的流式方法
-        async for content in services['query_service'].handle_stream_query(request.query,request.session_id):
-            # 检查是否为错误字典格式
-            if isinstance(content, dict) and 'type' in content and content['type'] == 'error':
-                # 从错误信息中提取文本（如果需要）
-                error_text = content['message'].split(': ')[-1] if ': ' in content['message'] else content['message']
-                yield error_text
-                # return {"root": TextPart(kind='text', metadata=None, text=error_text)}
-            # 检查是否为TextPart格式
-            elif hasattr(content, 'root') and isinstance(content.root, TextPart):
-                yield remove_asterisks(content.root.text)
-            # 处理未知格式
-            else:
-                # return {"root": TextPart(kind='text', metadata=None, text="无法识别的内容格式")}
-                yield "无法识别的内容格式"
-            # text = content.root.text
-            # yield text
+        async for event in services['query_service'].handle_stream_query(request.query,request.session_id):
+            yield event
+
+    async def generate():
+        # 3. 合并token增量后按SSE帧输出（event: agent / delta / heartbeat / error / done）
+        async for event in coalesce_deltas(events(), **STREAM_CONFIG):
+            event_type = event.pop("type")
+            if event_type == "delta":
+                event["text"] = remove_asterisks(event["text"])
+            elif event_type == "error":
+                # 从错误信息中提取文本
+                message = event["message"]
+                event["message"] = message.split(': ')[-1] if ': ' in message else message
+            yield sse_event(event_type, event)
+        yield sse_event("done", {})
 
     def remove_asterisks(text: str) -> str:
         """
@@ -124,7 +130,11 @@ async def handle_stream_query(request: QueryRequest):
         return text.replace('*', '')
             
 
-    return StreamingResponse(generate(), media_type="text/event-stream",headers={"Cache-Control": "no-cache"})
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # 禁止反向代理缓冲SSE
+    )
 
 @app.get("/agents", response_model=List[AgentInfo])
 async def list_agents():
@@ -0,0 +1,130 @@
+# services/agent_router.py
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Pattern, Tuple
+
+_LATIN_WORD = re.compile(r"[a-z0-9]+")
+_CJK_RUN = re.compile(r"[一-鿿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：英文按单词，中文按单字和相邻两字（不依赖分词库）"""
+    text = (text or "").lower()
+    tokens = _LATIN_WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {token: value / norm for token, value in vector.items()} if norm else {}
+
+
+class KeywordRouter:
+    """第一层：关键字/正则规则，命中且只命中一个Agent时直接返回"""
+
+    def __init__(self, routing: Dict[str, Dict]):
+        self.rules: Dict[str, List[Pattern]] = {
+            name: [re.compile(pattern, re.IGNORECASE) for pattern in config.get('keywords', [])]
+            for name, config in routing.items()
+        }
+
+    def match(self, query: str, candidates: List[str]) -> Optional[str]:
+        hits = {
+            name: sum(1 for pattern in self.rules.get(name, []) if pattern.search(query))
+            for name in candidates
+        }
+        hits = {name: count for name, count in hits.items() if count}
+        if not hits:
+            return None
+        ranked = sorted(hits.items(), key=lambda item: item[1], reverse=True)
+        # 多个Agent命中同样多的规则时无法判断，交给下一层
+        if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+            return None
+        return ranked[0][0]
+
+
+class SimilarityRouter:
+    """
+    第二层：本地相似度分类
+    用Agent的名称、描述和典型问题预先计算TF-IDF向量，与用户问题做余弦相似度比较（不调用外部服务）
+    """
+
+    def __init__(self, routing: Dict[str, Dict], threshold: float, margin: float):
+        self.routing = routing
+        self.threshold = threshold
+        self.margin = margin
+        self._key: Optional[Tuple] = None
+        self._idf: Dict[str, float] = {}
+        self._vectors: Dict[str, Dict[str, float]] = {}
+
+    def _build(self, agents: List[Dict[str, str]]):
+        """Agent列表变化时重新计算各Agent的向量"""
+        key = tuple(sorted((agent['name'], agent.get('description') or '') for agent in agents))
+        if key == self._key:
+            return
+        documents = {}
+        for agent in agents:
+            config = self.routing.get(agent['name'], {})
+            text = " ".join([agent['name'], agent.get('description') or '', *config.get('examples', [])])
+            documents[agent['name']] = Counter(tokenize(text))
+        # 所有Agent都有的词（如 agent、loan）区分度低，降低权重
+        document_count = len(documents)
+        frequency = Counter(token for counts in documents.values() for token in counts)
+        self._idf = {token: math.log((1 + document_count) / (1 + df)) + 1 for token, df in frequency.items()}
+        self._vectors = {
+            name: _normalize({token: count * self._idf[token] for token, count in counts.items()})
+            for name, counts in documents.items()
+        }
+        self._key = key
+
+    def scores(self, query: str, agents: List[Dict[str, str]]) -> List[Tuple[str, float]]:
+        """返回按得分从高到低排列的 [(Agent名, 相似度)]"""
+        self._build(agents)
+        counts = Counter(token for token in tokenize(query) if token in self._idf)
+        query_vector = _normalize({token: count * self._idf[token] for token, count in counts.items()})
+        scores = [
+            (name, sum(value * vector.get(token, 0.0) for token, value in query_vector.items()))
+            for name, vector in self._vectors.items()
+        ]
+        return sorted(scores, key=lambda item: item[1], reverse=True)
+
+    def match(self, query: str, agents: List[Dict[str, str]]) -> Optional[str]:
+        """得分足够高且明显领先第二名时返回Agent名，否则返回None"""
+        scores = self.scores(query, agents)
+        if not scores or scores[0][1] < self.threshold:
+            return None
+        if len(scores) > 1 and scores[0][1] - scores[1][1] < self.margin:
+            return None
+        return scores[0][0]
+
+
+class StickyRoutes:
+    """记录每个会话上次使用的Agent，后续追问（如“那第二个呢”）沿用同一个Agent"""
+
+    def __init__(self, ttl_seconds: float, max_sessions: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._routes: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, session_id: Optional[str]) -> Optional[str]:
+        if not session_id or session_id not in self._routes:
+            return None
+        agent_name, expires_at = self._routes[session_id]
+        if time.monotonic() >= expires_at:
+            del self._routes[session_id]
+            return None
+        return agent_name
+
+    def set(self, session_id: Optional[str], agent_name: str):
+        if not session_id:
+            return
+        self._routes[session_id] = (agent_name, time.monotonic() + self.ttl_seconds)
+        self._routes.move_to_end(session_id)
+        # 超过上限时丢弃最久未使用的会话
+        while len(self._routes) > self.max_sessions:
+            self._routes.popitem(last=False)
@@ -1,16 +1,22 @@
 # services/agent_services.py
 import asyncio
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
 from typing import Dict, List, Optional
 import httpx
 from a2a.client import A2ACardResolver, A2AClient
 from a2a.types import AgentCard, Message, Part, Role, TextPart, Task
-from config.settings import REMOTE_AGENTS
+from config.settings import REMOTE_AGENTS, AGENT_ROUTING, ROUTER_CONFIG, SUPERVISOR_CONFIG
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from config.load_key import load_key
-import subprocess
+from services.agent_router import KeywordRouter, SimilarityRouter, StickyRoutes
 import sys
+import time
 from typing import Dict, List, Optional
 from uuid import uuid4
 from a2a.types import (
@@ -29,101 +35,194 @@ from a2a.types import (
     TextPart,
     Role
 )
-from typing import AsyncGenerator
+from typing import AsyncGenerator, AsyncIterator
+
+# 远程Agent代码所在目录（remotes/<agent_type>）
+REMOTES_DIR = Path(__file__).resolve().parents[2] / 'remotes'
+
+
+def replica_urls(agent_type: str, host: str = "localhost") -> List[str]:
+    """某类Agent各副本的地址（从配置的端口开始连续分配）"""
+    config = REMOTE_AGENTS[agent_type]
+    replicas = config.get('replicas', SUPERVISOR_CONFIG['replicas'])
+    return [f"http://{host}:{config['port'] + i}" for i in range(replicas)]
+
 
 class AgentProcessManager:
-    """管理远程Agent进程的生命周期"""
-    def __init__(self):
+    """管理远程Agent进程的生命周期（每类Agent启动多个副本，使用连续的端口）"""
+    def __init__(self, http_client: httpx.AsyncClient):
+        self.http_client = http_client
         self.processes: Dict[str, 'RemoteAgentProcess'] = {}
     
     async def start_all(self) -> bool:
-        success = True
-        for agent_type, config in REMOTE_AGENTS.items():
-            process = RemoteAgentProcess(
-                agent_type, 
-                config['port'],
+        processes = [
+            RemoteAgentProcess(
+                agent_type,
+                int(url.rsplit(':', 1)[1]),
+                self.http_client,
                 host="localhost"  # 明确传递host参数
             )
-            if await process.start():
-                self.processes[agent_type] = process
-            else:
-                success = False
-        return success
+            for agent_type in REMOTE_AGENTS
+            for url in replica_urls(agent_type)
+        ]
+        for process in processes:
+            self.processes[process.name] = process
+        # 所有副本并行启动
+        results = await asyncio.gather(*(process.start() for process in processes))
+        return all(results)
     
     async def stop_all(self):
-        for process in self.processes.values():
-            process.stop()
+        await asyncio.gather(*(process.stop() for process in self.processes.values()))
         self.processes.clear()
 
 class RemoteAgentProcess:
-    """单个远程Agent进程管理"""
-    def __init__(self, agent_type: str, port: int,host: str = "localhost"):
+    """
+    单个远程Agent副本进程的管理
+
+    - 子进程的输出按行读取并打印（不读取时管道写满会使子进程阻塞）
+    - 进程异常退出后按指数退避自动重启
+    """
+    def __init__(self, agent_type: str, port: int, http_client: httpx.AsyncClient, host: str = "localhost"):
         self.agent_type = agent_type
         self.port = port
         self.host = host
-        self.process = None
+        self.http_client = http_client
+        self.name = f"{agent_type}#{port}"
+        self.process: Optional[asyncio.subprocess.Process] = None
         self.url = f"http://{self.host}:{self.port}"
+        self._supervisor: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._stopping = False
     
     async def start(self) -> bool:
         # 实现启动逻辑
-        """Start the agent process"""
+        """Start the agent process under supervision and wait until it is ready"""
+        self._stopping = False
+        self._supervisor = asyncio.create_task(self._supervise())
         try:
-            print(f"🚀 Starting {self.agent_type} agent on port {self.port}...")
-
-            # Build command
-            cmd = [
-                sys.executable, '-m', f'remotes.{self.agent_type}',
-                '--host', self.host,
-                '--port', str(self.port)
-            ]
-
-            # Start process
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-
-            # Wait for startup (check if agent is responding)
-            for attempt in range(30):  # 30 second timeout
-                try:
-                    async with httpx.AsyncClient(timeout=2) as client:
-                        response = await client.get(f"{self.url}/.well-known/agent-card")
-                        if response.status_code == 200:
-                            print(f"✅ {self.agent_type} agent started successfully")
-                            return True
-                except:
-                    pass
-                await asyncio.sleep(1)
-
-            print(f"❌ Failed to start {self.agent_type} agent")
+            await asyncio.wait_for(self._ready.wait(), SUPERVISOR_CONFIG['startup_timeout'])
+            return True
+        except asyncio.TimeoutError:
+            print(f"❌ Failed to start {self.name} agent")
             return False
 
-        except Exception as e:
-            print(f"❌ Error starting {self.agent_type}: {e}")
-            return False
-    
-    def stop(self):
+    async def stop(self):
         # 实现停止逻辑
         """Stop the agent process"""
-        if self.process:
+        self._stopping = True
+        if self._supervisor:
+            self._supervisor.cancel()
+            try:
+                await self._supervisor
+            except asyncio.CancelledError:
+                pass
+            self._supervisor = None
+
+    async def _supervise(self):
+        backoff = SUPERVISOR_CONFIG['backoff_initial']
+        while not self._stopping:
+            started_at = time.monotonic()
             try:
-                self.process.terminate()
-                self.process.wait(timeout=5)
-                print(f"🛑 Stopped {self.agent_type} agent")
-            except subprocess.TimeoutExpired:
-                self.process.kill()
-                print(f"🔥 Killed {self.agent_type} agent")
+                return_code = await self._run_once()
             except Exception as e:
-                print(f"⚠️ Error stopping {self.agent_type}: {e}")
+                print(f"❌ Error starting {self.name}: {e}")
+                return_code = None
+            if self._stopping:
+                break
+            # 稳定运行一段时间后退出的，重新从最短等待时间开始
+            if time.monotonic() - started_at >= SUPERVISOR_CONFIG['stable_seconds']:
+                backoff = SUPERVISOR_CONFIG['backoff_initial']
+            print(f"⚠️ {self.name} exited with code {return_code}, restarting in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, SUPERVISOR_CONFIG['backoff_max'])
+
+    async def _run_once(self) -> int:
+        """启动一次子进程，等待其退出并返回退出码"""
+        print(f"🚀 Starting {self.agent_type} agent on port {self.port}...")
+        cwd = REMOTES_DIR / self.agent_type
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, '__main__.py',
+            '--host', self.host,
+            '--port', str(self.port),
+            cwd=str(cwd),
+            env={**os.environ, 'PYTHONPATH': str(cwd), 'PYTHONUNBUFFERED': '1'},
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        drain = asyncio.create_task(self._drain_output())
+        ready = asyncio.create_task(self._wait_ready())
+        try:
+            return await self.process.wait()
+        except asyncio.CancelledError:
+            await self._terminate()
+            raise
+        finally:
+            ready.cancel()
+            # 进程退出后输出管道关闭，剩余的输出读完后结束
+            await drain
+
+    async def _drain_output(self):
+        async for line in self.process.stdout:
+            print(f"[{self.name}] {line.decode(errors='replace').rstrip()}")
+
+    async def _wait_ready(self):
+        """轮询Agent卡片，能取得时视为启动完成"""
+        resolver = A2ACardResolver(self.http_client, self.url)
+        while True:
+            try:
+                await resolver.get_agent_card()
+                print(f"✅ {self.name} agent started successfully")
+                self._ready.set()
+                return
+            except Exception:
+                await asyncio.sleep(1)
+
+    async def _terminate(self):
+        if self.process is None or self.process.returncode is not None:
+            return
+        try:
+            self.process.terminate()
+            await asyncio.wait_for(self.process.wait(), 5)
+            print(f"🛑 Stopped {self.name} agent")
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+            print(f"🔥 Killed {self.name} agent")
+        except ProcessLookupError:
+            pass
+
+@dataclass
+class AgentReplica:
+    """已注册的Agent副本"""
+    url: str
+    card: AgentCard
+    client: A2AClient
+    outstanding: int = 0   # 正在处理的请求数
+    served: int = 0        # 累计分配的请求数（请求数相同时轮流分配）
 
 class AgentRegistry:
-    """Agent注册和发现服务"""
-    def __init__(self, http_client: httpx.AsyncClient):
+    """
+    Agent注册和发现服务
+
+    - 服务启动时发现所有远程Agent，之后请求直接使用缓存的Agent卡片和A2AClient
+    - 后台定期重新获取卡片作为健康检查，卡片有变化时重建客户端
+    - 连续失败达到上限，或超过TTL没有成功刷新的副本会被移除，恢复后自动重新注册
+    - 同一Agent有多个副本时，请求分配给正在处理请求数最少的副本
+    """
+    def __init__(self, http_client: httpx.AsyncClient, urls: Optional[List[str]] = None,
+                 card_ttl: float = 300, health_interval: float = 30, max_failures: int = 3):
         self.http_client = http_client
+        self.urls = list(urls or [])
+        self.card_ttl = card_ttl
+        self.health_interval = health_interval
+        self.max_failures = max_failures
         self.agents: Dict[str, AgentCard] = {}
-        self.clients: Dict[str, A2AClient] = {}
+        self.replicas: Dict[str, Dict[str, AgentReplica]] = {}   # Agent名 -> {url: 副本}
+        self._names: Dict[str, str] = {}          # url -> Agent名
+        self._expires_at: Dict[str, float] = {}   # url -> 卡片过期时间
+        self._failures: Dict[str, int] = {}       # url -> 连续失败次数
+        self._health_task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
     
     async def register_agent(self, url: str) -> Optional[AgentCard]:
         # 实现注册逻辑
@@ -132,22 +231,99 @@ class AgentRegistry:
             resolver = A2ACardResolver(self.http_client, url)
             card = await resolver.get_agent_card()
             card.url = url
-
-            # Create A2A client for this agent
-            client = A2AClient(self.http_client, agent_card=card)
-
-            self.agents[card.name] = card
-            self.clients[card.name] = client
-
-            print(f"📋 Registered agent: {card.name}")
-            print(f"   Description: {card.description}")
-            print(f"   URL: {url}")
-
-            return card
-
         except Exception as e:
-            print(f"❌ Failed to register agent at {url}: {e}")
+            # 同一地址连续失败时只在第一次输出
+            if not self._failures.get(url):
+                print(f"❌ Failed to register agent at {url}: {e}")
             return None
+
+        name = self._names.get(url)
+        previous = self.replicas.get(name, {}).get(url)
+        if previous is not None and previous.card == card:
+            # 卡片没有变化，继续使用原来的客户端
+            return card
+        if name is not None:
+            self._remove(url)
+
+        # Create A2A client for this agent
+        client = A2AClient(self.http_client, agent_card=card)
+
+        self.replicas.setdefault(card.name, {})[url] = AgentReplica(url, card, client)
+        self.agents.setdefault(card.name, card)
+        self._names[url] = card.name
+
+        print(f"📋 Registered agent: {card.name}")
+        print(f"   Description: {card.description}")
+        print(f"   URL: {url}")
+
+        return card
+
+    @asynccontextmanager
+    async def acquire(self, name: str) -> AsyncIterator[Optional[A2AClient]]:
+        """取得请求数最少的副本的客户端，请求结束前计入该副本的处理中请求数"""
+        replicas = self.replicas.get(name)
+        if not replicas:
+            yield None
+            return
+        replica = min(replicas.values(), key=lambda r: (r.outstanding, r.served))
+        replica.outstanding += 1
+        replica.served += 1
+        try:
+            yield replica.client
+        finally:
+            replica.outstanding -= 1
+
+    async def refresh(self):
+        """重新获取所有Agent的卡片（同时作为健康检查）"""
+        async with self._refresh_lock:
+            await asyncio.gather(*(self._check(url) for url in self.urls))
+
+    async def ensure_agents(self):
+        """还没有可用Agent时（如远程Agent晚于Host启动）立即刷新一次"""
+        if not self.agents:
+            await self.refresh()
+
+    def start_health_checks(self):
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"⚠️ Agent health check failed: {e}")
+
+    async def _check(self, url: str):
+        if await self.register_agent(url) is not None:
+            self._failures[url] = 0
+            self._expires_at[url] = time.monotonic() + self.card_ttl
+            return
+        self._failures[url] = self._failures.get(url, 0) + 1
+        expired = time.monotonic() >= self._expires_at.get(url, 0)
+        if url in self._names and (self._failures[url] >= self.max_failures or expired):
+            print(f"🗑️ Evicted unhealthy agent: {self._names[url]} ({url})")
+            self._remove(url)
+
+    def _remove(self, url: str):
+        name = self._names.pop(url, None)
+        replicas = self.replicas.get(name, {})
+        replicas.pop(url, None)
+        if replicas:
+            self.agents[name] = next(iter(replicas.values())).card
+        else:
+            self.replicas.pop(name, None)
+            self.agents.pop(name, None)
     
     def list_agents(self) -> List[Dict[str, str]]:
         return [
@@ -156,14 +332,67 @@ class AgentRegistry:
         ]
 
 class AgentSelector:
-    """Agent选择服务"""
-    async def select_agent(self, user_query: str, available_agents: List[Dict[str, str]]) -> Optional[str]:
-        # 实现LLM选择逻辑
-        """Select the best agent for the user query using LLM"""
-
+    """
+    Agent选择服务
+
+    按以下顺序选择，前一层能确定时不再进入后一层：
+    1. 关键字/正则规则
+    2. 本地相似度分类（与Agent描述的TF-IDF向量比较）
+    3. 同一会话上次使用的Agent（追问）
+    4. LLM（以上都无法确定时）
+    """
+    def __init__(self):
+        self.keyword_router = KeywordRouter(AGENT_ROUTING)
+        self.similarity_router = SimilarityRouter(
+            AGENT_ROUTING,
+            threshold=ROUTER_CONFIG['similarity_threshold'],
+            margin=ROUTER_CONFIG['similarity_margin'],
+        )
+        self.sticky_routes = StickyRoutes(ROUTER_CONFIG['sticky_ttl'], ROUTER_CONFIG['sticky_max_sessions'])
+
+    @cached_property
+    def model(self) -> ChatOpenAI:
+        """LLM客户端（第一次需要LLM选择时创建，之后复用）"""
+        return ChatOpenAI(
+            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            api_key=load_key("DASHSCOPE_API_KEY"),
+            model="qwen-plus",
+        )
+
+    async def select_agent(self, user_query: str, available_agents: List[Dict[str, str]], session_id: Optional[str] = None) -> Optional[str]:
+        """
+        为用户问题选择Agent
+
+        参数:
+            user_query: 用户问题
+            available_agents: 可用Agent列表（name, description, url）
+            session_id: 会话ID，用于同一会话的追问沿用上次的Agent
+        """
         if not available_agents:
             return None
 
+        names = [agent['name'] for agent in available_agents]
+        tier = "keyword"
+        selected_agent_name = self.keyword_router.match(user_query, names)
+        if not selected_agent_name:
+            tier = "similarity"
+            selected_agent_name = self.similarity_router.match(user_query, available_agents)
+        if not selected_agent_name:
+            tier = "sticky"
+            selected_agent_name = self.sticky_routes.get(session_id)
+            if selected_agent_name not in names:
+                selected_agent_name = None
+        if not selected_agent_name:
+            tier = "llm"
+            selected_agent_name = await self._select_agent_with_llm(user_query, available_agents)
+
+        if selected_agent_name:
+            print(f"🧭 Selected agent ({tier}): {selected_agent_name}")
+            self.sticky_routes.set(session_id, selected_agent_name)
+        return selected_agent_name
+
+    async def _select_agent_with_llm(self, user_query: str, available_agents: List[Dict[str, str]]) -> Optional[str]:
+        """Select the best agent for the user query using LLM"""
         # Build prompt for agent selection
         agent_list = "\n".join([
             f"- {agent['name']}: {agent['description']}"
@@ -173,7 +402,7 @@ class AgentSelector:
         prompt = f"""Choose the best agent for this task.
             Available agents:
             {agent_list}
-            User request: "{user_query}"
+            User request: "{{text}}"
 
             Rules:
             1. For automobile recommendation → Automobile Recommendation Agent
@@ -187,20 +416,22 @@ class AgentSelector:
                 ("system", prompt),
                 ("user", "{text}")
             ])
-            model = ChatOpenAI(
-                        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-                        api_key=load_key("DASHSCOPE_API_KEY"),
-                        model="qwen-plus",
-                    )
-            parser = StrOutputParser()
-            chain = prompt_template | model | parser 
-            selected_agent_name = chain.invoke({"text": user_query})
-            return selected_agent_name
-
+            chain = prompt_template | self.model | StrOutputParser()
+            answer = (await chain.ainvoke({"text": user_query})).strip().strip('"')
         except Exception as e:
             print(f"❌ Error selecting agent with LLM: {e}")
             return None
 
+        # LLM的回答不一定与Agent名完全一致，只接受能对应到可用Agent的回答
+        for agent in available_agents:
+            if answer.lower() == agent['name'].lower():
+                return agent['name']
+        for agent in available_agents:
+            if agent['name'].lower() in answer.lower():
+                return agent['name']
+        print(f"❌ LLM selected an unknown agent: {answer}")
+        return None
+
 class AgentQueryService:
     """统一查询处理服务"""
     def __init__(self, registry: AgentRegistry, selector: AgentSelector):
@@ -218,18 +449,12 @@ class AgentQueryService:
                 return
 
             # 2. 选择Agent
-            selected_agent_name = await self.selector.select_agent(query, available_agents)
+            selected_agent_name = await self.selector.select_agent(query, available_agents, session_id)
             if not selected_agent_name:
                 yield {"type": "error", "message": "No suitable agent found"}
                 return
 
-            # 3. 获取Agent客户端
-            client = self.registry.clients.get(selected_agent_name)
-            if not client:
-                yield {"type": "error", "message": f"Agent client not found: {selected_agent_name}"}
-                return
-
-            # 4. 构建消息
+            # 3. 构建消息
             message = Message(
                 role=Role.user,
                 parts=[Part(root=TextPart(text=query))],
@@ -244,11 +469,19 @@ class AgentQueryService:
                 metadata={"session_id": session_id}
             )
 
-            # 5. 流式处理响应(流式传输需要每一层（Remote → Host → Client）都支持逐字/分片处理,代码需要修改)
-            async for chunk in self._process_streaming_response(client, payload, selected_agent_name):
-                if chunk.get("type") == "status":
-                    text = chunk["text"][0]
-                    yield text
+            # 4. 获取Agent客户端（多个副本时选择正在处理请求数最少的副本，同一请求内始终使用该副本）
+            async with self.registry.acquire(selected_agent_name) as client:
+                if not client:
+                    yield {"type": "error", "message": f"Agent client not found: {selected_agent_name}"}
+                    return
+
+                # 5. 流式处理响应：只转发文本增量，A2A消息的其他内容不再向下游传递
+                yield {"type": "agent", "agent_name": selected_agent_name}
+                async for chunk in self._process_streaming_response(client, payload, selected_agent_name):
+                    if chunk.get("type") == "status" and chunk["text"]:
+                        yield {"type": "delta", "text": chunk["text"]}
+                    elif chunk.get("type") == "error":
+                        yield chunk
 
         except Exception as e:
             yield {"type": "error", "message": str(e)}
@@ -274,7 +507,8 @@ class AgentQueryService:
                     "task_id": result.taskId,
                     "status": result.status.state,
                     "agent_name": agent_name,
-                    "text": result.status.message.parts#Remote端流式输出的内容
+                    # Remote端流式输出的内容（每个事件是一个token的增量）
+                    "text": self._extract_message_content(result.status.message, separator="") if result.status.message else ""
                 }
                 if result.status.state == "completed":
                     task_result = await client.get_task(GetTaskRequest(
@@ -311,7 +545,7 @@ class AgentQueryService:
                     }
 
 
-    def _extract_message_content(self, message: Message) -> str:
+    def _extract_message_content(self, message: Message, separator: str = " ") -> str:
         """Extract text content from Message object"""
         text_parts = []
         for part in message.parts:
@@ -319,6 +553,6 @@ class AgentQueryService:
                 text_parts.append(part.root.text)
             elif hasattr(part, 'text'):
                 text_parts.append(part.text)
-        return " ".join(text_parts)
+        return separator.join(text_parts)
     
 
@@ -0,0 +1,92 @@
+# services/stream_protocol.py
+import asyncio
+import json
+from typing import AsyncIterator, Dict
+
+# 流结束标记（放入队列，与正常事件区分）
+_END = object()
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """
+    生成一帧SSE数据
+    data按JSON序列化，文本中的换行不会破坏帧格式
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def coalesce_deltas(
+    events: AsyncIterator[Dict],
+    interval: float,
+    max_chars: int,
+    heartbeat_interval: float,
+) -> AsyncIterator[Dict]:
+    """
+    合并远程Agent逐token输出的文本片段
+
+    - delta事件在 interval 秒内或累计 max_chars 个字符时合并为一个事件输出
+    - 其他事件（agent、error等）输出前先输出已缓存的文本，保持顺序
+    - 超过 heartbeat_interval 秒没有任何输出时发送heartbeat事件，防止代理或浏览器断开空闲连接
+
+    参数:
+        events: 上游事件，delta事件格式为 {"type": "delta", "text": 文本}
+        interval: 合并窗口（秒）
+        max_chars: 合并的最大字符数
+        heartbeat_interval: 心跳间隔（秒）
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(_END)
+
+    task = asyncio.create_task(pump())
+    loop = asyncio.get_running_loop()
+    buffer = []
+    buffered_chars = 0
+    deadline = 0.0
+
+    def flush() -> Dict:
+        nonlocal buffer, buffered_chars
+        event = {"type": "delta", "text": "".join(buffer)}
+        buffer, buffered_chars = [], 0
+        return event
+
+    try:
+        while True:
+            timeout = max(deadline - loop.time(), 0) if buffer else heartbeat_interval
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield flush() if buffer else {"type": "heartbeat"}
+                continue
+
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                if buffer:
+                    yield flush()
+                raise item
+            if item.get("type") != "delta":
+                if buffer:
+                    yield flush()
+                yield item
+                continue
+            if not item.get("text"):
+                continue
+            if not buffer:
+                deadline = loop.time() + interval
+            buffer.append(item["text"])
+            buffered_chars += len(item["text"])
+            if buffered_chars >= max_chars:
+                yield flush()
+        if buffer:
+            yield flush()
+    finally:
+        # 客户端断开时停止读取上游
+        task.cancel()
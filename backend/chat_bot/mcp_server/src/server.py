@@ -3,6 +3,7 @@ from fastmcp import FastMCP
 from fastmcp.tools import tool
 from src.services.loan_suggest import LoanSuggestService
 from src.services.loan_pre_examination import LoanPreExaminationService
+from src.services.credit_repository import get_credit_repository
 from typing import Dict, Optional
 
 mcp = FastMCP("auto_finance_mcp")
@@ -23,7 +24,17 @@ async def create_examination_result(id_number:str,phone_number:str,result:str):
     await LoanPreExaminationService.create_examination_result(id_number,phone_number,result)
 
 async def main():
-    await mcp.run_streamable_http_async(host="0.0.0.0", port=8000)
+    repository = get_credit_repository()
+    try:
+        print(f"MongoDB indexes ready: {await repository.ensure_indexes()}")
+    except Exception as e:
+        # 数据库暂时不可用时仍然启动服务，查询会在数据库恢复后正常执行
+        print(f"Failed to create MongoDB indexes: {e}")
+    try:
+        await mcp.run_streamable_http_async(host="0.0.0.0", port=8000)
+    finally:
+        # 写入还在合并中的预审结果并关闭连接池
+        await repository.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
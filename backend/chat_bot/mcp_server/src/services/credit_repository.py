@@ -0,0 +1,180 @@
+import asyncio
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import ASCENDING, AsyncMongoClient, IndexModel
+from pymongo.errors import BulkWriteError
+from src.config.app_settings import get_settings
+
+CREDIT_DB = "bmw_credit_db"
+
+# 各集合需要的索引声明（与backend/utils/mongo_indexes.py中的一致）
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    # 按身份证号查询征信信息
+    "credit_information": [IndexModel([("id_number", ASCENDING)])],
+    "examination_result": [IndexModel([("id_number", ASCENDING)])],
+}
+
+# BatchInserter的停止标记（放入队列，后台任务读到后退出）
+_STOP = None
+
+
+class BatchInserter:
+    """
+    合并写入：并发的insert请求合并为一次insert_many(ordered=False)
+
+    每个调用方等待自己所在的批次写入完成，写入失败时只有对应的文档报错。
+    """
+
+    def __init__(self, collection, max_batch: int = 100, max_delay: float = 0.02):
+        """
+        参数:
+            max_batch: 一次写入的最大文档数
+            max_delay: 收到第一个文档后等待更多文档的最长时间（秒）
+        """
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: "asyncio.Queue[Optional[Tuple[Dict[str, Any], asyncio.Future]]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def insert(self, document: Dict[str, Any]):
+        """写入一个文档，写入完成后返回"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((document, future))
+        return await future
+
+    async def _next_batch(self) -> Tuple[List[Tuple[Dict[str, Any], asyncio.Future]], bool]:
+        """取得下一批文档，返回 (批次, 是否收到停止标记)"""
+        item = await self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = asyncio.get_running_loop().time() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        # 收到停止标记时写完已取出的批次后自行退出，不通过cancel()中断
+        while True:
+            batch, stop = await self._next_batch()
+            if batch:
+                await self._write(batch)
+            if stop:
+                return
+
+    async def _write(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        errors: Dict[int, BaseException] = {}
+        try:
+            # ordered=False：一个文档失败不影响同一批次的其他文档
+            await self.collection.insert_many([document for document, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                errors[error["index"]] = RuntimeError(error.get("errmsg", "write error"))
+        except asyncio.CancelledError:
+            # 写入被中断时无法确认结果，本批次的文档全部按失败处理
+            errors = {index: RuntimeError("write cancelled") for index in range(len(batch))}
+            raise
+        except Exception as e:
+            errors = {index: e for index in range(len(batch))}
+        finally:
+            # 无论写入是否完成，本批次的每个调用方都会得到结果
+            for index, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if index in errors:
+                    future.set_exception(errors[index])
+                else:
+                    future.set_result(None)
+
+    async def close(self):
+        """停止后台写入：已提交的文档全部写入后返回"""
+        if self._task is not None and not self._task.done():
+            await self._queue.put(_STOP)
+            await self._task
+        # 停止标记之后才提交的文档（或后台任务未启动时的文档）在这里写入
+        pending = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                pending.append(item)
+        if pending:
+            await self._write(pending)
+
+
+class CreditRepository:
+    """
+    预审服务的MongoDB异步数据访问层（pymongo AsyncMongoClient）
+
+    - MCP工具通过本类访问数据库，查询不会阻塞FastMCP的事件循环
+    - 所有工具调用共用一个连接池
+    - 预审结果合并为批量写入
+    """
+
+    def __init__(
+        self,
+        mongo_uri: str = "mongodb://localhost:27017",
+        max_pool_size: int = 50,
+        min_pool_size: int = 5,
+        wait_queue_timeout_ms: int = 5000,
+        server_selection_timeout_ms: int = 5000,
+        connect_timeout_ms: int = 5000,
+        socket_timeout_ms: int = 30000,
+    ):
+        """
+        参数:
+            max_pool_size: 单个进程的最大连接数
+            min_pool_size: 保持的最小空闲连接数
+            wait_queue_timeout_ms: 连接池耗尽时等待可用连接的最长时间
+            server_selection_timeout_ms: 选择可用服务器的最长时间
+            connect_timeout_ms: 建立连接的超时时间
+            socket_timeout_ms: 单次读写的超时时间
+        """
+        self.client = AsyncMongoClient(
+            mongo_uri,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            waitQueueTimeoutMS=wait_queue_timeout_ms,
+            serverSelectionTimeoutMS=server_selection_timeout_ms,
+            connectTimeoutMS=connect_timeout_ms,
+            socketTimeoutMS=socket_timeout_ms,
+        )
+        self.db = self.client[CREDIT_DB]
+        self.credit_information = self.db["credit_information"]
+        self.examination_results = self.db["examination_result"]
+        self.examination_result_writer = BatchInserter(self.examination_results)
+
+    async def ensure_indexes(self) -> List[str]:
+        """创建查询所需的索引（已存在的索引不会重复创建），返回索引名"""
+        index_names = []
+        for collection_name, indexes in INDEX_SPECS.items():
+            names = await self.db[collection_name].create_indexes(indexes)
+            index_names.extend(f"{CREDIT_DB}.{collection_name}.{name}" for name in names)
+        return index_names
+
+    async def close(self):
+        await self.examination_result_writer.close()
+        await self.client.close()
+
+    async def find_credit_info(self, id_number: str) -> Optional[Dict[str, Any]]:
+        return await self.credit_information.find_one({"id_number": id_number})
+
+    async def insert_examination_result(self, document: Dict[str, Any]):
+        await self.examination_result_writer.insert(document)
+
+
+@lru_cache(maxsize=1)
+def get_credit_repository() -> CreditRepository:
+    """预审服务的数据访问层（第一次调用时创建，之后共用）"""
+    return CreditRepository(get_settings().mongo_uri)
@@ -1,18 +1,13 @@
 from pydantic import BaseModel, Field
 from typing import Dict, List, Optional
-from pymongo import MongoClient
 from datetime import datetime
+from src.services.credit_repository import get_credit_repository
 
 # 定义返回结果的数据模型
 class CreditInfoResult(BaseModel):
     id_number: str
     credit_report: List[str] = Field(default_factory=list)
     error: Optional[str] = None
-# 连接MongoDB
-client = MongoClient('mongodb://localhost:27017/')
-db = client['bmw_credit_db']
-credit_collection = db['credit_information']
-examination_result_collection = db['examination_result']
 
 class LoanPreExaminationService:
     """Encapsulate the RAG query logic of the existing auto loan scheme"""
@@ -33,8 +28,8 @@ class LoanPreExaminationService:
                     error="身份证号不能为空"
                 ).model_dump()
             
-            # 从MongoDB查询数据
-            credit_info = credit_collection.find_one({"id_number": id_number})
+            # 从MongoDB查询数据（异步查询，不阻塞其他工具调用）
+            credit_info = await get_credit_repository().find_credit_info(id_number)
             
             if not credit_info:
                 return CreditInfoResult(
@@ -89,7 +84,8 @@ class LoanPreExaminationService:
             result: the result of the examination (e.g., "passed" or "unpassed")
         """
         try:
-            examination_result_collection.insert_one({
+            # 与同时提交的其他预审结果合并写入
+            await get_credit_repository().insert_examination_result({
                 "id_number": id_number,
                 "phone_number": phone_number,
                 "examination_result": result,
@@ -1,10 +1,33 @@
+import asyncio
+import re
+from functools import lru_cache
 from typing import Dict, Optional
+import redis
+import redis.asyncio as aioredis
 from src.config.load_key import load_key
+from src.config.app_settings import get_settings
 from langchain_redis import RedisConfig, RedisVectorStore
 from langchain_community.embeddings import DashScopeEmbeddings
+from redisvl.query import FilterQuery
+from redisvl.query.filter import Tag
 from pydantic import BaseModel, Field
 from typing import List
 
+# 贷款方案的向量索引名
+LOAN_SCHEME_INDEX = "loan_scheme"
+# 贷款方案的版本号，重新导入方案时递增（remotes/loan_suggest/rag_input.py），用于让检索结果缓存失效
+LOAN_SCHEME_VERSION_KEY = "loan_scheme:version"
+# 适用车型编号的TAG字段（由 rag_input.py 导入时从 Applicable Models 行提取）
+# 列表类型的元数据由langchain_redis按default_tag_separator拼接（默认"|"），两处必须使用同一个分隔符
+MODEL_ID_TAG_SEPARATOR = ","
+LOAN_SCHEME_METADATA_SCHEMA = [{"name": "model_id", "type": "tag", "attrs": {"separator": MODEL_ID_TAG_SEPARATOR}}]
+# 车型编号的格式，符合时先按TAG字段精确查询
+MODEL_ID_PATTERN = re.compile(r"^BMW\d+$", re.IGNORECASE)
+# 每次检索返回的方案数（可在Keys.json中用 LOAN_SCHEME_TOP_K 修改）
+LOAN_SCHEME_TOP_K = 3
+# 缓存的model_id数上限（超过时清空，防止传入大量无效model_id时无限增长）
+CACHE_MAX_ENTRIES = 1024
+
 # 定义返回结果的数据模型
 class LoanSchemeResult(BaseModel):
     model_id: str
@@ -12,57 +35,132 @@ class LoanSchemeResult(BaseModel):
     count: int = 0
     error: Optional[str] = None
 
+class LoanSchemeRetriever:
+    """
+    贷款方案检索（MCP服务内长期复用）
+
+    - 车型编号先按model_id的TAG字段精确查询，查不到或不是车型编号时才做向量检索
+    - 嵌入模型、向量库和Redis连接池只创建一次
+    - 每个model_id的查询向量和检索结果缓存在进程内
+    - 重新导入贷款方案后版本号变化，检索结果缓存随之清空
+    """
+
+    def __init__(self, redis_url: str, api_key: str, k: int = LOAN_SCHEME_TOP_K, max_connections: int = 20):
+        self.k = k
+        # 向量库（同步）和版本号查询（异步）分别使用各自的连接池
+        self.redis_client = redis.Redis(connection_pool=redis.ConnectionPool.from_url(redis_url, max_connections=max_connections))
+        self.version_client = aioredis.Redis.from_url(redis_url, max_connections=max_connections)
+        self.embeddings = DashScopeEmbeddings(model="text-embedding-v1", dashscope_api_key=api_key)
+        self.vector_store = RedisVectorStore(
+            self.embeddings,
+            config=RedisConfig(
+                index_name=LOAN_SCHEME_INDEX,
+                redis_client=self.redis_client,
+                metadata_schema=LOAN_SCHEME_METADATA_SCHEMA,
+                default_tag_separator=MODEL_ID_TAG_SEPARATOR
+            )
+        )
+        self._query_vectors: Dict[str, List[float]] = {}
+        self._results: Dict[str, List[str]] = {}
+        self._version: Optional[bytes] = None
+
+    async def _check_version(self):
+        """贷款方案重新导入过时清空检索结果缓存"""
+        version = await self.version_client.get(LOAN_SCHEME_VERSION_KEY)
+        if version != self._version:
+            self._results.clear()
+            self._version = version
+
+    async def _query_vector(self, model_id: str) -> List[float]:
+        vector = self._query_vectors.get(model_id)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(model_id)
+            if len(self._query_vectors) >= CACHE_MAX_ENTRIES:
+                self._query_vectors.clear()
+            self._query_vectors[model_id] = vector
+        return vector
+
+    def _exact_search(self, model_id: str) -> List[str]:
+        """按model_id的TAG字段精确查询（不需要计算向量）"""
+        query = FilterQuery(
+            filter_expression=Tag("model_id") == model_id.upper(),
+            return_fields=[self.vector_store.config.content_field],
+            num_results=self.k
+        )
+        return [doc[self.vector_store.config.content_field] for doc in self.vector_store.index.query(query)]
+
+    async def _vector_search(self, model_id: str) -> List[str]:
+        vector = await self._query_vector(model_id)
+        # langchain_redis的检索是同步的，在线程中执行避免阻塞事件循环
+        docs = await asyncio.to_thread(self.vector_store.similarity_search_by_vector, vector, k=self.k)
+        return [doc.page_content for doc in docs]
+
+    async def search(self, model_id: str) -> List[str]:
+        """检索model_id对应的贷款方案"""
+        await self._check_version()
+        version = self._version
+        schemes = self._results.get(model_id)
+        if schemes is not None:
+            return schemes
+
+        schemes = []
+        if MODEL_ID_PATTERN.match(model_id):
+            schemes = await asyncio.to_thread(self._exact_search, model_id)
+        if not schemes:
+            # 车型名称等模糊查询，或索引中还没有model_id字段（旧版本导入的数据）
+            schemes = await self._vector_search(model_id)
+        # 检索期间重新导入过时不写入缓存
+        if version == self._version:
+            if len(self._results) >= CACHE_MAX_ENTRIES:
+                self._results.clear()
+            self._results[model_id] = schemes
+        return schemes
+
+
+@lru_cache(maxsize=1)
+def get_loan_scheme_retriever() -> LoanSchemeRetriever:
+    """贷款方案检索服务（第一次调用时创建）"""
+    settings = get_settings()
+    return LoanSchemeRetriever(
+        settings.redis_url,
+        load_key("DASHSCOPE_API_KEY"),
+        k=int(settings.extra.get("LOAN_SCHEME_TOP_K", LOAN_SCHEME_TOP_K)),
+    )
+
 class LoanSuggestService:
     """Encapsulate the RAG query logic of the existing auto loan scheme"""
-    
+
     @staticmethod
     async def get_loan_scheme(model_id: Optional[str]) -> Dict:
         """
         Obtain the corresponding loan plan document from the Redis vector database based on the automobile model ID
-        
+
         Args:
             model_id: the automobile model ID
-            
+
         Returns:
             A dictionary containing information on loan schemes, whose structure conforms to the Loan-Schemeresult model
         """
         # 初始化结果对象
         result = LoanSchemeResult(model_id=model_id or "")
-        
+
         if not model_id:
             result.error = "model_id cannot be empty."
             return result.model_dump()
-        
+
         try:
-            # 初始化嵌入模型
-            embedding_model = DashScopeEmbeddings(
-                model="text-embedding-v1",
-                dashscope_api_key="sk-12574d385818460c84a759673209981a"
-            )
-            
-            # 配置Redis向量存储
-            redis_url = "redis://localhost:6379"
-            config = RedisConfig(
-                index_name="loan_scheme",
-                redis_url=redis_url
-            )
-            
-            # 创建向量存储实例
-            vector_store = RedisVectorStore(embedding_model, config=config)
-            
-            # 获取检索器并检索相关文档
-            retriever = vector_store.as_retriever(
-                search_kwargs={"k": 20}  # 最多返回3个最相关的结果
-            )
-            
-            # 调用检索器（使用to_thread适配同步方法为异步）
-            docs = await retriever.ainvoke(model_id)
-            
-            # 处理检索结果
-            result.schemes = [doc.page_content for doc in docs]
-            result.count = len(docs)
-            
+            # 检索相关文档（向量库、嵌入模型和Redis连接在服务内复用，结果按model_id缓存）
+            result.schemes = await get_loan_scheme_retriever().search(model_id.strip())
+            result.count = len(result.schemes)
+
         except Exception as e:
             result.error = f"Failed to get the loan scheme: {str(e)}"
-        
-        return result.model_dump()
\ No newline at end of file
+
+        return result.model_dump()
+
+
+if __name__ == "__main__":
+    # 检查按车型编号的精确查询（先用 rag_input.py 导入贷款方案），在mcp_server目录下执行：python -m src.services.loan_suggest
+    schemes = get_loan_scheme_retriever()._exact_search("BMW001")
+    assert schemes and all("BMW001" in scheme for scheme in schemes), "Exact lookup of BMW001 found no loan scheme"
+    print(f"{len(schemes)} loan schemes found for BMW001")
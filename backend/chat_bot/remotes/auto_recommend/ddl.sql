@@ -73,4 +73,10 @@ INSERT INTO bmw_car_models VALUES
 ('BMW027', 'X3 M Competition Edition', 'M Series', 'SUV', 83.99, 353, 600, 4.1, NULL, 'M xDrive all-wheel drive, M sport suspension, performance control system', 'Users seeking both performance and practicality', 'Sports driving, outdoor trips', 'Performance SUV', 'Merino Full Leather', 'Petrol'),
 
 -- Z4
-('BMW028', 'Z4 sDrive30i M Sport Package', 'Z4', 'Convertible Sports Car', 53.88, 190, 400, 5.4, NULL, 'Electric soft-top convertible, M Sport package, variable sport steering', 'Sports car enthusiasts, fashionistas', 'Leisure driving, coastal highway driving', 'Classic sporty', 'Sensatec Synthetic Leather', 'Petrol');
\ No newline at end of file
+('BMW028', 'Z4 sDrive30i M Sport Package', 'Z4', 'Convertible Sports Car', 53.88, 190, 400, 5.4, NULL, 'Electric soft-top convertible, M Sport package, variable sport steering', 'Sports car enthusiasts, fashionistas', 'Leisure driving, coastal highway driving', 'Classic sporty', 'Sensatec Synthetic Leather', 'Petrol');
+
+-- 结构化推荐查询使用的索引（按条件筛选后按价格排序）
+CREATE INDEX idx_body_type_price ON bmw_car_models (body_type, official_price);
+CREATE INDEX idx_fuel_type_price ON bmw_car_models (fuel_type, official_price);
+CREATE INDEX idx_series_price ON bmw_car_models (series, official_price);
+CREATE INDEX idx_price ON bmw_car_models (official_price);
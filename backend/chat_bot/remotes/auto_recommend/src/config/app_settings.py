@@ -0,0 +1,125 @@
+import json
+import os
+import signal
+import threading
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, Mapping, Optional
+
+# 配置文件（与本文件放在同一目录，已加入.gitignore）
+KEYS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Keys.json")
+
+# 合法的连接地址前缀
+URL_SCHEMES = {
+    "redis_url": ("redis://", "rediss://", "unix://"),
+    "mongo_uri": ("mongodb://", "mongodb+srv://"),
+}
+
+
+class SettingsError(RuntimeError):
+    """配置缺失或格式不正确"""
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    服务配置（不可变，重新加载时整体替换）
+
+    读取顺序：环境变量 > Keys.json > 默认值
+    Keys.json 中的其他键保存在 extra 中，同样可以通过环境变量覆盖
+    """
+    dashscope_api_key: Optional[str] = None
+    langsmith_api_key: Optional[str] = None
+    redis_url: str = "redis://localhost:6379"
+    mongo_uri: str = "mongodb://localhost:27017"
+    extra: Mapping[str, Any] = field(default_factory=dict)
+
+    def get(self, key: str) -> Any:
+        """按键名（如 DASHSCOPE_API_KEY）取得配置值，没有配置时抛出SettingsError"""
+        attr = key.lower()
+        if attr != "extra" and attr in self.__dataclass_fields__:
+            value = getattr(self, attr)
+        else:
+            value = self.extra.get(key)
+        if value is None or value == "":
+            raise SettingsError(f"配置文件中没有相应键: {key}（请在 {KEYS_FILE} 或环境变量 {key} 中设置）")
+        return value
+
+    @classmethod
+    def load(cls, keys_file: str = KEYS_FILE, environ: Mapping[str, str] = os.environ) -> "Settings":
+        """从Keys.json和环境变量加载并校验配置"""
+        file_values: Dict[str, Any] = {}
+        if os.path.exists(keys_file):
+            try:
+                with open(keys_file, "r", encoding="utf-8") as f:
+                    file_values = json.load(f)
+            except json.JSONDecodeError as e:
+                raise SettingsError(f"{keys_file} 不是有效的JSON: {e}") from e
+            if not isinstance(file_values, dict):
+                raise SettingsError(f"{keys_file} 的内容必须是JSON对象")
+
+        values: Dict[str, Any] = {}
+        for f in fields(cls):
+            if f.name == "extra":
+                continue
+            key = f.name.upper()
+            value = environ.get(key, file_values.get(key))
+            if value not in (None, ""):
+                if not isinstance(value, str):
+                    raise SettingsError(f"配置 {key} 必须是字符串")
+                values[f.name] = value.strip()
+
+        known_keys = {f.name.upper() for f in fields(cls)}
+        extra = {
+            key: environ.get(key, value)
+            for key, value in file_values.items()
+            if key not in known_keys
+        }
+        settings = cls(**values, extra=extra)
+        settings._validate()
+        return settings
+
+    def _validate(self):
+        for attr, schemes in URL_SCHEMES.items():
+            value = getattr(self, attr)
+            if not value.startswith(schemes):
+                raise SettingsError(f"配置 {attr.upper()} 格式不正确: {value}")
+
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """取得配置（只在第一次调用时读取文件，之后直接返回缓存）"""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = Settings.load()
+                _install_reload_signal()
+    return _settings
+
+
+def reload_settings() -> Settings:
+    """
+    重新加载配置，新配置不正确时继续使用旧配置
+    只影响之后调用 get_settings()/load_key() 的代码：启动时已按旧配置创建的对象
+    （数据库客户端、连接池、LLM客户端等）不会更新，连接地址和API密钥的修改需要重启服务
+    """
+    global _settings
+    try:
+        settings = Settings.load()
+    except SettingsError as e:
+        print(f"配置重新加载失败，继续使用原配置: {e}")
+        return _settings
+    with _settings_lock:
+        _settings = settings
+    print("配置已重新加载")
+    return settings
+
+
+def _install_reload_signal():
+    """收到SIGHUP时重新加载配置（只能在主线程注册，Windows没有SIGHUP）"""
+    if not hasattr(signal, "SIGHUP") or threading.current_thread() is not threading.main_thread():
+        return
+    signal.signal(signal.SIGHUP, lambda signum, frame: reload_settings())
@@ -0,0 +1,149 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from sqlalchemy import MetaData, Table, bindparam, select
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+CAR_MODELS_TABLE = "bmw_car_models"
+
+# 推荐结果返回的列
+RESULT_COLUMNS = (
+    "model_id", "model_name", "series", "body_type", "official_price", "engine_power",
+    "acceleration_time", "electric_range", "main_config", "suitable_people", "usage_scenario", "fuel_type",
+)
+
+# 取值固定的列（启动时读取可选值，提取条件时只接受这些值）
+OPTION_COLUMNS = ("body_type", "series", "fuel_type")
+
+# 可能包含筛选条件的关键词（预算、车身类型、燃料类型、续航），不包含时不调用LLM提取条件
+FILTER_KEYWORDS = re.compile(
+    r"\d+(\.\d+)?\s*(万|w|k|元|rmb|¥)|预算|价格|价位|以内|以下|以上|左右|budget|price|under|below|cheap|"
+    r"suv|轿车|跑车|旅行车|敞篷|mpv|sedan|coupe|convertible|hatchback|wagon|"
+    r"电动|纯电|混动|插混|燃油|汽油|柴油|新能源|续航|electric|\bev\b|hybrid|phev|petrol|gasoline|diesel|range",
+    re.IGNORECASE,
+)
+
+# 各筛选条件对应的查询条件（参数通过bindparam传入）
+FILTER_CONDITIONS: Dict[str, Callable[[Table], Any]] = {
+    "min_price": lambda t: t.c.official_price >= bindparam("min_price"),
+    "max_price": lambda t: t.c.official_price <= bindparam("max_price"),
+    "body_type": lambda t: t.c.body_type == bindparam("body_type"),
+    "series": lambda t: t.c.series == bindparam("series"),
+    "fuel_type": lambda t: t.c.fuel_type == bindparam("fuel_type"),
+    "min_electric_range": lambda t: t.c.electric_range >= bindparam("min_electric_range"),
+}
+
+
+class RecommendationFilters(BaseModel):
+    """从用户问题中提取的推荐条件"""
+
+    structured: bool = Field(
+        description="True only if the request can be answered purely by filtering cars on the fields below "
+                    "(budget, body type, series, fuel type, electric range). False if it asks about a specific model, "
+                    "compares models, or needs anything else. Conditions the user stated earlier in the conversation still apply "
+                    "unless the latest message changes them."
+    )
+    min_price: Optional[float] = Field(None, description="Minimum budget, in units of 10,000 RMB")
+    max_price: Optional[float] = Field(None, description="Maximum budget, in units of 10,000 RMB")
+    body_type: Optional[str] = Field(None, description="Body type, must be one of the allowed values")
+    series: Optional[str] = Field(None, description="Series, must be one of the allowed values")
+    fuel_type: Optional[str] = Field(None, description="Fuel type, must be one of the allowed values")
+    min_electric_range: Optional[int] = Field(None, description="Minimum pure electric range in km")
+    limit: int = Field(3, ge=1, le=10, description="Number of cars to recommend, 3 unless the user asks otherwise")
+
+    def params(self) -> Dict[str, Any]:
+        """已设定的筛选条件"""
+        return {name: getattr(self, name) for name in FILTER_CONDITIONS if getattr(self, name) is not None}
+
+
+class RecommendationQueryEngine:
+    """
+    结构化的车型推荐查询
+
+    - 按筛选条件的组合生成带参数的查询语句并缓存，不需要LLM生成SQL
+    - 查询结果按筛选条件缓存（TTL + 数量上限）
+    """
+
+    def __init__(self, engine: Engine, cache_ttl: float = 300, cache_size: int = 256):
+        self.engine = engine
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.table = Table(CAR_MODELS_TABLE, MetaData(), autoload_with=engine)
+        self.options = self._load_options()
+        self._statements: Dict[Tuple[str, ...], Any] = {}
+        self._cache: "OrderedDict[Tuple, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load_options(self) -> Dict[str, List[str]]:
+        with self.engine.connect() as conn:
+            return {
+                column: [value for value in conn.execute(select(self.table.c[column]).distinct()).scalars() if value]
+                for column in OPTION_COLUMNS
+            }
+
+    def might_filter(self, query: str) -> bool:
+        """问题中是否可能包含筛选条件（关键词或数据库中的可选值），用于跳过不需要的条件提取"""
+        if FILTER_KEYWORDS.search(query):
+            return True
+        text = query.lower()
+        # 过短的可选值（如单个字母）容易误匹配，不参与判断
+        return any(len(option) > 1 and option.lower() in text for options in self.options.values() for option in options)
+
+    def normalize(self, filters: RecommendationFilters) -> Optional[RecommendationFilters]:
+        """把取值固定的条件对应到数据库中的值（忽略大小写），无法对应时返回None"""
+        values = {}
+        for column in OPTION_COLUMNS:
+            value = getattr(filters, column)
+            if value is None:
+                continue
+            matched = next((option for option in self.options[column] if option.lower() == value.strip().lower()), None)
+            if matched is None:
+                return None
+            values[column] = matched
+        return filters.model_copy(update=values)
+
+    def _statement(self, fields: Tuple[str, ...]):
+        """按筛选条件的组合取得查询语句（同一组合只生成一次）"""
+        statement = self._statements.get(fields)
+        if statement is None:
+            statement = select(*(self.table.c[column] for column in RESULT_COLUMNS))
+            for field in fields:
+                statement = statement.where(FILTER_CONDITIONS[field](self.table))
+            # 预算范围内优先推荐价格较高（配置较好）的车型
+            statement = statement.order_by(self.table.c.official_price.desc()).limit(bindparam("limit"))
+            self._statements[fields] = statement
+        return statement
+
+    def recommend(self, filters: RecommendationFilters) -> List[Dict[str, Any]]:
+        """按筛选条件查询车型"""
+        params = filters.params()
+        key = (tuple(sorted(params.items())), filters.limit)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] > now:
+                self._cache.move_to_end(key)
+                return cached[1]
+
+        statement = self._statement(tuple(sorted(params)))
+        with self.engine.connect() as conn:
+            rows = conn.execute(statement, {**params, "limit": filters.limit}).mappings().all()
+        result = [
+            {column: float(value) if isinstance(value, Decimal) else value for column, value in row.items()}
+            for row in rows
+        ]
+        logger.info(f"Structured recommendation: {params} -> {len(result)} rows")
+
+        with self._lock:
+            self._cache[key] = (now + self.cache_ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
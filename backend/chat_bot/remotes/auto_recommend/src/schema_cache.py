@@ -0,0 +1,92 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_community.tools.sql_database.tool import InfoSQLDatabaseTool, ListSQLDatabaseTool
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# 表结构缓存的刷新间隔（秒）
+SCHEMA_REFRESH_SECONDS = 600
+
+
+class SchemaCache:
+    """
+    数据库表结构的缓存
+
+    启动时读取一次表名、表结构和示例数据，之后按固定间隔在后台线程中刷新。
+    表结构直接写入系统提示词，Agent不需要在每次对话开始时调用工具查询表和表结构。
+    """
+
+    def __init__(self, engine: Engine, refresh_seconds: float = SCHEMA_REFRESH_SECONDS):
+        self.engine = engine
+        self.refresh_seconds = refresh_seconds
+        self.db: Optional[SQLDatabase] = None
+        # (表名列表, {表名: 表结构和示例数据})，刷新时整体替换
+        self._snapshot: Tuple[List[str], Dict[str, str]] = ([], {})
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refresh()
+
+    def refresh(self):
+        """重新读取表结构（新建SQLDatabase，重新反射数据库元数据）"""
+        db = SQLDatabase(self.engine)
+        table_names = sorted(db.get_usable_table_names())
+        table_info = {name: db.get_table_info([name]) for name in table_names}
+        self.db = db
+        self._snapshot = (table_names, table_info)
+        logger.info(f"Schema cache refreshed: {', '.join(table_names)}")
+
+    @property
+    def table_names(self) -> List[str]:
+        return self._snapshot[0]
+
+    @property
+    def digest(self) -> str:
+        """所有表的表结构和示例数据（写入系统提示词）"""
+        return "\n\n".join(self._snapshot[1].values())
+
+    def table_info(self, table_names: List[str]) -> str:
+        """取得指定表的表结构，缓存中没有的表（如刚新建的表）查询数据库"""
+        cached = self._snapshot[1]
+        missing = [name for name in table_names if name not in cached]
+        parts = [cached[name] for name in table_names if name in cached]
+        if missing:
+            parts.append(self.db.get_table_info_no_throw(missing))
+        return "\n\n".join(parts)
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name="schema-cache", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                # 刷新失败时继续使用原来的缓存
+                logger.warning(f"Schema cache refresh failed: {e}")
+
+
+class CachedListSQLDatabaseTool(ListSQLDatabaseTool):
+    """sql_db_list_tables：从缓存返回表名，不查询数据库"""
+
+    schema_cache: Any = None
+
+    def _run(self, tool_input: str = "", run_manager=None) -> str:
+        return ", ".join(self.schema_cache.table_names)
+
+
+class CachedInfoSQLDatabaseTool(InfoSQLDatabaseTool):
+    """sql_db_schema：从缓存返回表结构，不查询数据库"""
+
+    schema_cache: Any = None
+
+    def _run(self, table_names: str, run_manager=None) -> str:
+        return self.schema_cache.table_info([t.strip() for t in table_names.split(",")])
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict
+from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# 连接池参数
+SQL_POOL_SIZE = 5               # 常驻连接数
+SQL_MAX_OVERFLOW = 5            # 高峰时额外允许的连接数
+SQL_POOL_TIMEOUT = 10           # 等待空闲连接的最长时间（秒）
+SQL_POOL_RECYCLE = 3600         # 连接使用超过该时间后重建（秒），避免被MySQL的wait_timeout断开
+SQL_STATEMENT_TIMEOUT_MS = 5000  # 单条查询的最长执行时间（毫秒）
+SQL_SLOW_QUERY_MS = 500         # 超过该耗时的查询输出警告日志
+
+
+class QueryMetrics:
+    """SQL查询耗时的统计（最近的查询耗时用于计算p95）"""
+
+    def __init__(self, window: int = 1000, report_every: int = 100):
+        self.report_every = report_every
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float, statement: str):
+        with self._lock:
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self._recent.append(elapsed_ms)
+            report = self.count % self.report_every == 0
+        if elapsed_ms >= SQL_SLOW_QUERY_MS:
+            logger.warning(f"Slow SQL query ({elapsed_ms:.0f} ms): {' '.join(statement.split())[:200]}")
+        if report:
+            logger.info(f"SQL query metrics: {self.snapshot()}")
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = sorted(self._recent)
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "avg_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+                "p95_ms": round(recent[int(len(recent) * 0.95) - 1], 1) if recent else 0.0,
+                "max_ms": round(self.max_ms, 1),
+            }
+
+
+def create_pooled_engine(url: str, metrics: QueryMetrics) -> Engine:
+    """创建带连接池、连接检查、查询超时和耗时统计的数据库引擎"""
+    engine = create_engine(
+        url,
+        pool_size=SQL_POOL_SIZE,
+        max_overflow=SQL_MAX_OVERFLOW,
+        pool_timeout=SQL_POOL_TIMEOUT,
+        pool_recycle=SQL_POOL_RECYCLE,
+        pool_pre_ping=True,   # 使用连接前检查是否可用，MySQL重启后自动重连
+    )
+
+    if engine.dialect.name == "mysql":
+        @event.listens_for(engine, "connect")
+        def set_statement_timeout(dbapi_connection, connection_record):
+            # MySQL只对SELECT生效，本服务只执行查询
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {SQL_STATEMENT_TIMEOUT_MS}")
+            cursor.close()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info["query_start"].pop()
+        metrics.record((time.perf_counter() - started_at) * 1000, statement)
+
+    @event.listens_for(engine, "handle_error")
+    def count_error(exception_context):
+        starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+        if starts:
+            starts.pop()
+        metrics.record_error()
+
+    return engine
+
+
+class SQLExecutor:
+    """
+    数据库查询专用的线程池
+    同步驱动的查询在这里执行，不阻塞A2A服务的事件循环，也不占用默认线程池
+    """
+
+    def __init__(self, max_workers: int = SQL_POOL_SIZE + SQL_MAX_OVERFLOW):
+        # 线程数与连接池上限一致，线程不会因等待连接而阻塞
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sql")
+
+    async def run(self, func: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class PooledQuerySQLDatabaseTool(QuerySQLDatabaseTool):
+    """sql_db_query：异步调用时在数据库专用线程池中执行"""
+
+    sql_executor: Any = None
+
+    async def _arun(self, query: str, run_manager=None) -> str:
+        return await self.sql_executor.run(self._run, query)
@@ -1,9 +1,71 @@
 from langchain_community.document_loaders import TextLoader
 import redis
 from langchain_redis import RedisConfig, RedisVectorStore
+from redisvl.exceptions import RedisSearchError
+from redisvl.index import SearchIndex
+from redisvl.query import FilterQuery
+from redisvl.query.filter import Tag
 from langchain_community.embeddings import DashScopeEmbeddings
 from dotenv import load_dotenv
 import os
+import re
+from src.config.load_key import load_key
+from src.config.app_settings import get_settings
+
+# 以下常量与mcp_server/src/services/loan_suggest.py中的一致
+LOAN_SCHEME_INDEX = "loan_scheme"
+# 贷款方案的版本号
+LOAN_SCHEME_VERSION_KEY = "loan_scheme:version"
+# 适用车型编号保存为TAG字段，按model_id精确查询
+# 列表类型的元数据由langchain_redis按default_tag_separator拼接（默认"|"），两处必须使用同一个分隔符
+MODEL_ID_TAG_SEPARATOR = ","
+LOAN_SCHEME_METADATA_SCHEMA = [{"name": "model_id", "type": "tag", "attrs": {"separator": MODEL_ID_TAG_SEPARATOR}}]
+
+APPLICABLE_MODELS_PATTERN = re.compile(r"Applicable Models:\s*(.+)")
+
+def extract_model_ids(text):
+    """
+    从贷款方案的 Applicable Models 行中提取适用车型编号
+
+    参数:
+        text: 一个贷款方案的文本
+
+    返回:
+        车型编号列表（大写），没有 Applicable Models 行时返回空列表
+    """
+    match = APPLICABLE_MODELS_PATTERN.search(text)
+    if not match:
+        return []
+    return [model_id.strip().upper() for model_id in match.group(1).split(",") if model_id.strip()]
+
+def drop_outdated_index(redis_client):
+    """旧版本创建的索引没有model_id字段，删除后按新的结构重建（原有的方案需要重新导入）"""
+    try:
+        index = SearchIndex.from_existing(LOAN_SCHEME_INDEX, redis_client=redis_client)
+    except RedisSearchError:
+        return  # 索引还不存在
+    if "model_id" not in index.schema.field_names:
+        index.delete(drop=True)
+        print(f"Dropped outdated index {LOAN_SCHEME_INDEX} without model_id field, re-ingest all loan schemes.")
+
+def check_model_id_lookup(vector_store, segment_documents, model_id="BMW001"):
+    """
+    导入后检查按model_id精确查询能否取得所有适用该车型的方案
+
+    参数:
+        vector_store: 已导入方案的向量库
+        segment_documents: 本次导入的方案
+        model_id: 用于检查的车型编号
+    """
+    expected = {doc.page_content for doc in segment_documents if model_id in doc.metadata.get("model_id", [])}
+    query = FilterQuery(
+        filter_expression=Tag("model_id") == model_id,
+        return_fields=[vector_store.config.content_field],
+        num_results=len(segment_documents)
+    )
+    found = {doc[vector_store.config.content_field] for doc in vector_store.index.query(query)}
+    if not expected <= found:
+        raise RuntimeError(f"Exact lookup of {model_id} found {len(expected & found)} of {len(expected)} loan schemes, check the model_id TAG field.")
 
 # add knowledge to RAG
 def rag_ingest(file_path="loan_scheme_V4.txt"):
@@ -11,21 +73,30 @@ def rag_ingest(file_path="loan_scheme_V4.txt"):
     loader = TextLoader(file_path,encoding='utf-8')
     documents = loader.load()
     #2、切分文档
-    import re
     from langchain_text_splitters import CharacterTextSplitter
     text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=0, separator="\n\n", keep_separator=True)
     texts = re.split(r"\n\n", documents[0].page_content)
-    segments = text_splitter.split_text(documents[0].page_content)
     segment_documents = text_splitter.create_documents(texts)
+    # 提取每个方案的适用车型编号，保存到model_id字段
+    for document in segment_documents:
+        model_ids = extract_model_ids(document.page_content)
+        if model_ids:
+            document.metadata["model_id"] = model_ids
     #3、将文档向量化，保存到Redis中
-    embedding_model = DashScopeEmbeddings(model="text-embedding-v1",dashscope_api_key="sk-12574d385818460c84a759673209981a")
-    redis_url = "redis://localhost:6379"
+    embedding_model = DashScopeEmbeddings(model="text-embedding-v1",dashscope_api_key=load_key("DASHSCOPE_API_KEY"))
+    redis_client = redis.Redis.from_url(get_settings().redis_url)
+    drop_outdated_index(redis_client)
     config = RedisConfig(
-        index_name="loan_scheme",
-        redis_url=redis_url
+        index_name=LOAN_SCHEME_INDEX,
+        redis_client=redis_client,
+        metadata_schema=LOAN_SCHEME_METADATA_SCHEMA,
+        default_tag_separator=MODEL_ID_TAG_SEPARATOR
     )
     vector_store = RedisVectorStore(embedding_model, config=config)
     vector_store.add_documents(segment_documents)
+    check_model_id_lookup(vector_store, segment_documents)
+    #4、更新版本号，MCP服务据此清空贷款方案的检索结果缓存
+    redis_client.incr(LOAN_SCHEME_VERSION_KEY)
     return f"{len(segment_documents)} documents ingested to RAG Redis."
 
 
@@ -8,6 +8,7 @@ from langchain_mcp_adapters.client import MultiServerMCPClient
 from langgraph.prebuilt import create_react_agent
 from langchain_community.chat_models import ChatTongyi
 from src.config.load_key import load_key
+from src.config.app_settings import get_settings
 from langgraph.checkpoint.redis import AsyncRedisSaver
 from langgraph.checkpoint.memory import MemorySaver
 memory = MemorySaver()
@@ -77,7 +78,7 @@ class LoanSuggestAgent:
         
 
     async def initialize(self):
-        self.checkpointer = AsyncRedisSaver("redis://localhost:6379")
+        self.checkpointer = AsyncRedisSaver(get_settings().redis_url)
         self.tools = await mcp_client.get_tools()
         self.graph = create_react_agent(
             self.model,
@@ -97,7 +98,7 @@ class LoanSuggestAgent:
 
             # 使用异步流处理(要像 LLM 产生的那样流式传输 tokens，请使用 stream_mode="messages"，需要多层协作修改)
             async for item in self.graph.astream(inputs, config, stream_mode='messages'):
-                if isinstance(item[0],AIMessageChunk):
+                if isinstance(item[0],AIMessageChunk) and item[0].content:
                     logger.info(item[0].content)
                     yield {
                         'is_task_complete': False,
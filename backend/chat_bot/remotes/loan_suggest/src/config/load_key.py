@@ -1,28 +1,9 @@
-import json
-import getpass
-import os.path
+from .app_settings import get_settings
+
+
 def load_key(keyname: str) -> object:
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    file_name = os.path.join(script_dir, "Keys.json")
-    # file_name = "Keys.json"
-    if os.path.exists(file_name):
-        with open(file_name, "r") as file:
-            Key = json.load(file)
-        if keyname in Key and Key[keyname]:
-            return Key[keyname]
-        else:
-            keyval = getpass.getpass("配置文件中没有相应键，请输入对应配置信息:").strip()
-            Key[keyname] = keyval
-            with open(file_name, "w") as file:
-                json.dump(Key, file, indent=4)
-            return keyval
-    else:
-        keyval = getpass.getpass("配置文件中没有相应键，请输入对应配置信息:").strip()
-        Key = {
-            keyname:keyval
-        }
-        with open(file_name, "w") as file:
-            json.dump(Key, file, indent=4)
-        return keyval
-if __name__ == "__main__":
-    print(load_key("LANGSMITH_API_KEY"))
\ No newline at end of file
+    """
+    取得配置项（兼容原有调用方式）
+    配置只在第一次调用时读取，之后直接返回缓存；缺少配置时抛出SettingsError，不再等待终端输入
+    """
+    return get_settings().get(keyname)
@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+current_file = Path(__file__).resolve()
+parent_parent_dir = current_file.parent.parent
+sys.path.append(str(parent_parent_dir))
+from agents.loan_structuring_agents import LoanComplianceChecker, llm
+
+# 合同检查特殊场景条款（advanced_scenarios.json）的向量索引初始化
+# 幂等：条款文件没有变化时不会重新导入，也不会调用嵌入API
+def rag_setup(force=False):
+    checker = LoanComplianceChecker(llm)
+    checker.setup_vector_index(force=force)
+    return f"Contract review index '{checker.index_name}' is ready (version {checker.index_version[:12]})."
+
+
+if __name__ == "__main__":
+    # --force: 无论条款文件是否变化都重新导入
+    print(rag_setup(force="--force" in sys.argv))
@@ -0,0 +1,27 @@
+import asyncio
+import sys
+from pathlib import Path
+current_file = Path(__file__).resolve()
+parent_parent_dir = current_file.parent.parent
+sys.path.append(str(parent_parent_dir))
+from pymongo import AsyncMongoClient
+from utils.mongo_indexes import apply_index_migration, check_query_plans
+
+# MongoDB索引迁移（全部数据库；main_for_human_in_loop.py启动时只处理自己的Auto_Finance_poc）
+# 幂等：已存在的索引不会重复创建
+async def migrate(check=False):
+    client = AsyncMongoClient("mongodb://localhost:27017", serverSelectionTimeoutMS=5000)
+    try:
+        for name in await apply_index_migration(client):
+            print(f"索引已就绪: {name}")
+        if check:
+            # 高频查询出现COLLSCAN时抛出RuntimeError
+            await check_query_plans(client)
+            print("高频查询的执行计划检查通过（无COLLSCAN）")
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    # --check: 迁移后用explain()检查高频查询的执行计划
+    asyncio.run(migrate(check="--check" in sys.argv))
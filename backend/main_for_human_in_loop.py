@@ -1,10 +1,16 @@
 import base64
 import datetime
+import re
+from contextlib import asynccontextmanager
+from urllib.parse import quote
 from bson import ObjectId
+from gridfs.errors import NoFile
 from langchain_openai import ChatOpenAI
-from workflow.loan_workflow_for_human_in_loop import LoanWorkflow
+from workflow.loan_workflow_for_human_in_loop import get_loan_workflow
 from langgraph.types import Command
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, Header, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any, Optional, List  # 保留Dict类型用于多语言
 from pymongo import MongoClient
@@ -17,13 +23,49 @@ from utils.path_utils import PROJECT_ROOT
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.append(str(PROJECT_ROOT))
 from config.load_key import load_key
+from config.app_settings import get_settings
 from utils.log_config import setup_logger
+from utils.loan_repository import LoanRepository
+from utils.document_store import DocumentStore, document_file_id
+from utils.pagination import stream_json_array
+from utils.car_catalog import CarCatalog, CatalogSnapshot
 from fastapi.middleware.cors import CORSMiddleware  # 在后端入口文件顶部导入跨域模块 # update by yan 2025/08/27 start
-from typing import Optional, List, Literal
+from typing import AsyncIterable, Optional, List, Literal
 
 # 初始化日志记录器
 logger = setup_logger()
 
+# 服务配置（Keys.json / 环境变量，只读取一次，收到SIGHUP时重新加载）
+# 注意：以下在导入时创建的对象（repository、mongoClient、llm等）使用启动时的配置，
+# SIGHUP重新加载后不会更新，修改MONGO_URI、API密钥等需要重启服务
+settings = get_settings()
+
+# API接口使用的异步数据访问层
+repository = LoanRepository(settings.mongo_uri, "Auto_Finance_poc")
+# 上传附件保存到GridFS，申请数据中只保存文件引用
+document_store = DocumentStore(repository.db)
+# 车型目录（品牌/车型/价格）缓存在进程内，按TTL或change stream刷新
+car_catalog = CarCatalog(repository.car_brands, ttl_seconds=300)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """服务启动时执行索引迁移、检查高频查询的执行计划并加载车型目录，停止时关闭连接池"""
+    try:
+        index_names = await repository.ensure_indexes()
+        logger.info(f"MongoDB索引迁移完成: {index_names}")
+        # 高频查询发生COLLSCAN时抛出RuntimeError，服务启动失败
+        await repository.check_query_plans()
+    except PyMongoError as e:
+        print(f"Failed to connect to MongoDB: {e}")
+        logger.info(f"Failed to connect to MongoDB: {e}")
+        raise
+    snapshot = await car_catalog.get()
+    logger.info(f"车型目录加载完成: {len(snapshot.brands)}个品牌（来源: {snapshot.source}）")
+    car_catalog.start_watch()
+    yield
+    await car_catalog.stop_watch()
+    await repository.close()
+
 # update by yan 2025/08/27 start
 # 初始化FastAPI时，自定义文档路径（可选）
 app = FastAPI(
@@ -32,7 +74,8 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/api-docs",  # 把/docs改成/api-docs，访问地址变成http://localhost:8000/api-docs
     #redoc_url=None,       # 关闭/redoc页面（设为None即可）
-    openapi_url="/openapi.json"  # 接口的OpenAPI schema路径（默认，一般不用改）
+    openapi_url="/openapi.json",  # 接口的OpenAPI schema路径（默认，一般不用改）
+    lifespan=lifespan
 )
 
 # 新增：跨域配置（允许前端端口访问）
@@ -42,19 +85,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # 允许所有HTTP方法（GET/POST等）
     allow_headers=["*"],  # 允许所有请求头
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "Content-Range"],  # 分页游标、总数、附件范围下载
 )
 
 # update by yan 2025/08/27 end
 
-# 连接 MongoDB
+# 连接 MongoDB（同步客户端只供工作流内的欺诈检测在线程池中使用，API接口使用repository）
 try:
-    mongoClient = MongoClient("mongodb://localhost:27017")
-    mongoDB = mongoClient["Auto_Finance_poc"]
-    collection = mongoDB["car_loan_applications"]
-    customers_collection = mongoDB["customers"]
-    # 新增：连接汽车品牌集合（关键！）
-    car_brands_collection = mongoDB["car_brands"]  # update by yan 2025/08/27
-    user_collection = mongoDB["user"] # update by WXL@20250901
+    mongoClient = MongoClient(settings.mongo_uri, maxPoolSize=20, serverSelectionTimeoutMS=5000, connectTimeoutMS=5000, socketTimeoutMS=30000)
 except PyMongoError as e:
     print(f"Failed to connect to MongoDB: {e}")
     logger.info(f"Failed to connect to MongoDB: {e}")
@@ -72,8 +110,8 @@ llm = ChatOpenAI(
 )
 logger.debug(f"初始化LLM模型: qwen-plus")
 
-# 创建工作流
-workflow = LoanWorkflow(llm, mongoClient)
+# 创建工作流（各Agent在第一次执行时才初始化）
+workflow = get_loan_workflow(llm, mongoClient)
 graph = workflow.get_graph()
 logger.info("贷款工作流初始化完成")
 
@@ -214,7 +252,7 @@ class LoanApprovalRequest(BaseModel):
 
 # 定义loan-workflow的start API端点
 @app.post('/loan-start')
-def loanStart(request: StartRequest):
+async def loanStart(request: StartRequest):
     # 记录API请求开始
     logger.info("=== 贷款申请API请求开始 ===")
     try:
@@ -228,8 +266,7 @@ def loanStart(request: StartRequest):
         logger.info(f"启动贷款申请流程，thread_id={thread_id}")
 
         # 根据App-ID从mongoDB中取得贷款申请信息
-        query = {"application_id": request.application_id}
-        document = collection.find_one(query)
+        document = await repository.find_application(request.application_id)
         if document:
             # 将 _id（ObjectId）转为字符串
             document["_id"] = str(document["_id"])
@@ -245,95 +282,102 @@ def loanStart(request: StartRequest):
             "raw_data": document,
             "thread_id": thread_id
         }
-        result = None
-        
-        # 处理流程，使用包含thread_id的配置
-        for event in graph.stream(initial_state, config):
-            for node, value in event.items():
-                logger.info(f"进入处理节点: node={node}")
-                print(f"\n处理节点: {node}")
-                # 检查是否是中断节点
-                if node == "__interrupt__":
-                    logger.warning(f"节点{node}触发人工审核中断")
-                    # 处理中断情况，提取中断信息
-                    print("\n需要人工审核:")
-                    print(f"\n处理节点value: {value}")
-                    # 安全解析中断数据
-                    interrupt_data = value[0]
-                    value_data = interrupt_data.value
-                    print(f"\nvalue_data: {value_data}")
-                    thread_id = value_data["thread_id"]
-                    print(f"\nthread_id: {thread_id}")
-                    try:
-                        # 筛选要更新的文档（通过application_id定位）
-                        query_filter = {"application_id": value_data["application_id"]}
-                        # 记录审核数据-更新项目
-                        fields_to_update = {
-                            "data_collection_status": value_data["data_collection_status"],
-                            "credit_rating_result": value_data["credit_rating_result"],
-                            "fraud_detection_status": value_data["fraud_detection_status"],
-                            "fraud_detection_result": value_data["fraud_detection_result"],
-                            "compliance_check_status": value_data["compliance_check_status"],
-                            "compliance_result": value_data["compliance_result"],
-                            "decision_result": value_data["decision_result"],
-                            "thread_id": thread_id,
-                            "status": "waiting_for_human_review"
-                        }
-                        # 使用$set操作符追加字段（若字段已存在，会覆盖旧值；若不存在，新增字段）
-                        update_operation = {"$set": fields_to_update}
-                        # 将结果更新到MongoDB
-                        result = collection.update_one(query_filter, update_operation)
-                        print(f"数据更新成功，更新的文档ID为: {value_data['application_id']}")
-                        
-                        # 返回审核请求结果
-                        return {
-                            "status": result.acknowledged and "success" or "failure",
-                            "thread_id": thread_id
-                        }
-                    except KeyError as e:
-                        # 处理value_data中缺少字段的情况
-                        raise ValueError(f"value_data中缺少必要字段: {str(e)}") from e
-                    except ValueError as e:
-                        # 处理业务逻辑错误（如未找到文档、缺少字段等）
-                        raise
-                    except Exception as e:
-                        # 处理MongoDB操作相关错误
-                        raise Exception(f"更新MongoDB数据失败: {str(e)}") from e
-                else:
-                    result = value
-                    # 安全地获取状态信息，处理可能的元组类型
-                    if isinstance(result, dict):
-                        if node == "fraud_detection":
-                            status = result.get("fraud_detection_status", "未知")
-                        elif node == "credit_rating":
-                            status = f"credit_rating: {result.get('credit_rating_result', {}).get('score', '未知')}"
-                        elif node == "compliance_check":
-                            status = result.get("compliance_check_status", "未知")
-                        else:
-                            status = result.get("status", "未知")
-                        logger.info(f"节点{node}处理完成，状态: {status}")
-                        print("状态:", status)
-                    elif isinstance(result, tuple):
-                        if len(result) > 1 and isinstance(result[1], dict):
-                            status = result[1].get("status", "未知")
-                        elif len(result) > 0:
-                            status = str(result[0])
-                        else:
-                            status = "空结果"
-                        logger.info(f"节点{node}处理完成，状态: {status}")
-                        print("状态:", status)
-                    else:
-                        status = str(result)
-                        logger.info(f"节点{node}处理完成，状态: {status}")
-                        print("状态:", status)
-        
+
+        # 工作流是同步执行的，放到线程池中运行，避免阻塞事件循环
+        value_data = await run_in_threadpool(_run_until_review_interrupt, initial_state, config)
+        if value_data is None:
+            return None
+
+        thread_id = value_data["thread_id"]
+        print(f"\nthread_id: {thread_id}")
+        try:
+            # 记录审核数据-更新项目
+            fields_to_update = {
+                "data_collection_status": value_data["data_collection_status"],
+                "credit_rating_result": value_data["credit_rating_result"],
+                "fraud_detection_status": value_data["fraud_detection_status"],
+                "fraud_detection_result": value_data["fraud_detection_result"],
+                "compliance_check_status": value_data["compliance_check_status"],
+                "compliance_result": value_data["compliance_result"],
+                "decision_result": value_data["decision_result"],
+                "thread_id": thread_id,
+                "status": "waiting_for_human_review"
+            }
+            # 使用$set操作符追加字段（若字段已存在，会覆盖旧值；若不存在，新增字段）
+            # 将结果更新到MongoDB（通过application_id定位）
+            result = await repository.update_application(value_data["application_id"], fields_to_update)
+            print(f"数据更新成功，更新的文档ID为: {value_data['application_id']}")
+
+            # 返回审核请求结果
+            return {
+                "status": result.acknowledged and "success" or "failure",
+                "thread_id": thread_id
+            }
+        except KeyError as e:
+            # 处理value_data中缺少字段的情况
+            raise ValueError(f"value_data中缺少必要字段: {str(e)}") from e
+        except ValueError as e:
+            # 处理业务逻辑错误（如未找到文档、缺少字段等）
+            raise
+        except Exception as e:
+            # 处理MongoDB操作相关错误
+            raise Exception(f"更新MongoDB数据失败: {str(e)}") from e
+
     except Exception as e:
         logger.error(f"贷款申请流程处理失败: {str(e)}", exc_info=True)
         raise  # 重新抛出异常让FastAPI处理
 
+def _run_until_review_interrupt(initial_state: Dict, config: Dict) -> Optional[Dict]:
+    """执行工作流直到人工审核中断，返回中断数据（在线程池中运行）"""
+    result = None
+    # 处理流程，使用包含thread_id的配置
+    for event in graph.stream(initial_state, config):
+        for node, value in event.items():
+            logger.info(f"进入处理节点: node={node}")
+            print(f"\n处理节点: {node}")
+            # 检查是否是中断节点
+            if node == "__interrupt__":
+                logger.warning(f"节点{node}触发人工审核中断")
+                # 处理中断情况，提取中断信息
+                print("\n需要人工审核:")
+                print(f"\n处理节点value: {value}")
+                # 安全解析中断数据
+                interrupt_data = value[0]
+                value_data = interrupt_data.value
+                print(f"\nvalue_data: {value_data}")
+                return value_data
+            else:
+                result = value
+                # 安全地获取状态信息，处理可能的元组类型
+                if isinstance(result, dict):
+                    if node == "fraud_detection":
+                        status = result.get("fraud_detection_status", "未知")
+                    elif node == "credit_rating":
+                        status = f"credit_rating: {result.get('credit_rating_result', {}).get('score', '未知')}"
+                    elif node == "compliance_check":
+                        status = result.get("compliance_check_status", "未知")
+                    else:
+                        status = result.get("status", "未知")
+                    logger.info(f"节点{node}处理完成，状态: {status}")
+                    print("状态:", status)
+                elif isinstance(result, tuple):
+                    if len(result) > 1 and isinstance(result[1], dict):
+                        status = result[1].get("status", "未知")
+                    elif len(result) > 0:
+                        status = str(result[0])
+                    else:
+                        status = "空结果"
+                    logger.info(f"节点{node}处理完成，状态: {status}")
+                    print("状态:", status)
+                else:
+                    status = str(result)
+                    logger.info(f"节点{node}处理完成，状态: {status}")
+                    print("状态:", status)
+    return None
+
 # 定义loan-workflow的resume API端点
 @app.post('/loan-approve')
-def loanApprove(request: LoanApprovalRequest):
+async def loanApprove(request: LoanApprovalRequest):
     # 记录API请求开始
     logger.info("=== 贷款申请resume API请求开始 ===")
     try:
@@ -353,83 +397,114 @@ def loanApprove(request: LoanApprovalRequest):
         }
 
         # 执行恢复流程
-        result = None
         logger.info(f"thread_id={request.thread_id},人工审核结果:{request.human_reult.lower()}")
-        
-        # 处理流程，使用包含thread_id的配置
-        for event in graph.stream(Command(resume=response_result), config):
-            for node, value in event.items():
-                logger.info(f"进入处理节点: node={node}")
-                print(f"\n处理节点: {node}")
-                result = value
-                # contract的interrupt时，进行数据存储
-                if node == "contract_completed":
-                    print(f"contract_completed node::: {node}")
-                    # 修正：通过 application_id 更新 MongoDB
-                    query_filter = {"application_id": request.application_id}
-                    update_operation = {
-                        "$set": {
-                            "loan_structuring_status": value["loan_structuring_status"],
-                            "loan_structuring_result": value["loan_structuring_result"],
-                            "contract_generation_status": value["contract_generation_status"],
-                            "contract_generation_result": value["contract_generation_result"],
-                            "contract_review_status": value["contract_review_status"],
-                            "contract_review_result": value["contract_review_result"],
-                            "contract_modify_status": value["contract_modify_status"],
-                            "contract_modify_result": value["contract_modify_result"],
-                            "contract_file_name": value["contract_file_name"],
-                            "contract_file_type": value["contract_file_type"],
-                            "contract_binary_data": value["contract_binary_data"],
-                            "status": value["status"]
-                        }
-                    }
-                    mongo_result = collection.update_one(query_filter, update_operation)
-                    if mongo_result.modified_count > 0:
-                        logger.info(f"MongoDB更新成功，application_id={request.application_id}")
-                    else:
-                        logger.warning(f"未找到申请记录，application_id={request.application_id}")
 
-                    return {"status": "success", "thread_id": request.thread_id, "result": str(result)}
-                else:
-                    result = value
-                    # 安全地获取状态信息，处理可能的元组类型
-                    if isinstance(result, dict):
-                        if node == "human_review":
-                            status = result.get("human_approval_status", "未知")
-                        else:
-                            status = result.get("status", "未知")
-                        logger.info(f"节点{node}处理完成，状态: {status}")
-                        print("状态:", status)
-                    elif isinstance(result, tuple):
-                        if len(result) > 1 and isinstance(result[1], dict):
-                            status = result[1].get("status", "未知")
-                        elif len(result) > 0:
-                            status = str(result[0])
-                        else:
-                            status = "空结果"
-                        logger.info(f"节点{node}处理完成，状态: {status}")
-                        print("状态:", status)
-                    else:
-                        status = str(result)
-                        logger.info(f"节点{node}处理完成，状态: {status}")
-                        print("状态:", status)
-        
+        # 工作流是同步执行的，放到线程池中运行，避免阻塞事件循环
+        value = await run_in_threadpool(_run_until_contract_completed, Command(resume=response_result), config)
+        if value is None:
+            return None
+
+        # contract的interrupt时，进行数据存储
+        # 修正：通过 application_id 更新 MongoDB
+        fields_to_update = {
+            "loan_structuring_status": value["loan_structuring_status"],
+            "loan_structuring_result": value["loan_structuring_result"],
+            "contract_generation_status": value["contract_generation_status"],
+            "contract_generation_result": value["contract_generation_result"],
+            "contract_review_status": value["contract_review_status"],
+            "contract_review_result": value["contract_review_result"],
+            "contract_modify_status": value["contract_modify_status"],
+            "contract_modify_result": value["contract_modify_result"],
+            "contract_file_name": value["contract_file_name"],
+            "contract_file_type": value["contract_file_type"],
+            "contract_binary_data": value["contract_binary_data"],
+            "status": value["status"]
+        }
+        mongo_result = await repository.update_application(request.application_id, fields_to_update)
+        if mongo_result.modified_count > 0:
+            logger.info(f"MongoDB更新成功，application_id={request.application_id}")
+        else:
+            logger.warning(f"未找到申请记录，application_id={request.application_id}")
+
+        return {"status": "success", "thread_id": request.thread_id, "result": str(value)}
+
     except Exception as e:
         logger.error(f"贷款申请流程处理失败: {str(e)}", exc_info=True)
         raise  # 重新抛出异常让FastAPI处理
 
+def _run_until_contract_completed(command: Command, config: Dict) -> Optional[Dict]:
+    """恢复工作流直到合同生成完成，返回contract_completed节点的结果（在线程池中运行）"""
+    result = None
+    # 处理流程，使用包含thread_id的配置
+    for event in graph.stream(command, config):
+        for node, value in event.items():
+            logger.info(f"进入处理节点: node={node}")
+            print(f"\n处理节点: {node}")
+            result = value
+            if node == "contract_completed":
+                print(f"contract_completed node::: {node}")
+                return value
+            else:
+                result = value
+                # 安全地获取状态信息，处理可能的元组类型
+                if isinstance(result, dict):
+                    if node == "human_review":
+                        status = result.get("human_approval_status", "未知")
+                    else:
+                        status = result.get("status", "未知")
+                    logger.info(f"节点{node}处理完成，状态: {status}")
+                    print("状态:", status)
+                elif isinstance(result, tuple):
+                    if len(result) > 1 and isinstance(result[1], dict):
+                        status = result[1].get("status", "未知")
+                    elif len(result) > 0:
+                        status = str(result[0])
+                    else:
+                        status = "空结果"
+                    logger.info(f"节点{node}处理完成，状态: {status}")
+                    print("状态:", status)
+                else:
+                    status = str(result)
+                    logger.info(f"节点{node}处理完成，状态: {status}")
+                    print("状态:", status)
+    return None
+
+# API路由
+# 列表接口的分页参数：每页条数与下一页游标（游标通过响应头X-Next-Cursor返回，前端按游标加载下一页）
+PAGE_LIMIT_DEFAULT = 50
+PAGE_LIMIT_MAX = 500
+
+def _paged_json_response(items: AsyncIterable[Dict], next_cursor: Optional[str], total: Optional[int] = None, transform=None) -> StreamingResponse:
+    """分页结果逐条序列化为JSON数组返回，分页信息放在响应头中"""
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+    return StreamingResponse(stream_json_array(items, transform), media_type="application/json", headers=headers)
+
 # API路由
 @app.get("/customers/pending", response_model=List[Customer], status_code=status.HTTP_200_OK)
-async def get_pending_customers():
-    """获取所有状态为pending的客户数据"""
+async def get_pending_customers(
+    limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX),
+    cursor: Optional[str] = None,
+    include_total: bool = False
+):
+    """分页获取状态为pending的客户数据"""
     try:
-        pending_customers = list(customers_collection.find({"status": "pending"}))
+        pending_customers, next_cursor = await repository.page_customers_by_status("pending", limit, cursor)
+        total = await repository.count_customers_by_status("pending") if include_total else None
+
         # 转换MongoDB的ObjectId为字符串（如果需要）
-        for customer in pending_customers:
+        def to_customer(customer: Dict) -> Dict:
             if "_id" in customer:
                 customer["id"] = str(customer["_id"])
                 del customer["_id"]
-        return pending_customers
+            return customer
+
+        return _paged_json_response(pending_customers, next_cursor, total, to_customer)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except PyMongoError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -440,7 +515,7 @@ async def get_pending_customers():
 async def get_pending_customer(customer_id: str):
     """根据ID获取特定的pending状态客户数据"""
     try:
-        customer = customers_collection.find_one({"id": customer_id, "status": "pending"})
+        customer = await repository.find_customer(customer_id, "pending")
         if not customer:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -459,91 +534,92 @@ async def get_pending_customer(customer_id: str):
         )
 
 # update by yan 2025/08/27 start
+# 车型目录接口的浏览器缓存时间（秒），过期后通过ETag重新验证
+CATALOG_CACHE_CONTROL = "public, max-age=60"
+# If-None-Match中的实体标签（"*" 或 可选W/前缀的带引号标签，逗号分隔）
+ENTITY_TAG_PATTERN = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match是否匹配当前ETag（弱比较：忽略W/前缀；"*"匹配任意ETag）"""
+    opaque_tag = etag[2:] if etag.startswith("W/") else etag
+    for tag in ENTITY_TAG_PATTERN.findall(if_none_match or ""):
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == opaque_tag:
+            return True
+    return False
+
+def _catalog_response(request: Request, snapshot: CatalogSnapshot, content: Any = None, body: Optional[bytes] = None) -> Response:
+    """车型目录接口的响应：带ETag和Cache-Control，浏览器缓存未变化时返回304"""
+    headers = {"ETag": snapshot.etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match", ""), snapshot.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if body is not None:
+        return Response(content=body, media_type="application/json", headers=headers)
+    return JSONResponse(content=content, headers=headers)
+
 # 新增：获取所有汽车品牌接口（关键！前端将调用此接口）
 @app.get("/api/car-brands", response_model=List[CarBrand], status_code=status.HTTP_200_OK)
-async def get_car_brands():
+async def get_car_brands(request: Request):
     """
-    从MongoDB获取所有汽车品牌信息
+    获取所有汽车品牌信息（从进程内的车型目录返回）
     返回格式：[{id: "xxx", name: "奔驰", country: "德国", series: ["S级",...],...},...]
     """
-    try:
-        # 1. 从MongoDB查询所有品牌数据（find()无参数表示查询全部）
-        brand_documents = list(car_brands_collection.find())
-        
-        # 2. 处理MongoDB的ObjectId：转换为字符串（前端无法解析ObjectId）
-        for brand in brand_documents:
-            brand["id"] = str(brand["_id"])  # 将ObjectId转为字符串，赋值给id字段
-            del brand["_id"]  # 删除原始的_id字段（避免前端解析错误）
-        
-        # 3. 返回处理后的数据（自动符合CarBrand模型格式）
-        return brand_documents
-    
-    # 4. 异常处理：数据库查询失败时返回500错误
-    except PyMongoError as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch car brands from MongoDB: {str(e)}"
-        )
+    snapshot = await car_catalog.get()
+    return _catalog_response(request, snapshot, body=snapshot.brands_body)
 
 # 调整：根据多语言名称查询品牌
 @app.get("/api/car-models", status_code=status.HTTP_200_OK)
-async def get_car_models(brand: str, lang: str = "zh"):
+async def get_car_models(request: Request, brand: str, lang: str = "zh"):
     """根据品牌多语言名称获取车型（支持中文/英文/日文）"""
-    try:
-        # 构建查询条件：匹配对应语言的品牌名称（如lang=zh时查询name.zh）
-        query = {f"name.{lang}": brand}
-        car_brand = car_brands_collection.find_one(query)
-        if not car_brand:
-            return []
-        
-        # 返回对应语言的车型列表（如lang=en时返回series.en）
-        return car_brand.get("series", {}).get(lang, [])
-    
-    except PyMongoError as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch car models: {str(e)}"
-        )
+    snapshot = await car_catalog.get()
+    # 返回对应语言的车型列表（如lang=en时返回series.en），品牌不存在时返回空列表
+    models = snapshot.models_by_name.get(lang, {}).get(brand, [])
+    return _catalog_response(request, snapshot, content=models)
 
 # 价格查询接口补充语言参数
 @app.get("/api/car-price", status_code=status.HTTP_200_OK)
-async def get_car_price(brand: str, model: str, lang: str = "zh"):
-    """根据品牌、车型和语言获取价格"""
-    try:
-        # 按语言查询品牌
-        # car_brand = car_brands_collection.find_one({f"name.{lang}": brand})
-        car_brand = car_brands_collection.find_one({"_id": ObjectId(brand)})  # 需要导入ObjectId
-        if not car_brand:
-            raise HTTPException(status_code=404, detail="Brand not found")
-        
-        # 匹配对应语言的车型和价格
-        series_list = car_brand["series"][lang]
-        model_index = series_list.index(model)
-        return car_brand["price"][lang][model_index]
+async def get_car_price(request: Request, brand: str, model: str, lang: str = "zh"):
+    """根据品牌ID、车型和语言获取价格"""
+    snapshot = await car_catalog.get()
+    brand_prices = snapshot.prices_by_id.get(brand)
+    if brand_prices is None:
+        raise HTTPException(status_code=404, detail="Brand not found")
     
-    except ValueError:
+    # 匹配对应语言的车型和价格
+    price = brand_prices.get(lang, {}).get(model)
+    if price is None:
         raise HTTPException(status_code=404, detail="Model not found for the brand")
-    except PyMongoError as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch car price: {str(e)}"
-        )
+    return _catalog_response(request, snapshot, content=price)
 
 # 在现有路由下方新增
 @app.post('/api/loan-application')
-def create_loan_application(application: LoanApplication):
+async def create_loan_application(application: LoanApplication):
     """创建或更新贷款申请"""
+    previous_file_ids = set()
+    # 本次请求新写入GridFS的附件，申请没有保存成功时全部删除
+    uploaded_file_ids = set()
+    saved = False
     try:
-        # 处理documents字段转换
+        is_update = bool(application.applicationId and application.applicationId.strip())
+        # 创建时生成唯一申请ID（附件按申请ID保存）
+        application_id = application.applicationId if is_update else f"APPL-{uuid.uuid4().hex[:8].upper()}"
+        if is_update:
+            previous = await repository.find_application_documents(application_id)
+            if previous:
+                previous_file_ids = _document_file_ids(previous.get("documents") or {})
+
+        # 处理documents字段转换：附件内容写入GridFS，只保存文件引用
         documents_dict = {}
-        if application.documents.idCard:
-            documents_dict["idCard"] = application.documents.idCard.model_dump()
-        if application.documents.creditReport:
-            documents_dict["creditReport"] = application.documents.creditReport.model_dump()
-        if application.documents.salarySlip:
-            documents_dict["salarySlip"] = application.documents.salarySlip.model_dump()
-        if application.documents.employmentProof:
-            documents_dict["employmentProof"] = application.documents.employmentProof.model_dump()
+        for doc_key in ("idCard", "creditReport", "salarySlip", "employmentProof"):
+            document = getattr(application.documents, doc_key)
+            if document:
+                submitted = document.model_dump()
+                try:
+                    documents_dict[doc_key] = await document_store.save_document(submitted, application_id, doc_key)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=f"附件{doc_key}（{document.name}）的内容无效: {e}")
+                if not document_file_id(submitted):
+                    uploaded_file_ids.add(documents_dict[doc_key]["file_id"])
+        current_file_ids = _document_file_ids(documents_dict)
         
         # 构建文档数据
         doc_data = {
@@ -558,47 +634,167 @@ def create_loan_application(application: LoanApplication):
         }
         
         # 检查是否有applicationId，决定执行更新还是创建操作
-        if application.applicationId and application.applicationId.strip():
+        if is_update:
             # 执行更新操作
-            result = collection.update_one(
-                {"application_id": application.applicationId},
-                {"$set": doc_data}
-            )
+            result = await repository.update_application(application_id, doc_data)
             
+            if result.matched_count == 0:
+                # 申请不存在（本次上传的附件在finally中删除）
+                return {"success": False, "message": f"未找到ID为{application_id}的贷款申请"}
+            saved = True
+            # 删除被替换掉的旧附件
+            await _delete_documents(previous_file_ids - current_file_ids)
             if result.modified_count == 1:
-                return {"success": True, "message": "贷款申请已更新", "application_id": application.applicationId}
-            elif result.matched_count == 0:
-                return {"success": False, "message": f"未找到ID为{application.applicationId}的贷款申请"}
+                return {"success": True, "message": "贷款申请已更新", "application_id": application_id}
             else:
                 return {"success": False, "message": "更新操作未成功执行"}
         else:
-            # 生成唯一申请ID，执行创建操作
-            application_id = f"APPL-{uuid.uuid4().hex[:8].upper()}"
+            # 执行创建操作
             doc_data["application_id"] = application_id
             doc_data["created_at"] = datetime.datetime.now()
             
-            result = collection.insert_one(doc_data)
+            result = await repository.insert_application(doc_data)
+            saved = True
             return {"success": True, "application_id": application_id, "id": str(result.inserted_id)}
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"处理贷款申请失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not saved:
+            # 附件无效、申请不存在或数据库写入失败时，删除本次上传的附件（沿用的旧附件不删除）
+            try:
+                await _delete_documents(uploaded_file_ids)
+            except Exception as e:
+                logger.error(f"删除未使用的附件失败: {str(e)}")
+
+def _document_file_ids(documents: Dict) -> set:
+    """取得申请附件引用的GridFS文件ID"""
+    file_ids = set()
+    for document in documents.values():
+        if isinstance(document, dict):
+            file_id = document_file_id(document)
+            if file_id:
+                file_ids.add(file_id)
+    return file_ids
+
+async def _delete_documents(file_ids: set):
+    """删除不再被申请引用的附件"""
+    for file_id in file_ids:
+        try:
+            await document_store.delete(file_id)
+        except NoFile:
+            pass
+
+def _parse_range(range_header: str, file_size: int) -> Optional[tuple]:
+    """解析单个Range请求头（bytes=start-end / bytes=start- / bytes=-suffix），范围无效时返回None"""
+    unit, _, range_spec = range_header.partition("=")
+    start_text, sep, end_text = range_spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or not sep:
+        return None
+    try:
+        if start_text == "":
+            # bytes=-N：最后N个字节
+            suffix = int(end_text)
+            if suffix <= 0:
+                return None
+            start, end = max(file_size - suffix, 0), file_size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+    except ValueError:
+        return None
+    end = min(end, file_size - 1)
+    if start < 0 or start > end:
+        return None
+    return start, end
+
+@app.get('/api/documents/{file_id}')
+async def download_document(file_id: str, range_header: Optional[str] = Header(None, alias="Range")):
+    """下载贷款申请附件（支持Range请求，按块从GridFS读取）"""
+    if not ObjectId.is_valid(file_id):
+        raise HTTPException(status_code=404, detail="附件不存在")
+    try:
+        grid_out = await document_store.open(file_id)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="附件不存在")
+
+    file_size = grid_out.length
+    metadata = grid_out.metadata or {}
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(grid_out.filename or file_id)}"
+    }
+    start, end = 0, file_size - 1
+    status_code = status.HTTP_200_OK
+    # 只处理单个范围，多个范围时返回整个文件
+    if range_header and "," not in range_header:
+        byte_range = _parse_range(range_header, file_size)
+        if byte_range is None:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="请求的范围无效",
+                headers={"Content-Range": f"bytes */{file_size}"}
+            )
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        document_store.iter_range(grid_out, start, end),
+        status_code=status_code,
+        media_type=metadata.get("content_type", "application/octet-stream"),
+        headers=headers
+    )
+
+# 示例：获取当前用户的贷款申请
+# 注意：需要定义在 /api/loan-application/{app_id} 之前，否则 my 会被当作申请ID匹配
+@app.get("/api/loan-application/my", status_code=status.HTTP_200_OK)
+async def get_my_loan_applications(
+    limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX),
+    cursor: Optional[str] = None,
+    include_total: bool = False
+):
+    try:
+        # 实际逻辑需根据用户认证获取当前用户的申请
+        query = {"application_id": "APPL-88ADD60F"}  # 伪代码
+        # 列表不返回合同文件等大字段
+        projection = {"contract_binary_data": 0}
+        my_applications, next_cursor = await repository.page_applications(query, limit, cursor, projection)
+        total = await repository.count_applications(query) if include_total else None
+
+        def to_application(app: Dict) -> Dict:
+            app["id"] = str(app["_id"])
+            del app["_id"]
+            return app
+
+        return _paged_json_response(my_applications, next_cursor, total, to_application)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except PyMongoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch my loan applications: {str(e)}"
+        )
 
 @app.get('/api/loan-application/{app_id}')
-def get_loan_application(app_id: str):
+async def get_loan_application(app_id: str):
     """获取贷款申请详情"""
-    doc = collection.find_one({"application_id": app_id})
+    doc = await repository.find_application(app_id)
     if not doc:
         raise HTTPException(status_code=404, detail="申请不存在")
     doc["_id"] = str(doc["_id"])
     return doc
 
 @app.get('/api/loan-application/{application_id}/ai-suggestion')
-def get_ai_suggestion(application_id: str):
+async def get_ai_suggestion(application_id: str):
     """获取贷款申请的AI建议"""
     try:
         # 查询申请数据
-        doc = collection.find_one({"application_id": application_id})
+        doc = await repository.find_application(application_id)
         if not doc:
             raise HTTPException(status_code=404, detail="申请不存在")
         
@@ -608,28 +804,13 @@ def get_ai_suggestion(application_id: str):
         车辆信息：{doc.get('car_selection')}
         贷款信息：{doc.get('loan_details')}
         """
-        response = llm.predict(prompt)
+        response = await llm.apredict(prompt)
         
         return {"analysis": response}
     except Exception as e:
         logger.error(f"生成AI建议失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# 示例：获取当前用户的贷款申请
-@app.get("/api/loan-application/my", status_code=status.HTTP_200_OK)
-async def get_my_loan_applications():
-    try:
-        # 实际逻辑需根据用户认证获取当前用户的申请
-        my_applications = list(collection.find({"application_id": "APPL-88ADD60F"}))  # 伪代码
-        for app in my_applications:
-            app["id"] = str(app["_id"])
-            del app["_id"]
-        return my_applications
-    except PyMongoError as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch my loan applications: {str(e)}"
-        )
 # update by yan 2025/08/27 end
 # update by WXL@20250901 Start
 # 请求模型 - 定义登录时需要的参数
@@ -677,11 +858,7 @@ async def login(login_data: LoginRequest):
     print(login_data)
     try:
         # 从数据库查询用户
-        user = user_collection.find_one({
-            "email": login_data.identifier,
-            "password": login_data.password,  # 注意：实际应用中应使用加密存储和验证
-            "role": login_data.role
-        })
+        user = await repository.find_user(login_data.identifier, login_data.password, login_data.role)
         
         if not user:
             raise HTTPException(
@@ -714,30 +891,29 @@ async def login(login_data: LoginRequest):
         )
     
 @app.get('/api/admin/loan-applications')
-def get_all_loan_applications():
-    """获取所有贷款申请，仅返回指定字段"""
+async def get_all_loan_applications(
+    limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX),
+    cursor: Optional[str] = None,
+    include_total: bool = False
+):
+    """分页获取贷款申请（按更新时间倒序），仅返回指定字段"""
     try:
-        # 查询条件：仅返回状态为"InReview"的申请
+        # 查询条件：仅返回状态为"contract_completed"的申请
         query = {"status": "contract_completed"}
-        # 查询所有贷款申请，仅返回需要的字段
-        # 投影设置：1表示返回，0表示不返回；排除_id，只保留指定字段
+        # 仅返回需要的字段（投影设置：1表示返回，0表示不返回）
         projection = {
             "application_id": 1,
             "personal_info.fullName": 1,
             "updated_at": 1,
-            "status": 1,
-            "_id": 0  # 不返回_id字段
+            "status": 1
         }
         
-        # 查询所有文档，按更新时间降序排序
-        applications = collection.find(
-            query,  # 查询条件：空表示所有文档
-            projection
-        ).sort("updated_at", -1)  # 按更新时间倒序，最新的在前
+        # 按更新时间倒序取得一页，最新的在前
+        applications, next_cursor = await repository.page_applications(query, limit, cursor, projection)
+        total = await repository.count_applications(query) if include_total else None
         
         # 处理查询结果
-        result = []
-        for app in applications:
+        def to_summary(app: Dict) -> Dict:
             # 提取嵌套的fullName（处理可能的缺失情况）
             full_name = app.get("personal_info", {}).get("fullName", "")
             
@@ -747,15 +923,17 @@ def get_all_loan_applications():
                 updated_at = updated_at.isoformat()
             
             # 构造返回字段字典
-            result.append({
+            return {
                 "application_id": app.get("application_id", ""),
                 "fullName": full_name,
                 "updated_at": updated_at,
                 "status": app.get("status", "")
-            })
+            }
         
-        return result
+        return _paged_json_response(applications, next_cursor, total, to_summary)
     
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except PyMongoError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -763,14 +941,10 @@ def get_all_loan_applications():
         )
 
 @app.get('/api/admin/loan-applications/{application_id}',response_model=AdminLoanApplicationDetail)
-def get_loan_application_details(application_id: str):
+async def get_loan_application_details(application_id: str):
     """获取单个贷款申请的详细信息（管理员视图）"""
-    # 尝试通过application_id查询
-    application = collection.find_one({"application_id": application_id})
-    
-    # 如果找不到，尝试通过ObjectId查询
-    if not application and ObjectId.is_valid(application_id):
-        application = collection.find_one({"_id": ObjectId(application_id)})
+    # 先通过application_id查询，找不到时通过ObjectId查询
+    application = await repository.find_application_by_any_id(application_id)
     
     if not application:
         raise HTTPException(status_code=404, detail="Loan application not found")
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import OperationFailure, PyMongoError
+from utils.pagination import json_default
+from utils.path_utils import PROJECT_ROOT
+
+# car_brands集合为空或无法访问时使用的初始数据
+CAR_BRANDS_SEED_PATH = PROJECT_ROOT / "init_data" / "car-brands.json"
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogSnapshot:
+    """某一时刻的车型目录（不可变，刷新时整体替换）"""
+    brands: List[Dict[str, Any]]                          # /api/car-brands 的返回数据
+    brands_body: bytes                                    # brands 序列化后的JSON
+    models_by_name: Dict[str, Dict[str, List[str]]]       # {语言: {品牌名称: [车型]}}
+    prices_by_id: Dict[str, Dict[str, Dict[str, Any]]]    # {品牌ID: {语言: {车型: 价格}}}
+    etag: str
+    source: str                                           # 数据来源（mongo / seed）
+
+
+def build_snapshot(documents: List[Dict[str, Any]], source: str) -> CatalogSnapshot:
+    """把car_brands文档整理为按语言的字典索引"""
+    brands = []
+    models_by_name: Dict[str, Dict[str, List[str]]] = {}
+    prices_by_id: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for document in documents:
+        brand = dict(document)
+        # 将ObjectId转为字符串赋值给id字段，删除原始的_id字段（前端无法解析ObjectId）
+        brand["id"] = str(brand.pop("_id", brand.get("id")))
+        brands.append(brand)
+
+        series = brand.get("series") or {}
+        price = brand.get("price") or {}
+        for lang, name in (brand.get("name") or {}).items():
+            models_by_name.setdefault(lang, {}).setdefault(name, series.get(lang, []))
+        prices = prices_by_id.setdefault(brand["id"], {})
+        for lang, models in series.items():
+            lang_prices = prices.setdefault(lang, {})
+            for model, model_price in zip(models, price.get(lang, [])):
+                # 车型重名时与原来的 list.index 一致，取第一个
+                lang_prices.setdefault(model, model_price)
+
+    brands_body = json.dumps(brands, ensure_ascii=False, default=json_default, sort_keys=True).encode("utf-8")
+    etag = f'W/"{hashlib.sha256(brands_body).hexdigest()[:32]}"'
+    return CatalogSnapshot(brands, brands_body, models_by_name, prices_by_id, etag, source)
+
+
+class CarCatalog:
+    """
+    进程内的车型目录缓存（品牌 / 车型 / 价格）
+
+    - 数据来自MongoDB的car_brands集合，集合为空或无法访问时使用init_data/car-brands.json
+    - 按TTL过期后刷新；MongoDB支持change stream（副本集）时，集合变化会立即触发刷新
+    - 每个快照带有ETag，接口据此支持浏览器的条件请求（If-None-Match）
+    """
+
+    def __init__(self, collection: AsyncCollection, ttl_seconds: float = 300):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+
+    async def get(self) -> CatalogSnapshot:
+        """取得当前快照，过期时重新加载（并发请求只加载一次）"""
+        if self._snapshot is not None and time.monotonic() < self._expires_at:
+            return self._snapshot
+        async with self._lock:
+            if self._snapshot is None or time.monotonic() >= self._expires_at:
+                await self.refresh()
+        return self._snapshot
+
+    async def refresh(self):
+        """从MongoDB重新加载，失败时保留旧快照（没有旧快照时使用初始数据）"""
+        try:
+            documents = await self.collection.find().to_list()
+            if documents:
+                self._set_snapshot(build_snapshot(documents, "mongo"))
+                return
+            print("car_brands集合为空，使用car-brands.json")
+        except PyMongoError as e:
+            print(f"加载车型目录失败: {e}")
+            if self._snapshot is not None:
+                # 短时间后重试，期间继续使用旧快照
+                self._expires_at = time.monotonic() + min(self.ttl_seconds, 30)
+                return
+        self._set_snapshot(build_snapshot(self._load_seed(), "seed"))
+
+    def invalidate(self):
+        """让当前快照立即过期，下次请求时重新加载"""
+        self._expires_at = 0.0
+
+    def start_watch(self):
+        """启动change stream监听（服务启动时调用）"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop_watch(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    async def _watch(self):
+        while True:
+            try:
+                async with await self.collection.watch() as stream:
+                    async for _ in stream:
+                        self.invalidate()
+            except OperationFailure as e:
+                # 单机MongoDB不支持change stream，只依靠TTL刷新
+                print(f"car_brands不支持change stream，按TTL({self.ttl_seconds}秒)刷新: {e}")
+                return
+            except PyMongoError as e:
+                # 连接中断期间可能漏掉变化，重连前让快照过期
+                print(f"car_brands change stream中断，稍后重连: {e}")
+                self.invalidate()
+                await asyncio.sleep(5)
+
+    def _set_snapshot(self, snapshot: CatalogSnapshot):
+        self._snapshot = snapshot
+        self._expires_at = time.monotonic() + self.ttl_seconds
+
+    @staticmethod
+    def _load_seed() -> List[Dict[str, Any]]:
+        with open(CAR_BRANDS_SEED_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
@@ -0,0 +1,112 @@
+import base64
+import io
+import re
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from bson import ObjectId
+from gridfs import AsyncGridFSBucket, GridFSBucket
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.database import Database
+
+# 上传附件使用的GridFS bucket名
+DOCUMENT_BUCKET_NAME = "loan_documents"
+# 附件下载地址前缀（前端通过该地址查看附件）
+DOCUMENT_URL_PREFIX = "/api/documents/"
+
+DATA_URL_PATTERN = re.compile(r"^data:(?P<content_type>[\w.+-]+/[\w.+-]+)?(;[\w-]+=[\w.-]+)*;base64,", re.IGNORECASE)
+
+
+def parse_data_url(url: str) -> Tuple[str, bytes]:
+    """解析base64的data-URL，返回 (content_type, 二进制数据)"""
+    match = DATA_URL_PATTERN.match(url or "")
+    if not match:
+        raise ValueError("不是base64格式的data-URL")
+    content_type = match.group("content_type") or "application/octet-stream"
+    return content_type, base64.b64decode(url[match.end():])
+
+
+def document_file_id(document: Dict[str, Any]) -> Optional[str]:
+    """取得附件引用的GridFS文件ID，没有引用（旧数据直接保存data-URL）时返回None"""
+    if document.get("file_id"):
+        return document["file_id"]
+    url = document.get("url") or ""
+    if url.startswith(DOCUMENT_URL_PREFIX) and ObjectId.is_valid(url[len(DOCUMENT_URL_PREFIX):]):
+        return url[len(DOCUMENT_URL_PREFIX):]
+    return None
+
+
+class DocumentStore:
+    """
+    贷款申请附件的GridFS存储（API接口使用，异步）
+
+    - 上传的附件按块写入GridFS，申请数据中只保存文件ID和下载地址
+    - 下载时按块读取，支持从指定位置开始读取（HTTP Range请求）
+    """
+
+    def __init__(self, db: AsyncDatabase, bucket_name: str = DOCUMENT_BUCKET_NAME):
+        self.bucket = AsyncGridFSBucket(db, bucket_name=bucket_name)
+
+    async def save_document(self, document: Dict[str, Any], application_id: str, doc_key: str) -> Dict[str, Any]:
+        """
+        保存附件，返回申请数据中保存的附件引用
+
+        参数:
+            document: 前端提交的附件（id, name, type, url）
+            application_id: 附件所属的申请ID
+            doc_key: 附件种类（idCard, creditReport, salarySlip, employmentProof）
+        """
+        file_id = document_file_id(document)
+        if file_id:
+            # 已经保存过的附件（更新申请时原样提交），沿用原来的文件
+            return {**document, "file_id": file_id, "url": f"{DOCUMENT_URL_PREFIX}{file_id}"}
+
+        content_type, data = parse_data_url(document.get("url"))
+        file_oid = await self.bucket.upload_from_stream(
+            document.get("name") or doc_key,
+            io.BytesIO(data),
+            metadata={
+                "application_id": application_id,
+                "doc_key": doc_key,
+                "content_type": content_type,
+            },
+        )
+        return {
+            "id": document.get("id"),
+            "name": document.get("name"),
+            "type": document.get("type"),
+            "url": f"{DOCUMENT_URL_PREFIX}{file_oid}",
+            "file_id": str(file_oid),
+            "content_type": content_type,
+            "size": len(data),
+        }
+
+    async def open(self, file_id: str):
+        """打开附件的下载流（文件不存在时抛出gridfs.errors.NoFile）"""
+        return await self.bucket.open_download_stream(ObjectId(file_id))
+
+    async def iter_range(self, grid_out, start: int, end: int, chunk_size: int = 256 * 1024) -> AsyncIterator[bytes]:
+        """按块读取附件中 [start, end] 范围的内容"""
+        await grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = await grid_out.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+    async def delete(self, file_id: str):
+        await self.bucket.delete(ObjectId(file_id))
+
+
+class DocumentReader:
+    """贷款申请附件的读取（工作流使用，同步），附件在需要解析时才从GridFS读取"""
+
+    def __init__(self, db: Database, bucket_name: str = DOCUMENT_BUCKET_NAME):
+        self.bucket = GridFSBucket(db, bucket_name=bucket_name)
+
+    def read(self, document: Dict[str, Any]) -> bytes:
+        """读取附件的二进制数据（兼容直接保存data-URL的旧数据）"""
+        file_id = document_file_id(document)
+        if file_id:
+            return self.bucket.open_download_stream(ObjectId(file_id)).read()
+        return parse_data_url(document.get("url"))[1]
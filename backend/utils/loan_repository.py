@@ -0,0 +1,134 @@
+from typing import Any, AsyncIterable, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient
+from utils.mongo_indexes import apply_index_migration, check_query_plans
+from utils.pagination import SortSpec, count_documents, fetch_page
+
+# 列表接口的排序（游标分页的键），需要有对应的索引（见utils.mongo_indexes.INDEX_SPECS）
+APPLICATION_LIST_SORT: SortSpec = [("updated_at", DESCENDING), ("_id", DESCENDING)]
+CUSTOMER_LIST_SORT: SortSpec = [("_id", ASCENDING)]
+
+
+class LoanRepository:
+    """
+    贷款服务的MongoDB异步数据访问层（pymongo AsyncMongoClient）
+
+    - API接口通过本类访问数据库，查询不会阻塞事件循环
+    - 连接池大小与各类超时可配置，数据库故障时请求快速失败而不是无限等待
+    - ensure_indexes 在服务启动时执行索引迁移，创建接口查询所需的索引（只处理本服务的数据库，
+      其他服务的数据库由 init_data/mongo_index_migration.py 处理）
+    """
+
+    def __init__(
+        self,
+        mongo_uri: str = "mongodb://localhost:27017",
+        db_name: str = "Auto_Finance_poc",
+        max_pool_size: int = 50,
+        min_pool_size: int = 5,
+        max_idle_time_ms: int = 60000,
+        wait_queue_timeout_ms: int = 5000,
+        server_selection_timeout_ms: int = 5000,
+        connect_timeout_ms: int = 5000,
+        socket_timeout_ms: int = 30000,
+    ):
+        """
+        参数:
+            max_pool_size: 单个进程的最大连接数
+            min_pool_size: 保持的最小空闲连接数
+            max_idle_time_ms: 空闲连接的最长保留时间
+            wait_queue_timeout_ms: 连接池耗尽时等待可用连接的最长时间
+            server_selection_timeout_ms: 选择可用服务器的最长时间
+            connect_timeout_ms: 建立连接的超时时间
+            socket_timeout_ms: 单次读写的超时时间
+        """
+        self.client = AsyncMongoClient(
+            mongo_uri,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            maxIdleTimeMS=max_idle_time_ms,
+            waitQueueTimeoutMS=wait_queue_timeout_ms,
+            serverSelectionTimeoutMS=server_selection_timeout_ms,
+            connectTimeoutMS=connect_timeout_ms,
+            socketTimeoutMS=socket_timeout_ms,
+        )
+        self.db = self.client[db_name]
+        self.applications = self.db["car_loan_applications"]
+        self.customers = self.db["customers"]
+        self.car_brands = self.db["car_brands"]
+        self.users = self.db["user"]
+
+    async def ensure_indexes(self) -> List[str]:
+        """执行本服务数据库的索引迁移（索引声明见utils.mongo_indexes.INDEX_SPECS），返回索引名"""
+        return await apply_index_migration(self.client, [self.db.name])
+
+    async def check_query_plans(self):
+        """本服务数据库的高频查询出现全表扫描（COLLSCAN）时抛出RuntimeError"""
+        await check_query_plans(self.client, [self.db.name])
+
+    async def ping(self):
+        """检查数据库连接"""
+        await self.client.admin.command("ping")
+
+    async def close(self):
+        await self.client.close()
+
+    # ---------- 贷款申请 ----------
+    async def find_application(self, application_id: str) -> Optional[Dict[str, Any]]:
+        return await self.applications.find_one({"application_id": application_id})
+
+    async def find_application_by_any_id(self, application_id: str) -> Optional[Dict[str, Any]]:
+        """先按application_id查询，找不到时按ObjectId查询"""
+        application = await self.find_application(application_id)
+        if not application and ObjectId.is_valid(application_id):
+            application = await self.applications.find_one({"_id": ObjectId(application_id)})
+        return application
+
+    async def find_application_documents(self, application_id: str) -> Optional[Dict[str, Any]]:
+        """只取得申请的附件引用"""
+        return await self.applications.find_one({"application_id": application_id}, {"documents": 1})
+
+    async def insert_application(self, doc_data: Dict[str, Any]):
+        return await self.applications.insert_one(doc_data)
+
+    async def update_application(self, application_id: str, fields: Dict[str, Any]):
+        return await self.applications.update_one(
+            {"application_id": application_id},
+            {"$set": fields}
+        )
+
+    async def page_applications(
+        self,
+        query: Dict[str, Any],
+        limit: int,
+        cursor: Optional[str] = None,
+        projection: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[AsyncIterable[Dict[str, Any]], Optional[str]]:
+        """按更新时间倒序分页取得贷款申请，返回 (数据库游标, 下一页游标)"""
+        return await fetch_page(self.applications, query, APPLICATION_LIST_SORT, limit, cursor, projection)
+
+    async def count_applications(self, query: Dict[str, Any]) -> Optional[int]:
+        return await count_documents(self.applications, query)
+
+    # ---------- 客户 ----------
+    async def page_customers_by_status(
+        self,
+        status: str,
+        limit: int,
+        cursor: Optional[str] = None,
+    ) -> Tuple[AsyncIterable[Dict[str, Any]], Optional[str]]:
+        """分页取得指定状态的客户，返回 (数据库游标, 下一页游标)"""
+        return await fetch_page(self.customers, {"status": status}, CUSTOMER_LIST_SORT, limit, cursor)
+
+    async def count_customers_by_status(self, status: str) -> Optional[int]:
+        return await count_documents(self.customers, {"status": status})
+
+    async def find_customer(self, customer_id: str, status: str) -> Optional[Dict[str, Any]]:
+        return await self.customers.find_one({"id": customer_id, "status": status})
+
+    # ---------- 用户 ----------
+    async def find_user(self, email: str, password: str, role: str) -> Optional[Dict[str, Any]]:
+        return await self.users.find_one({
+            "email": email,
+            "password": password,  # 注意：实际应用中应使用加密存储和验证
+            "role": role
+        })
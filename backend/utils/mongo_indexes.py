@@ -0,0 +1,100 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient, IndexModel
+
+# 各集合需要的索引声明：{(数据库, 集合): [索引]}
+# 索引名使用MongoDB默认命名（由键生成），重复执行时不会产生冲突
+INDEX_SPECS: Dict[Tuple[str, str], List[IndexModel]] = {
+    ("Auto_Finance_poc", "car_loan_applications"): [
+        # 按申请编号查询（启动流程、详情、更新）
+        IndexModel([("application_id", ASCENDING)]),
+        # 管理员列表：按状态筛选并按更新时间倒序（_id用于游标分页）
+        IndexModel([("status", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    ("Auto_Finance_poc", "customers"): [
+        IndexModel([("status", ASCENDING), ("id", ASCENDING)]),
+        # 客户列表：按状态筛选，按_id游标分页
+        IndexModel([("status", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    ("Auto_Finance_poc", "user"): [
+        IndexModel([("email", ASCENDING), ("role", ASCENDING)]),
+    ],
+    # 预审服务的征信信息
+    ("bmw_credit_db", "credit_information"): [
+        IndexModel([("id_number", ASCENDING)]),
+    ],
+    ("bmw_credit_db", "examination_result"): [
+        IndexModel([("id_number", ASCENDING)]),
+    ],
+    # 欺诈检测的黑名单
+    ("Auto_Finance", "BlackNameList"): [
+        IndexModel([("idNumber", ASCENDING)]),
+    ],
+}
+
+# 需要走索引的高频查询：(数据库, 集合, 查询条件, 排序)
+# 查询条件只用于生成执行计划，取值不影响结果
+HOT_QUERIES: List[Tuple[str, str, Dict[str, Any], List]] = [
+    ("Auto_Finance_poc", "car_loan_applications", {"application_id": "APPL-00000000"}, []),
+    ("Auto_Finance_poc", "car_loan_applications", {"_id": ObjectId("000000000000000000000000")}, []),
+    ("Auto_Finance_poc", "car_loan_applications", {"status": "contract_completed"}, [("updated_at", DESCENDING), ("_id", DESCENDING)]),
+    ("Auto_Finance_poc", "customers", {"id": "0", "status": "pending"}, []),
+    ("Auto_Finance_poc", "customers", {"status": "pending"}, [("_id", ASCENDING)]),
+    ("Auto_Finance_poc", "user", {"email": "user@gmail.com", "password": "", "role": "user"}, []),
+    ("bmw_credit_db", "credit_information", {"id_number": "110101199001010000"}, []),
+    ("Auto_Finance", "BlackNameList", {"idNumber": "110101199001010000"}, []),
+]
+
+
+async def apply_index_migration(client: AsyncMongoClient, db_names: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    按INDEX_SPECS创建索引（已存在的索引不会重复创建），返回声明的索引名
+
+    参数:
+        db_names: 只处理这些数据库的索引，None时处理全部
+    """
+    index_names = []
+    for (db_name, collection_name), indexes in INDEX_SPECS.items():
+        if db_names is not None and db_name not in db_names:
+            continue
+        names = await client[db_name][collection_name].create_indexes(indexes)
+        index_names.extend(f"{db_name}.{collection_name}.{name}" for name in names)
+    return index_names
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    """递归取出执行计划中的所有stage（兼容inputStage/inputStages/queryPlan等嵌套结构）"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def find_collscan_queries(client: AsyncMongoClient, db_names: Optional[Iterable[str]] = None) -> List[str]:
+    """对HOT_QUERIES执行explain()，返回胜出计划中包含COLLSCAN的查询（db_names同上）"""
+    violations = []
+    for db_name, collection_name, query, sort in HOT_QUERIES:
+        if db_names is not None and db_name not in db_names:
+            continue
+        cursor = client[db_name][collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            sort_text = f" sort={sort}" if sort else ""
+            violations.append(f"{db_name}.{collection_name} {query}{sort_text}")
+    return violations
+
+
+async def check_query_plans(client: AsyncMongoClient, db_names: Optional[Iterable[str]] = None):
+    """高频查询出现全表扫描（COLLSCAN）时抛出RuntimeError（db_names同上）"""
+    violations = await find_collscan_queries(client, db_names)
+    if violations:
+        raise RuntimeError("以下查询发生了COLLSCAN: " + "; ".join(violations))
@@ -0,0 +1,143 @@
+import base64
+import datetime
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import PyMongoError
+
+# 排序条件：[(字段, 方向)]，最后一个字段必须唯一（通常是_id），保证翻页不重复不遗漏
+SortSpec = List[Tuple[str, int]]
+
+
+def json_default(value: Any):
+    """JSON序列化MongoDB文档中的datetime和ObjectId"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime.datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    return value
+
+
+def _decode_value(value: Any):
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.datetime.fromisoformat(value["$date"])
+    if isinstance(value, dict) and "$oid" in value:
+        return ObjectId(value["$oid"])
+    return value
+
+
+def encode_cursor(document: Dict[str, Any], sort: SortSpec) -> str:
+    """把一页最后一条数据的排序字段值编码为下一页的游标"""
+    values = [_encode_value(document.get(field)) for field, _ in sort]
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: SortSpec) -> List[Any]:
+    """解析游标，游标格式不正确时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = [_decode_value(value) for value in json.loads(raw)]
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+    if len(values) != len(sort):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return values
+
+
+def keyset_filter(sort: SortSpec, values: List[Any]) -> Dict[str, Any]:
+    """
+    生成“排在游标之后”的查询条件
+    例：sort=[(a, 降序), (_id, 降序)] 时为 a < v0 或 (a == v0 且 _id < v1)
+
+    MongoDB中null和缺失的字段比其他值都小（升序在最前，降序在最后），
+    比较运算符$lt/$gt不会匹配null，这里单独处理：
+    - 降序、游标值非null：a < v0 或 a为null
+    - 降序、游标值为null：之后只有同为null的数据，由后面的字段（_id）决定
+    - 升序、游标值为null：a不为null，或同为null时由后面的字段决定
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        # 前面的字段取值相同（{字段: None} 同时匹配null和缺失）
+        clause = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        value = values[i]
+        if value is None:
+            if direction != ASCENDING:
+                continue
+            clause[field] = {"$ne": None}
+        elif direction == ASCENDING:
+            clause[field] = {"$gt": value}
+        else:
+            clause["$or"] = [{field: {"$lt": value}}, {field: None}]
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+async def fetch_page(
+    collection: AsyncCollection,
+    query: Dict[str, Any],
+    sort: SortSpec,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> Tuple[AsyncIterable[Dict[str, Any]], Optional[str]]:
+    """
+    按游标（keyset）取得一页数据，返回 (数据库游标, 下一页游标)；没有下一页时游标为None
+    查询走排序字段上的索引，耗时只与页大小有关，与集合大小无关
+
+    1. 先只查询排序字段（索引覆盖，不读取文档）找到本页最后一条，生成下一页游标
+    2. 本页数据在输出响应时从数据库游标逐条读取，不在内存中拼接整页
+    本页的查询条件限定在下一页游标位置及之前，与下一页的条件互补，两次查询之间有新数据写入时也不重复不遗漏
+    """
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(cursor, sort))]}
+    # 取本页最后一条和它之后的一条（后者用于判断是否还有下一页）
+    sort_projection = {field: 1 for field, _ in sort}
+    boundary = await collection.find(query, sort_projection).sort(sort).skip(limit - 1).limit(2).to_list()
+    if len(boundary) < 2:
+        # 最后一页
+        return collection.find(query, projection).sort(sort).limit(limit), None
+    next_cursor = encode_cursor(boundary[0], sort)
+    last_values = [boundary[0].get(field) for field, _ in sort]
+    page_query = {"$and": [query, {"$nor": [keyset_filter(sort, last_values)]}]}
+    return collection.find(page_query, projection).sort(sort), next_cursor
+
+
+async def count_documents(collection: AsyncCollection, query: Dict[str, Any], max_time_ms: int = 2000) -> Optional[int]:
+    """
+    取得查询结果的总数（可选功能）
+    没有查询条件时使用集合元数据的估算值；计数超时时返回None
+    """
+    try:
+        if not query:
+            return await collection.estimated_document_count(maxTimeMS=max_time_ms)
+        return await collection.count_documents(query, maxTimeMS=max_time_ms)
+    except PyMongoError as e:
+        print(f"统计数据总数失败: {e}")
+        return None
+
+
+async def stream_json_array(
+    items: AsyncIterable[Dict[str, Any]],
+    transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> AsyncIterator[bytes]:
+    """从数据库游标逐条读取并序列化为JSON数组输出，不需要先读取整页数据或拼接完整的响应体"""
+    yield b"["
+    first = True
+    async for item in items:
+        if transform:
+            item = transform(item)
+        prefix = b"" if first else b","
+        first = False
+        yield prefix + json.dumps(item, ensure_ascii=False, default=json_default).encode("utf-8")
+    yield b"]"
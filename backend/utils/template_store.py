@@ -0,0 +1,141 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from jinja2 import Environment, Template
+
+
+class ContractTemplateStore:
+    """
+    合同模板版本存储（写时复制）
+
+    - 基础模板（init_data/loan_template/loan_contract_template.jinja2）只读，所有申请共用
+    - 修改后的模板按内容哈希保存为不可变版本：<store_dir>/versions/<hash>.jinja2
+    - 每个申请通过引用文件 <store_dir>/refs/<application_id> 指向自己的版本，没有引用时使用基础模板
+    - 编译后的Jinja2模板按版本缓存（版本不可变，缓存无需失效）
+    - 没有被任何申请引用的版本可通过 collect_garbage 删除
+    """
+
+    def __init__(self, base_template_path: str, store_dir: str, cache_size: int = 32):
+        self.base_template_path = base_template_path
+        self.versions_dir = os.path.join(store_dir, "versions")
+        self.refs_dir = os.path.join(store_dir, "refs")
+        self.cache_size = cache_size
+        self._env = Environment(autoescape=True)
+        self._lock = threading.RLock()
+        self._compiled_cache: "OrderedDict[str, Template]" = OrderedDict()  # {版本: 编译后的模板}
+        self._base_cache_key = None  # 基础模板文件的 (mtime, size)
+        self._base_version = None
+        self._base_source = None
+
+    @staticmethod
+    def compute_version(source: str) -> str:
+        """模板内容的哈希即版本号"""
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def base_version(self) -> str:
+        """基础模板的版本号（文件未变化时不重复读取）"""
+        with self._lock:
+            stat = os.stat(self.base_template_path)
+            cache_key = (stat.st_mtime_ns, stat.st_size)
+            if cache_key != self._base_cache_key:
+                with open(self.base_template_path, "r", encoding="utf-8") as f:
+                    self._base_source = f.read()
+                self._base_version = self.compute_version(self._base_source)
+                self._base_cache_key = cache_key
+            return self._base_version
+
+    def get_version(self, application_id: Optional[str] = None) -> str:
+        """取得申请当前使用的模板版本，没有修改过的申请使用基础模板"""
+        if application_id:
+            ref_path = self._ref_path(application_id)
+            if os.path.exists(ref_path):
+                with open(ref_path, "r", encoding="utf-8") as f:
+                    return f.read().strip()
+        return self.base_version()
+
+    def get_source(self, version: str) -> str:
+        """取得指定版本的模板内容（优先读取保存的版本文件，基础模板之后被修改也能取得原来的内容）"""
+        version_path = self._version_path(version)
+        if os.path.exists(version_path):
+            with open(version_path, "r", encoding="utf-8") as f:
+                return f.read()
+        with self._lock:
+            if version == self.base_version():
+                return self._base_source
+        raise FileNotFoundError(f"合同模板版本不存在: {version}")
+
+    def get_compiled(self, version: str) -> Template:
+        """取得编译后的模板（按版本LRU缓存）"""
+        with self._lock:
+            template = self._compiled_cache.get(version)
+            if template is not None:
+                self._compiled_cache.move_to_end(version)
+                return template
+        template = self._env.from_string(self.get_source(version))
+        with self._lock:
+            self._compiled_cache[version] = template
+            self._compiled_cache.move_to_end(version)
+            while len(self._compiled_cache) > self.cache_size:
+                self._compiled_cache.popitem(last=False)
+        return template
+
+    def commit(self, application_id: str, source: str) -> str:
+        """保存修改后的模板为新版本（内容相同则复用），并让申请引用该版本"""
+        version = self.compute_version(source)
+        with self._lock:
+            # 与基础模板内容相同时也保存版本文件：基础模板文件之后被修改，该申请仍能取得原来的模板
+            version_path = self._version_path(version)
+            if not os.path.exists(version_path):
+                self._atomic_write(version_path, source)
+            self._atomic_write(self._ref_path(application_id), version)
+        return version
+
+    def release(self, application_id: str):
+        """删除申请的模板引用，之后该申请使用基础模板"""
+        with self._lock:
+            ref_path = self._ref_path(application_id)
+            if os.path.exists(ref_path):
+                os.remove(ref_path)
+
+    def collect_garbage(self) -> int:
+        """删除没有被任何申请引用的版本，返回删除的版本数"""
+        with self._lock:
+            if not os.path.isdir(self.versions_dir):
+                return 0
+            referenced = set()
+            if os.path.isdir(self.refs_dir):
+                for ref_name in os.listdir(self.refs_dir):
+                    with open(os.path.join(self.refs_dir, ref_name), "r", encoding="utf-8") as f:
+                        referenced.add(f.read().strip())
+            removed = 0
+            for file_name in os.listdir(self.versions_dir):
+                version, ext = os.path.splitext(file_name)
+                if ext == ".jinja2" and version not in referenced:
+                    os.remove(os.path.join(self.versions_dir, file_name))
+                    self._compiled_cache.pop(version, None)
+                    removed += 1
+            return removed
+
+    def _version_path(self, version: str) -> str:
+        return os.path.join(self.versions_dir, f"{version}.jinja2")
+
+    def _ref_path(self, application_id: str) -> str:
+        # 申请ID只保留文件名安全的字符
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", application_id)
+        return os.path.join(self.refs_dir, safe_id)
+
+    def _atomic_write(self, path: str, content: str):
+        """先写临时文件再替换，避免并发读取到写了一半的文件"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
@@ -0,0 +1,32 @@
+import argparse
+import sys
+from pathlib import Path
+current_file = Path(__file__).resolve()
+parent_parent_dir = current_file.parent.parent
+sys.path.append(str(parent_parent_dir))
+from langgraph.checkpoint.memory import InMemorySaver
+from workflow.loan_workflow_for_human_in_loop import LoanWorkflow
+
+# 导出贷款工作流的流程图
+# draw_mermaid_png 需要访问 mermaid.ink 在线渲染，所以不在服务启动时执行
+# 构建流程图不需要LLM、MongoDB和Redis
+def export_graph(output: str, mermaid: bool = False) -> str:
+    workflow = LoanWorkflow(llm=None, mongoClient=None, checkpointer=InMemorySaver())
+    graph = workflow.get_graph().get_graph()
+    if mermaid:
+        # 只输出mermaid文本，不需要网络
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(graph.draw_mermaid())
+    else:
+        with open(output, "wb") as f:
+            f.write(graph.draw_mermaid_png())
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出贷款工作流的流程图")
+    parser.add_argument("-o", "--output", default=None, help="输出文件（默认 Auto_Finance_POC.png / Auto_Finance_POC.mmd）")
+    parser.add_argument("--mermaid", action="store_true", help="输出mermaid文本而不是PNG（离线可用）")
+    args = parser.parse_args()
+    output = args.output or ("Auto_Finance_POC.mmd" if args.mermaid else "Auto_Finance_POC.png")
+    print(f"流程图已导出: {export_graph(output, args.mermaid)}")
@@ -23,17 +23,22 @@ from langgraph.types import interrupt
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.checkpoint.redis import RedisSaver
 from redisvl.index import SearchIndex
+from pymongo import MongoClient
+from config.app_settings import get_settings
+from utils.document_store import DocumentReader
 
 class LoanWorkflow:
 
-    def __init__(self, llm: BaseChatModel):
+    def __init__(self, llm: BaseChatModel, mongoClient=None):
         # 初始化Agent
         # 设置Redis环境变量，解决REDIS_URL未设置的问题
         os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
-        self.data_collect_agent = DataCollectAgent()
+        # 上传的附件保存在GridFS中，数据收集Agent通过DocumentReader读取（与loan_workflow_for_human_in_loop相同）
+        self.mongoClient = mongoClient or MongoClient(get_settings().mongo_uri, serverSelectionTimeoutMS=5000)
+        self.data_collect_agent = DataCollectAgent(DocumentReader(self.mongoClient["Auto_Finance_poc"]))
         self.credit_agent = CreditRatingAgent()
         self.compliance_agent = ComplianceAgent()
-        self.fraud_agent = FraudDetectionAgent(llm)
+        self.fraud_agent = FraudDetectionAgent(llm, self.mongoClient)
         self.decision_agent = DecisionMakingAgent(llm)
         self.structuring_agent = LoanStructuringAgent(llm)
         self.redis_client = Redis.from_url(os.environ["REDIS_URL"])
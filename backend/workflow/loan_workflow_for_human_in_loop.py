@@ -1,7 +1,7 @@
 import sys
 import os
-import redis
-from redis import Redis
+import threading
+from functools import cached_property, lru_cache
 # 将项目根目录添加到 Python 搜索路径
 from utils.path_utils import PROJECT_ROOT
 if str(PROJECT_ROOT) not in sys.path:
@@ -14,76 +14,151 @@ from agents.data_review_agents import (
     CreditRatingAgent, ComplianceAgent, FraudDetectionAgent
 )
 from agents.decision_making_agent import DecisionMakingAgent
-from agents.loan_structuring_agents import LoanStructuringAgent, LoanContractGenerater, LoanComplianceChecker, ContractTempAndContentModifier
+from agents.loan_structuring_agents import LoanStructuringAgent, LoanContractGenerater, LoanComplianceChecker, ContractTempAndContentModifier, contract_template_store
 from langgraph.types import interrupt
 from langgraph.checkpoint.redis import RedisSaver
-from redisvl.index import SearchIndex
 from langchain_community.embeddings import DashScopeEmbeddings
 from langchain_redis import RedisConfig, RedisVectorStore
 from config.load_key import load_key
+from config.app_settings import get_settings
+from utils.document_store import DocumentReader
 from langchain_core.runnables.config import RunnableConfig 
 
+# 设置Redis环境变量
+os.environ.setdefault("REDIS_URL", get_settings().redis_url)
+
+
+# ======================
+#  多个工作流实例共用的资源（第一次使用时创建）
+# ======================
+@lru_cache(maxsize=1)
+def get_checkpointer() -> RedisSaver:
+    """Redis检查点存储"""
+    # 为三类检查点索引分别设置过期时间（均为1天，86400秒）
+    ttl_config = {
+        "checkpoints": 86400,
+        "checkpoint_blobs": 86400,
+        "checkpoint_writes": 86400
+    }
+    with RedisSaver.from_conn_string(os.environ["REDIS_URL"], ttl=ttl_config) as redis_saver:
+        return redis_saver
+
+
+@lru_cache(maxsize=1)
+def get_regulation_vector_store() -> RedisVectorStore:
+    """汽车贷款管理办法的向量数据库（合规检查使用）"""
+    # 向量化模型初始化
+    embedding_model = DashScopeEmbeddings(
+        model="text-embedding-v1",
+        dashscope_api_key=load_key("DASHSCOPE_API_KEY")
+    )
+    config = RedisConfig(
+        index_name="auto-rag",
+        redis_url=os.environ.get('REDIS_URL')
+    )
+    return RedisVectorStore(embedding_model, config=config)
+
+
+_workflow_cache = {}
+_workflow_cache_lock = threading.Lock()
+
+
+def get_loan_workflow(llm: BaseChatModel, mongoClient) -> "LoanWorkflow":
+    """取得工作流实例（同一个LLM和MongoDB客户端只构建一次）"""
+    key = (id(llm), id(mongoClient))
+    with _workflow_cache_lock:
+        workflow = _workflow_cache.get(key)
+        if workflow is None:
+            workflow = LoanWorkflow(llm, mongoClient)
+            _workflow_cache[key] = workflow
+        return workflow
+
+
 class LoanWorkflow:
 
-    def __init__(self, llm: BaseChatModel, mongoClient):
-        """ 初始化Agent"""
-        # 设置Redis环境变量
-        os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
-        # 为三类检查点索引分别设置过期时间（均为1天，86400秒）
-        ttl_config = {
-            "checkpoints": 86400,
-            "checkpoint_blobs": 86400,
-            "checkpoint_writes": 86400
-        }
-        # 初始化Redis检查点存储
-        with RedisSaver.from_conn_string(os.environ["REDIS_URL"], ttl=ttl_config) as redis_saver:
-                self.checkpointer = redis_saver
-
-        # redis client初始化
-        self.redis_client = Redis.from_url(os.environ["REDIS_URL"])
-        # 向量化模型初始化
-        embedding_model = DashScopeEmbeddings(
-            model="text-embedding-v1",
-            dashscope_api_key=load_key("DASHSCOPE_API_KEY")
-        )
-        config = RedisConfig(
-            index_name="auto-rag",
-            redis_url=os.environ.get('REDIS_URL')
-        )
-        # 向量数据库初始化
-        self.redis_vector_store = RedisVectorStore(embedding_model, config=config)
+    def __init__(self, llm: BaseChatModel, mongoClient, checkpointer=None):
+        """
+        初始化工作流
+        Agent和向量数据库、OCR等较重的组件在对应节点第一次执行时才创建，构建工作流本身不调用LLM和向量化模型
+
+        参数:
+            checkpointer: 检查点存储，默认使用共用的Redis检查点存储
+        """
+        self.llm = llm
         self.mongoClient = mongoClient
-        self.data_collect_agent = DataCollectAgent()
-        self.credit_agent = CreditRatingAgent()
-        self.compliance_agent = ComplianceAgent(self.redis_vector_store, llm)
-        self.fraud_agent = FraudDetectionAgent(llm, self.mongoClient)
-        self.decision_agent = DecisionMakingAgent(llm)
-        self.structuring_agent = LoanStructuringAgent(llm)
-        self.contract_generater_agent = LoanContractGenerater(llm)
-        self.contract_compliance_agent = LoanComplianceChecker(llm)
-        self.contract_modify_agent = ContractTempAndContentModifier(llm)
+        self.checkpointer = checkpointer if checkpointer is not None else get_checkpointer()
         # 配置最大循环次数
         self.max_dialogue_loops = 5
         # 构建工作流图
         self.graph = self._build_graph()
-    
+
+    # ---------- Agent（第一次使用时创建） ----------
+    @cached_property
+    def data_collect_agent(self) -> DataCollectAgent:
+        return DataCollectAgent(DocumentReader(self.mongoClient["Auto_Finance_poc"]))
+
+    @cached_property
+    def credit_agent(self) -> CreditRatingAgent:
+        return CreditRatingAgent()
+
+    @cached_property
+    def compliance_agent(self) -> ComplianceAgent:
+        return ComplianceAgent(get_regulation_vector_store(), self.llm)
+
+    @cached_property
+    def fraud_agent(self) -> FraudDetectionAgent:
+        return FraudDetectionAgent(self.llm, self.mongoClient)
+
+    @cached_property
+    def decision_agent(self) -> DecisionMakingAgent:
+        return DecisionMakingAgent(self.llm)
+
+    @cached_property
+    def structuring_agent(self) -> LoanStructuringAgent:
+        return LoanStructuringAgent(self.llm)
+
+    @cached_property
+    def contract_generater_agent(self) -> LoanContractGenerater:
+        return LoanContractGenerater(self.llm)
+
+    @cached_property
+    def contract_compliance_agent(self) -> LoanComplianceChecker:
+        return LoanComplianceChecker(self.llm)
+
+    @cached_property
+    def contract_modify_agent(self) -> ContractTempAndContentModifier:
+        return ContractTempAndContentModifier(self.llm)
+
+    def _lazy_node(self, agent_name: str):
+        """节点执行时才取得Agent（并行节点可能同时触发，创建过程加锁）"""
+        lock = threading.Lock()
+
+        def node(state: LoanApplicationState):
+            if agent_name not in self.__dict__:
+                with lock:
+                    getattr(self, agent_name)
+            return getattr(self, agent_name).process(state)
+        node.__name__ = agent_name
+        return node
+
     def _build_graph(self) -> StateGraph:
         graph = StateGraph(LoanApplicationState)
         
         # 添加节点
-        graph.add_node("data_collect", self.data_collect_agent.process)
+        graph.add_node("data_collect", self._lazy_node("data_collect_agent"))
         graph.add_node("parallel_start", self.parallel_start)
-        graph.add_node("credit_rating", self.credit_agent.process)
-        graph.add_node("fraud_detection", self.fraud_agent.process)
-        graph.add_node("compliance_check", self.compliance_agent.process)
+        graph.add_node("credit_rating", self._lazy_node("credit_agent"))
+        graph.add_node("fraud_detection", self._lazy_node("fraud_agent"))
+        graph.add_node("compliance_check", self._lazy_node("compliance_agent"))
         graph.add_node("wait_for_checks", self.wait_for_checks)
-        graph.add_node("decision_making", self.decision_agent.process)
+        graph.add_node("decision_making", self._lazy_node("decision_agent"))
         graph.add_node("human_review", self.human_review_process)
-        graph.add_node("loan_structuring", self.structuring_agent.process)
-        graph.add_node("contract_generation", self.contract_generater_agent.process)
-        graph.add_node("regulatory_review", self.contract_compliance_agent.process)
-        graph.add_node("contract_modify", self.contract_modify_agent.process)
+        graph.add_node("loan_structuring", self._lazy_node("structuring_agent"))
+        graph.add_node("contract_generation", self._lazy_node("contract_generater_agent"))
+        graph.add_node("regulatory_review", self._lazy_node("contract_compliance_agent"))
+        graph.add_node("contract_modify", self._lazy_node("contract_modify_agent"))
         graph.add_node("contract_completed", self.contract_completed)
+        graph.add_node("contract_failed", self.contract_failed)
         
         # 定义流程
         graph.add_edge(START, "data_collect")
@@ -147,7 +222,7 @@ class LoanWorkflow:
             {
                 "approved": "contract_completed",
                 "rejected": "contract_modify",
-                "fail": END
+                "fail": "contract_failed"
             }
         )
         graph.add_conditional_edges(
@@ -155,17 +230,14 @@ class LoanWorkflow:
             self._check_contract_modify_result,
             {
                 "success": "regulatory_review",
-                "fail": END
+                "fail": "contract_failed"
             }
         )
         graph.add_edge("contract_completed", END)
+        graph.add_edge("contract_failed", END)
                 
-        # 编译图
+        # 编译图（流程图的导出见 workflow/export_graph.py）
         auto_finance_app = graph.compile(checkpointer=self.checkpointer)
-        # 生成流程图
-        graph_png = auto_finance_app.get_graph().draw_mermaid_png()
-        with open("Auto_Finance_POC.png", "wb") as f:
-            f.write(graph_png)
 
         return auto_finance_app
 
@@ -286,9 +358,29 @@ class LoanWorkflow:
         else:
             raise ValueError(f"未知的审核响应类型: {human_status}")
         
+    def _release_contract_template(self, state: LoanApplicationState):
+        """合同流程结束后删除申请的模板引用，并清理不再被引用的模板版本"""
+        application_id = state.get("raw_data", {}).get("application_id")
+        if not application_id:
+            return
+        try:
+            contract_template_store.release(str(application_id))
+            removed_count = contract_template_store.collect_garbage()
+            print(f"释放申请{application_id}的合同模板引用，清理未引用的模板版本: {removed_count}个")
+        except OSError as e:
+            # 清理失败不影响合同流程的结果
+            print(f"释放合同模板引用失败: {e}")
+
+    def contract_failed(self, state: LoanApplicationState) -> dict:
+        """合同审核或修改失败，流程结束"""
+        self._release_contract_template(state)
+        return {}
+
     def contract_completed(self, state: LoanApplicationState) -> dict:
         """贷款合同生成完了后，数据库保存更新：：："""
         print("进入款合同生成完了，数据库保存更新阶段:::")
+        # 合同已定稿（PDF已生成），之后不再使用该申请的模板版本
+        self._release_contract_template(state)
         
         # 返回需要更新的数据
         return {
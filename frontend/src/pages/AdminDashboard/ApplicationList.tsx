@@ -4,6 +4,7 @@ import { useNavigate } from 'react-router-dom';
 import { useTranslation } from 'react-i18next';
 import styles from './ApplicationList.module.css';
 import { getAllLoanApplications } from '../../services/adminService.ts';
+import { getNextCursor } from '../../services/api.ts';
 import { LoanApplicationList } from '../../types/loan.ts';
 
 const AdminDashboard: React.FC = () => {
@@ -12,14 +13,18 @@ const AdminDashboard: React.FC = () => {
   const [applications, setApplications] = useState<LoanApplicationList[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
+  // 下一页游标（没有下一页时为null）
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
 
-  // 页面初始化时获取所有贷款申请
+  // 页面初始化时获取第一页贷款申请
   useEffect(() => {
     const fetchApplications = async () => {
       try {
         setLoading(true);
         const response = await getAllLoanApplications();
         setApplications(response.data);
+        setNextCursor(getNextCursor(response));
         setError(null);
       } catch (err) {
         console.error('Failed to fetch loan applications:', err);
@@ -32,6 +37,22 @@ const AdminDashboard: React.FC = () => {
     fetchApplications();
   }, [t]);
 
+  // 按游标加载下一页，追加到列表末尾
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const response = await getAllLoanApplications(nextCursor);
+      setApplications(prev => [...prev, ...response.data]);
+      setNextCursor(getNextCursor(response));
+    } catch (err) {
+      console.error('Failed to fetch more loan applications:', err);
+      setError(t('adminDashboard.fetchError'));
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // 查看详情
   const handleViewDetails = (id: string) => {
     navigate(`/admin-dashboard/details/${id}`);
@@ -112,6 +133,16 @@ const AdminDashboard: React.FC = () => {
           </tbody>
         </table>
       </div>
+
+      {nextCursor && (
+        <button
+          className={styles.detailsButton}
+          onClick={handleLoadMore}
+          disabled={loadingMore}
+        >
+          {loadingMore ? t('loading') : t('adminDashboard.loadMore', 'Load more')}
+        </button>
+      )}
     </div>
   );
 };
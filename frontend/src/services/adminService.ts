@@ -1,4 +1,4 @@
-import axios from './api';
+import axios, { PAGE_SIZE } from './api';
 import { Customer, StatisticData, RegionData } from '../types/admin.ts';
 import { LoanApplication } from '../types/loan.ts';
 
@@ -56,9 +56,12 @@ export const adminChatQuery = (message: string) => {
 };
 
 
-// 获取所有贷款申请（管理员）
-export const getAllLoanApplications = () => {
-  return axios.get('/admin/loan-applications', { timeout: 10000 });
+// 分页获取贷款申请（管理员，按更新时间倒序；cursor为上一页响应头X-Next-Cursor的值）
+export const getAllLoanApplications = (cursor?: string | null, limit: number = PAGE_SIZE) => {
+  return axios.get('/admin/loan-applications', {
+    params: { limit, ...(cursor ? { cursor } : {}) },
+    timeout: 10000
+  });
 };
 
 // 获取单个贷款申请详情（管理员）
@@ -1,4 +1,4 @@
-import axios from 'axios';
+import axios, { AxiosResponse } from 'axios';
 
 const api = axios.create({
   baseURL: '/api',
@@ -29,4 +29,11 @@ api.interceptors.response.use(
   }
 );
 
+// 列表接口的分页：每页条数，下一页游标通过响应头 X-Next-Cursor 返回（没有下一页时不返回）
+export const PAGE_SIZE = 50;
+
+export const getNextCursor = (response: AxiosResponse): string | null => {
+  return response.headers['x-next-cursor'] ?? null;
+};
+
 export default api;
\ No newline at end of file
@@ -1,5 +1,5 @@
 // src/services/loanService.ts
-import axios from './api.ts';
+import axios, { PAGE_SIZE, getNextCursor } from './api.ts';
 import { LoanApplication } from '../types/loan.ts';
 
 // 提交贷款申请
@@ -13,12 +13,28 @@ export const saveDraft = (data: Omit<LoanApplication, '_id' | 'createdAt' | 'upd
   return axios.post('/loan-application', { ...data, status: 'Draft'});
 };
 
+// 获取当前用户的贷款申请（按响应头X-Next-Cursor逐页加载全部）
+export const getMyLoanApplications = async () => {
+  const applications: LoanApplication[] = [];
+  let cursor: string | null = null;
+  let response;
+  do {
+    response = await axios.get('/loan-application/my', {
+      params: { limit: PAGE_SIZE, ...(cursor ? { cursor } : {}) },
+      timeout: 5000
+    });
+    applications.push(...response.data);
+    cursor = getNextCursor(response);
+  } while (cursor);
+  return { ...response, data: applications };
+};
+
 // 获取贷款申请
 export const getLoanApplication = (id?: string) => {
   // return id ? axios.get(`/loan-application/${id}`) : axios.get('/loan-application/my');
   return id 
     ? axios.get(`/loan-application/${id}`, { timeout: 5000 }) 
-    : axios.get('/loan-application/my', { timeout: 5000 });
+    : getMyLoanApplications();
 };
 
 // 获取AI建议